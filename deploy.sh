@@ -31,18 +31,42 @@ python manage.py collectstatic --noinput
 
 # 4. Criar arquivo do Gunicorn
 echo -e "${GREEN}Configurando Gunicorn...${NC}"
-cat > gunicorn_config.py << EOF
+cat > gunicorn_config.py << 'EOF'
 bind = "0.0.0.0:8181"
 workers = 3
 timeout = 120
 accesslog = "logs/access.log"
 errorlog = "logs/error.log"
+
+# Carrega a aplicação no processo mestre antes do fork: os workers herdam
+# Django, ReportLab, fontes e logo já inicializados (copy-on-write)
+preload_app = True
+
+
+def on_starting(server):
+    """Aquece a pilha de renderização no mestre, antes de criar os workers"""
+    import gc
+    from plate_app.utils import resources
+
+    resources.warm_up()
+    # Objetos criados até aqui não são mais visitados pelo coletor de lixo,
+    # evitando que ele toque (e copie) as páginas compartilhadas nos workers
+    gc.freeze()
 EOF
 
 # 5. Criar diretório para logs
 mkdir -p logs
 
+# Métricas por processo (PLATE_METRICS_DIR): recomeçam do zero a cada implantação
+rm -rf metrics && mkdir -p metrics
+
+# Reservas do controle de admissão (PLATE_RENDER_ADMISSION_FILE) deixadas pelos processos antigos
+rm -f render_admission.json
+
 # 6. Criar serviço systemd para o Gunicorn
+# Para servir pelo caminho assíncrono (views de plate_app/async_views.py), troque
+# "plate_generator.wsgi:application" em ExecStart por
+# "-k uvicorn.workers.UvicornWorker plate_generator.asgi:application"
 echo -e "${GREEN}Criando serviço systemd para o Gunicorn...${NC}"
 cat > plate_generator.service << EOF
 [Unit]
@@ -60,13 +84,52 @@ Restart=on-failure
 WantedBy=multi-user.target
 EOF
 
+# 6.1 Criar serviço systemd para os workers da fila de geração de PDFs.
+# A renderização (ReportLab) segura o GIL: cada processo usa um núcleo, então o
+# serviço é um modelo (plate_generator_worker@N) iniciado WORKER_PROCESSES vezes
+# (padrão: um por núcleo); as threads de cada processo (PLATE_WORKER_CONCURRENCY)
+# sobrepõem o envio dos emails. O orçamento de renderização vale para todos.
+WORKER_PROCESSES=${WORKER_PROCESSES:-$(nproc)}
+cat > plate_generator_worker@.service << EOF
+[Unit]
+Description=Worker %i da fila de geração de PDFs do Plate Generator
+After=network.target
+
+[Service]
+User=${USER}
+Group=${USER}
+WorkingDirectory=$(pwd)
+ExecStart=$(pwd)/venv/bin/python manage.py run_plate_worker
+Restart=on-failure
+KillSignal=SIGTERM
+TimeoutStopSec=180
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # 7. Instalar e ativar o serviço systemd
 echo -e "${GREEN}Instalando e ativando o serviço...${NC}"
 sudo mv plate_generator.service /etc/systemd/system/
+sudo mv plate_generator_worker@.service /etc/systemd/system/
 sudo systemctl daemon-reload
 sudo systemctl enable plate_generator.service
 sudo systemctl start plate_generator.service
 
+# Aguarda o aquecimento (preload_app + on_starting em gunicorn_config.py)
+for i in $(seq 1 30); do
+    if curl -fsS http://127.0.0.1:8181/ready > /dev/null 2>&1; then
+        echo -e "${GREEN}Aplicação pronta.${NC}"
+        break
+    fi
+    sleep 1
+done
+
+for i in $(seq 1 "$WORKER_PROCESSES"); do
+    sudo systemctl enable "plate_generator_worker@$i.service"
+    sudo systemctl start "plate_generator_worker@$i.service"
+done
+
 # 8. Configurar Nginx (você deve ter o nginx instalado)
 echo -e "${GREEN}Configurando Nginx...${NC}"
 cat > plate_generator_nginx << EOF
@@ -84,6 +147,22 @@ server {
         root $(pwd);
     }
 
+    # Downloads de PDF enviados pelo nginx a partir do Django (X-Accel-Redirect).
+    # Ative com PLATE_PDF_X_ACCEL_REDIRECT = '/protected-media/' no settings.py
+    location /protected-media/ {
+        internal;
+        alias $(pwd)/media/;
+        # A ETag é a da aplicação (chave de renderização, usada nos 304 e no
+        # If-Range), e não a gerada pelo nginx a partir do mtime do arquivo
+        etag off;
+        add_header ETag \$upstream_http_etag always;
+    }
+
+    # Métricas apenas para o coletor interno, direto no gunicorn (PLATE_METRICS_TOKENS)
+    location = /metrics {
+        deny all;
+    }
+
     location / {
         include proxy_params;
         proxy_pass http://localhost:8181;
@@ -104,4 +183,5 @@ echo -e "${GREEN}Implantação concluída com sucesso!${NC}"
 echo -e "${YELLOW}A aplicação está sendo executada em: http://92.112.184.107:8181/${NC}"
 
 # Exibe status do serviço
-sudo systemctl status plate_generator.service
\ No newline at end of file
+sudo systemctl status plate_generator.service
+sudo systemctl status 'plate_generator_worker@*.service'
\ No newline at end of file
@@ -2,4 +2,19 @@ bind = "127.0.0.1:8001"
 workers = 3
 timeout = 120
 accesslog = "logs/access.log"
-errorlog = "logs/error.log"
\ No newline at end of file
+errorlog = "logs/error.log"
+
+# Carrega a aplicação no processo mestre antes do fork: os workers herdam
+# Django, ReportLab, fontes e logo já inicializados (copy-on-write)
+preload_app = True
+
+
+def on_starting(server):
+    """Aquece a pilha de renderização no mestre, antes de criar os workers"""
+    import gc
+    from plate_app.utils import resources
+
+    resources.warm_up()
+    # Objetos criados até aqui não são mais visitados pelo coletor de lixo,
+    # evitando que ele toque (e copie) as páginas compartilhadas nos workers
+    gc.freeze()
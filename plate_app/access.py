@@ -0,0 +1,63 @@
+"""
+Controle de acesso das rotas usadas por clientes automatizados
+
+As APIs exigem um token no cabeçalho "Authorization: Token <token>" (ou
+"Bearer <token>"), conferido contra PLATE_API_TOKENS; o endpoint /metrics,
+da mesma forma, contra PLATE_METRICS_TOKENS. Sem tokens configurados, todas
+as requisições são recusadas.
+"""
+import hmac
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+
+def request_token(request):
+    """Token enviado no cabeçalho Authorization, ou None"""
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    token = token.strip()
+    if scheme.lower() not in ('token', 'bearer') or not token:
+        return None
+    return token
+
+
+def token_matches(token, accepted):
+    """Compara o token com cada um dos aceitos em tempo constante"""
+    if not token:
+        return False
+    return any(hmac.compare_digest(token.encode('utf-8'), value.encode('utf-8')) for value in accepted if value)
+
+
+def has_api_token(request):
+    """Indica se a requisição traz um token de PLATE_API_TOKENS"""
+    return token_matches(request_token(request), getattr(settings, 'PLATE_API_TOKENS', ()))
+
+
+def api_token_required(view):
+    """Responde 401 (JSON) às requisições sem um token de PLATE_API_TOKENS"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not has_api_token(request):
+            response = JsonResponse(
+                {'erro': "Autenticação necessária: envie o token da API no cabeçalho Authorization."},
+                status=401,
+            )
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def metrics_token_required(view):
+    """Responde 401 às requisições sem um token de PLATE_METRICS_TOKENS (ex.: bearer_token do Prometheus)"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not token_matches(request_token(request), getattr(settings, 'PLATE_METRICS_TOKENS', ())):
+            response = HttpResponse(
+                "Autenticação necessária.\n", status=401, content_type='text/plain; charset=utf-8'
+            )
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -1,16 +1,99 @@
-from django.contrib import admin
-from .models import PlateProject
+from django.contrib import admin, messages
+from django.db.models import OuterRef, Subquery
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import PlateProject, PlateJob
+from .jobs import PlateJobQueue
+from .services import PlateService
+
+
+class PlateJobInline(admin.TabularInline):
+    """Tarefas do projeto (progresso e falhas das ações em lote)"""
+    model = PlateJob
+    fields = ('kind', 'status', 'attempts', 'max_attempts', 'last_error', 'created_at', 'finished_at')
+    readonly_fields = fields
+    ordering = ('-created_at',)
+    extra = 0
+    max_num = 0
+    can_delete = False
+    show_change_link = True
+
 
 @admin.register(PlateProject)
 class PlateProjectAdmin(admin.ModelAdmin):
-    list_display = ('empresa', 'projeto', 'total_amostras', 'email', 'created_at')
-    list_filter = ('empresa', 'created_at')
-    search_fields = ('empresa', 'projeto', 'email')
-    readonly_fields = ('created_at',)
+    list_display = ('empresa', 'projeto', 'cod_envio', 'total_amostras', 'email', 'created_at', 'last_job')
+    list_filter = ('empresa', 'formato_placa', 'layout_pagina', 'created_at')
+    search_fields = ('empresa', 'projeto', 'email', 'cod_envio')
+    readonly_fields = ('cod_envio', 'created_at')
     ordering = ('-created_at',)
-    
+    inlines = (PlateJobInline,)
+    actions = ('regenerate_pdfs', 'resend_emails')
+
     def get_readonly_fields(self, request, obj=None):
         """Torna os campos do projeto imutáveis após a criação para preservar integridade"""
         if obj:  # Editando um objeto existente
-            return self.readonly_fields + ('empresa', 'projeto', 'total_amostras')
-        return self.readonly_fields
\ No newline at end of file
+            return self.readonly_fields + ('empresa', 'projeto', 'total_amostras', 'formato_placa', 'layout_pagina', 'pocos_controle')
+        return self.readonly_fields
+
+    def get_queryset(self, request):
+        # Situação da tarefa mais recente de cada projeto na mesma consulta da listagem
+        latest = PlateJob.objects.filter(project=OuterRef('pk')).order_by('-created_at', '-id')
+        return super().get_queryset(request).annotate(
+            last_job_kind=Subquery(latest.values('kind')[:1]),
+            last_job_status=Subquery(latest.values('status')[:1]),
+        )
+
+    @admin.display(description="Última tarefa")
+    def last_job(self, obj):
+        if not getattr(obj, 'last_job_status', None):
+            return "-"
+        kinds, statuses = dict(PlateJob.KIND_CHOICES), dict(PlateJob.STATUS_CHOICES)
+        return f"{kinds.get(obj.last_job_kind, obj.last_job_kind)}: {statuses.get(obj.last_job_status, obj.last_job_status)}"
+
+    def enqueue(self, request, projects, kind, skipped_message=None):
+        """
+        Registra uma tarefa do tipo para cada projeto (exceto os que já têm uma
+        na fila) e informa ao operador onde acompanhar o andamento
+
+        O trabalho é feito pelos workers (run_plate_worker), fora da requisição
+        do admin, com o paralelismo de PLATE_WORKER_CONCURRENCY.
+        """
+        active = PlateJobQueue.active_project_ids(projects, kind)
+        jobs = PlateJobQueue.enqueue_many([project for project in projects if project.id not in active], kind)
+
+        if jobs:
+            url = reverse('admin:plate_app_platejob_changelist') + '?id__in=' + ','.join(str(job.id) for job in jobs)
+            self.message_user(request, format_html(
+                '{} tarefa(s) criada(s). <a href="{}">Acompanhar o andamento</a>', len(jobs), url
+            ), messages.SUCCESS)
+        else:
+            self.message_user(request, "Nenhuma tarefa criada.", messages.WARNING)
+        if active:
+            self.message_user(request, f"{len(active)} projeto(s) ignorado(s): já há uma tarefa na fila.", messages.INFO)
+        if skipped_message:
+            self.message_user(request, skipped_message, messages.INFO)
+
+    @admin.action(description="Regerar PDFs dos projetos selecionados")
+    def regenerate_pdfs(self, request, queryset):
+        projects = list(queryset)
+        current = [project for project in projects if PlateService.pdf_is_current(project)]
+        outdated = [project for project in projects if project not in current]
+        self.enqueue(
+            request, outdated, PlateJob.KIND_RENDER,
+            f"{len(current)} projeto(s) ignorado(s): o PDF já está atualizado." if current else None,
+        )
+
+    @admin.action(description="Reenviar PDFs por email")
+    def resend_emails(self, request, queryset):
+        # O PDF é reaproveitado do cache quando já está atualizado
+        self.enqueue(request, list(queryset), PlateJob.KIND_RENDER_SEND)
+
+
+@admin.register(PlateJob)
+class PlateJobAdmin(admin.ModelAdmin):
+    list_display = ('project', 'kind', 'status', 'attempts', 'max_attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('project__empresa', 'project__projeto', 'project__email')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'finished_at', 'worker', 'last_error')
+    list_select_related = ('project',)
+    ordering = ('-created_at',)
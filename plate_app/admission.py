@@ -0,0 +1,196 @@
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import metrics
+from .models import PlateJob
+from .utils.layout import PlateLayout
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre novas tentativas de quem aguarda o orçamento (ver acquire)
+WAIT_POLL_INTERVAL = 0.5
+
+
+class RenderBusy(Exception):
+    """Orçamento de renderização esgotado; tentar de novo depois de ``retry_after`` segundos"""
+
+    def __init__(self, units, in_use, budget, retry_after):
+        self.units = units
+        self.in_use = in_use
+        self.budget = budget
+        self.retry_after = retry_after
+        super().__init__(
+            f"Orçamento de renderização esgotado: {in_use} de {budget} placas em uso, "
+            f"pedido de {units}; tente novamente em {retry_after} s"
+        )
+
+
+def render_units(project_data):
+    """Custo de renderização de um projeto, em placas"""
+    return PlateLayout.for_project(project_data).plates_needed(project_data['total_amostras'])
+
+
+def is_small(units):
+    """Projetos pequenos podem usar a reserva do orçamento e nunca são recusados pela fila"""
+    return units <= getattr(settings, 'PLATE_RENDER_SMALL_PLATES', 12)
+
+
+def busy_retry_after():
+    return getattr(settings, 'PLATE_BUSY_RETRY_AFTER', 15)
+
+
+class RenderAdmission:
+    """Controle de admissão das renderizações de PDF.
+
+    Um orçamento global (PLATE_RENDER_BUDGET, em placas) limita o que é
+    renderizado ao mesmo tempo por todos os processos da máquina: workers do
+    gunicorn e run_plate_worker registram cada renderização em um arquivo
+    compartilhado, protegido por flock. Quem não cabe no orçamento recebe
+    RenderBusy na hora, em vez de ocupar um worker esperando.
+
+    Projetos grandes não usam as últimas PLATE_RENDER_SMALL_RESERVE placas
+    do orçamento, de modo que projetos pequenos sempre encontram espaço; um
+    projeto maior que o limite conta como o limite inteiro e roda sozinho.
+    """
+
+    @staticmethod
+    def limit_for(units, budget):
+        """Parte do orçamento que o pedido pode ocupar"""
+        if is_small(units):
+            return budget
+        return max(1, budget - getattr(settings, 'PLATE_RENDER_SMALL_RESERVE', 50))
+
+    @staticmethod
+    @contextmanager
+    def ledger():
+        """
+        Renderizações em andamento em todos os processos, com o arquivo bloqueado
+
+        Yields:
+            dict token -> {'pid', 'units', 'since'}; alterações são gravadas
+            ao final do bloco
+        """
+        path = getattr(
+            settings, 'PLATE_RENDER_ADMISSION_FILE', os.path.join(settings.BASE_DIR, 'render_admission.json')
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with open(fd, 'r+', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    entries = json.loads(f.read() or '{}')
+                except ValueError:
+                    entries = {}
+                # Processos encerrados sem liberar (ex.: worker morto pelo timeout do gunicorn)
+                entries = {
+                    token: entry for token, entry in entries.items() if metrics.pid_alive(entry['pid'])
+                }
+                yield entries
+                f.seek(0)
+                f.truncate()
+                json.dump(entries, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def acquire(units, wait=0):
+        """
+        Reserva ``units`` placas do orçamento
+
+        Args:
+            units: Placas da renderização (render_units)
+            wait: Segundos aguardando espaço no orçamento antes de desistir;
+                0 (padrão, requisições e fila) desiste na hora, None aguarda
+                sem limite (processamentos em lote, como generate_plates)
+
+        Returns:
+            Token a ser passado a release (None se o controle estiver desativado)
+
+        Raises:
+            RenderBusy: se o pedido não coube no orçamento dentro da espera
+        """
+        budget = getattr(settings, 'PLATE_RENDER_BUDGET', None)
+        if not budget:
+            return None
+        limit = RenderAdmission.limit_for(units, budget)
+        charged = min(units, limit)
+        token = uuid.uuid4().hex
+        deadline = None if wait is None else time.monotonic() + wait
+        while True:
+            with RenderAdmission.ledger() as entries:
+                in_use = sum(entry['units'] for entry in entries.values())
+                if in_use + charged <= limit:
+                    entries[token] = {'pid': os.getpid(), 'units': charged, 'since': time.time()}
+                    return token
+            if deadline is not None and time.monotonic() >= deadline:
+                metrics.admission_rejected('render', is_small(units))
+                raise RenderBusy(units, in_use, budget, busy_retry_after())
+            time.sleep(WAIT_POLL_INTERVAL)
+
+    @staticmethod
+    def release(token):
+        if token is None:
+            return
+        with RenderAdmission.ledger() as entries:
+            entries.pop(token, None)
+
+    @staticmethod
+    @contextmanager
+    def admit(units, wait=0):
+        """Executa o bloco com ``units`` placas reservadas (ver acquire)"""
+        token = RenderAdmission.acquire(units, wait)
+        try:
+            yield
+        finally:
+            RenderAdmission.release(token)
+
+    @staticmethod
+    def queued_units():
+        """Placas das tarefas na fila ou em execução"""
+        projects = (
+            PlateJob.objects
+            .filter(status__in=(PlateJob.STATUS_PENDING, PlateJob.STATUS_RUNNING))
+            .values('project__total_amostras', 'project__formato_placa', 'project__pocos_controle')
+        )
+        return sum(
+            render_units({
+                'total_amostras': project['project__total_amostras'],
+                'formato_placa': project['project__formato_placa'],
+                'pocos_controle': project['project__pocos_controle'],
+            })
+            for project in projects
+        )
+
+    @staticmethod
+    def check_queue(project_data):
+        """
+        Admissão de um novo envio pela fila de tarefas
+
+        Envios grandes são recusados quando a fila já soma PLATE_QUEUE_BUDGET
+        placas; envios pequenos são sempre aceitos.
+
+        Raises:
+            RenderBusy: se o envio deve ser tentado mais tarde
+        """
+        RenderAdmission.check_queue_units(render_units(project_data))
+
+    @staticmethod
+    def check_queue_units(units):
+        """check_queue para ``units`` placas (ex.: a soma dos projetos grandes de um lote)"""
+        budget = getattr(settings, 'PLATE_QUEUE_BUDGET', None)
+        if not budget or is_small(units):
+            return
+        queued = RenderAdmission.queued_units()
+        if queued + min(units, budget) > budget:
+            metrics.admission_rejected('queue', False)
+            logger.info("Envio de %s placas recusado: %s placas na fila (limite %s)", units, queued, budget)
+            raise RenderBusy(units, queued, budget, busy_retry_after())
@@ -0,0 +1,354 @@
+"""
+API JSON para clientes automatizados
+
+A criação de projetos (um ou vários por requisição) apenas registra as
+tarefas de geração e responde 202 com a URL de situação da tarefa, sem
+esperar a renderização. As consultas respondem com ETag; um cliente que
+repete a consulta com If-None-Match recebe 304 sem corpo enquanto nada mudou.
+
+Todas as rotas exigem o token da API no cabeçalho Authorization (ver access);
+as respostas incluem o email de cada projeto.
+
+Rotas (prefixo api/):
+    POST projetos/                        cria um projeto (objeto JSON) ou vários (lista)
+    GET  projetos/                        lista paginada (?empresa=, ?projeto=, ?email=, ?page=, ?page_size=)
+    GET  projetos/<cod_envio>/            projeto, última tarefa e URLs
+    GET  projetos/<cod_envio>/pdf/        PDF; 202 com a tarefa enquanto ainda não foi gerado
+    GET  projetos/<cod_envio>/manifesto/  manifesto (?formato=csv|json)
+    GET  tarefas/<id>/                    situação da tarefa
+"""
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.db import IntegrityError
+from django.db.models import OuterRef, Subquery
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_safe
+
+from . import metrics
+from .access import api_token_required
+from .admission import RenderAdmission, RenderBusy, busy_retry_after
+from .bulk import COLUMNS, OPTIONAL_COLUMNS, PlateBulkImporter
+from .downloads import serve_pdf
+from .forms import PlateProjectForm
+from .jobs import PlateJobQueue
+from .manifest import FORMATS as MANIFEST_FORMATS
+from .models import PlateJob, PlateProject
+from .render_cache import PlateRenderCache
+from .services import PlateService
+from .utils.layout import PlateLayout
+from .views import busy_json_response as busy_response, job_status_data, manifest_response
+
+FIELDS = COLUMNS + OPTIONAL_COLUMNS
+
+
+def error_response(message, status=400, **extra):
+    return JsonResponse({'erro': message, **extra}, status=status)
+
+
+def make_etag(*parts):
+    digest = hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def json_response(request, build, etag=None):
+    """
+    Resposta JSON com ETag e GET condicional
+
+    Com ``etag`` calculada de antemão, ``build`` (que monta o corpo) só é
+    chamada quando o cliente não tem a versão atual; sem ela, a ETag é o hash
+    do corpo e o 304 economiza apenas a transferência.
+    """
+    if etag is not None:
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(build())
+    else:
+        response = JsonResponse(build())
+        etag = make_etag(hashlib.sha256(response.content).hexdigest())
+        response = get_conditional_response(request, etag=etag, response=response)
+    response['ETag'] = etag
+    # O cliente pode guardar a resposta, mas deve revalidá-la a cada consulta
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def with_last_job(queryset):
+    """Anota o id e a última alteração da tarefa mais recente de cada projeto"""
+    latest = PlateJob.objects.filter(project=OuterRef('pk')).order_by('-created_at', '-id')
+    return queryset.annotate(
+        last_job_id=Subquery(latest.values('id')[:1]),
+        last_job_updated=Subquery(latest.values('updated_at')[:1]),
+    )
+
+
+def job_json(request, job):
+    data = job_status_data(job)
+    data['url'] = request.build_absolute_uri(reverse('api_job', args=[job.id]))
+    return data
+
+
+def project_json(request, project, job=None):
+    """Dados do projeto, da última tarefa e URLs da API"""
+    cod_envio = project.get_cod_envio()
+    project_data = PlateService.get_project_data(project)
+
+    def url(name):
+        return request.build_absolute_uri(reverse(name, args=[cod_envio]))
+
+    return {
+        'cod_envio': cod_envio,
+        **project_data,
+        'email': project.email,
+        'total_placas': PlateLayout.for_project(project_data).plates_needed(project.total_amostras),
+        'criado_em': project.created_at.isoformat(),
+        'pdf_gerado': bool(project.pdf_file),
+        'tarefa': job_json(request, job) if job else None,
+        'urls': {
+            'projeto': url('api_project'),
+            'pdf': url('api_project_pdf'),
+            'manifesto': url('api_project_manifest'),
+        },
+    }
+
+
+def project_values(item):
+    """Campos do projeto em um item JSON; listas de poços de controle são aceitas"""
+    values = {field: item[field] for field in FIELDS if item.get(field) is not None}
+    if isinstance(values.get('pocos_controle'), list):
+        values['pocos_controle'] = ', '.join(str(well) for well in values['pocos_controle'])
+    return values
+
+
+@csrf_exempt
+@api_token_required
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def projects_view(request):
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or b'null')
+        except ValueError:
+            return error_response("O corpo da requisição não é um JSON válido.")
+        if isinstance(payload, dict):
+            return create_project(request, payload)
+        if isinstance(payload, list):
+            return create_projects(request, payload)
+        return error_response("Envie um objeto (um projeto) ou uma lista de objetos (vários projetos).")
+    return list_projects(request)
+
+
+def create_project(request, item):
+    """Cria um projeto e registra a tarefa de geração e envio (202, sem esperar o PDF)"""
+    form = PlateProjectForm(data=project_values(item))
+    if not form.is_valid():
+        duplicate = PlateProjectForm.duplicate_message in form.non_field_errors()
+        errors = {field: list(messages) for field, messages in form.errors.items()}
+        return error_response("Dados inválidos.", 409 if duplicate else 400, erros=errors)
+
+    try:
+        # Projetos grandes com a fila cheia recebem "ocupado" em vez de esperar
+        RenderAdmission.check_queue(form.cleaned_data)
+    except RenderBusy as e:
+        return busy_response(e)
+
+    try:
+        with metrics.span('db_save', form.cleaned_data['total_amostras']):
+            project = form.save()
+            job = PlateJobQueue.enqueue(project)
+    except IntegrityError:
+        # Outro envio com a mesma empresa+projeto foi gravado entre a validação e o INSERT
+        return error_response("Dados inválidos.", 409, erros={'__all__': [PlateProjectForm.duplicate_message]})
+
+    response = JsonResponse(project_json(request, project, job), status=202)
+    response['Location'] = request.build_absolute_uri(reverse('api_job', args=[job.id]))
+    return response
+
+
+def create_projects(request, items):
+    """
+    Cria vários projetos de uma vez (mesmas regras do envio em lote por CSV)
+
+    Os PDFs não são renderizados na requisição: todas as tarefas vão para a
+    fila. Se a fila não comporta os projetos grandes do lote, nenhum é criado.
+    Sem nenhum projeto criado, responde 409 quando todos os itens repetem
+    empresa+projeto e 400 quando algum tem outro erro.
+    """
+    max_rows = getattr(settings, 'PLATE_BULK_MAX_ROWS', 500)
+    if not items:
+        return error_response("A lista de projetos está vazia.")
+    if len(items) > max_rows:
+        return error_response(f"O lote excede o limite de {max_rows} projetos.")
+    if not all(isinstance(item, dict) for item in items):
+        return error_response("Cada item da lista deve ser um objeto.")
+
+    # Itens numerados a partir de 1, como as linhas do CSV
+    results, valid = PlateBulkImporter.validate([(number, project_values(item)) for number, item in enumerate(items, 1)])
+    for result in results:
+        result['item'] = result.pop('linha')
+
+    try:
+        PlateBulkImporter.check_queue(valid)
+    except RenderBusy as e:
+        return busy_response(e)
+
+    try:
+        with metrics.span('db_save'):
+            projects = PlateBulkImporter.create(valid)
+            jobs = PlateJobQueue.enqueue_many(projects)
+    except IntegrityError:
+        # Outros envios continuaram gravando os mesmos pares; nenhum projeto do lote foi criado
+        return error_response("Conflito com projetos gravados ao mesmo tempo; nenhum projeto foi criado.", 409)
+    for (result, _), project, job in zip(valid, projects, jobs):
+        result['status'] = 'ok'
+        result['cod_envio'] = project.cod_envio
+        result['url'] = request.build_absolute_uri(reverse('api_project', args=[project.cod_envio]))
+        result['tarefa'] = job_json(request, job)
+
+    if projects:
+        status = 202
+    else:
+        status = 409 if all(result['duplicado'] for result in results) else 400
+    return JsonResponse({
+        'criados': len(projects),
+        'com_erro': len(results) - len(projects),
+        'resultados': results,
+    }, status=status)
+
+
+def page_size_for(request):
+    default = getattr(settings, 'PLATE_API_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'PLATE_API_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.GET.get('page_size') or default)
+    except ValueError:
+        return None
+    return size if 1 <= size <= maximum else None
+
+
+def page_url(request, number):
+    params = request.GET.copy()
+    params['page'] = number
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+def list_projects(request):
+    """Projetos do mais recente ao mais antigo, com a última tarefa de cada um"""
+    page_size = page_size_for(request)
+    if page_size is None:
+        return error_response(
+            f"page_size deve ser um número entre 1 e {getattr(settings, 'PLATE_API_MAX_PAGE_SIZE', 100)}."
+        )
+
+    queryset = PlateProject.objects.order_by('-created_at', '-id')
+    for field in ('empresa', 'projeto', 'email'):
+        if request.GET.get(field):
+            queryset = queryset.filter(**{field: request.GET[field]})
+
+    paginator = Paginator(with_last_job(queryset), page_size)
+    try:
+        page = paginator.page(request.GET.get('page') or 1)
+    except InvalidPage:
+        return error_response("Página inexistente.", 404)
+
+    def build():
+        projects = list(page)
+        jobs = PlateJob.objects.select_related('project').in_bulk(
+            [project.last_job_id for project in projects if project.last_job_id]
+        )
+        return {
+            'total': paginator.count,
+            'pagina': page.number,
+            'paginas': paginator.num_pages,
+            'proxima': page_url(request, page.next_page_number()) if page.has_next() else None,
+            'anterior': page_url(request, page.previous_page_number()) if page.has_previous() else None,
+            'resultados': [project_json(request, project, jobs.get(project.last_job_id)) for project in projects],
+        }
+
+    return json_response(request, build)
+
+
+@api_token_required
+@require_safe
+def project_view(request, cod_envio):
+    project = with_last_job(PlateProject.objects.filter(cod_envio=cod_envio)).first()
+    if not project:
+        return error_response(f"Projeto não encontrado: {cod_envio}", 404)
+
+    # Os dados do projeto não mudam depois de criado; mudam o PDF e a última tarefa
+    etag = make_etag(cod_envio, project.render_key, project.pdf_file.name, project.last_job_id, project.last_job_updated)
+
+    def build():
+        job = PlateJob.objects.select_related('project').filter(id=project.last_job_id).first()
+        return project_json(request, project, job)
+
+    return json_response(request, build, etag)
+
+
+@api_token_required
+@require_safe
+def job_view(request, job_id):
+    """Situação da tarefa; consultas repetidas sem mudança custam uma consulta indexada e um 304"""
+    updated_at = PlateJob.objects.filter(id=job_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return error_response(f"Tarefa não encontrada: {job_id}", 404)
+
+    def build():
+        return job_json(request, PlateJob.objects.select_related('project').get(id=job_id))
+
+    return json_response(request, build, make_etag('tarefa', job_id, updated_at.isoformat()))
+
+
+@api_token_required
+@require_safe
+def project_pdf_view(request, cod_envio):
+    """
+    PDF do projeto (com GET condicional e Range)
+
+    Enquanto o PDF não existe (tarefa na fila, ou removido do cache), responde
+    202 com a tarefa que vai gerá-lo, em vez de renderizar na requisição.
+    """
+    project = PlateProject.objects.filter(cod_envio=cod_envio).first()
+    if not project:
+        return error_response(f"Projeto não encontrado: {cod_envio}", 404)
+
+    if project.pdf_file and os.path.exists(project.pdf_file.path):
+        with metrics.span('download', project.total_amostras, cod_envio=cod_envio) as span:
+            response = serve_pdf(request, project, f"{project.empresa}-{project.projeto}-{cod_envio}.pdf")
+            span['http_status'] = response.status_code
+        return response
+
+    job = PlateJobQueue.active_job(project)
+    if job is None:
+        job = PlateJobQueue.enqueue(project, PlateJob.KIND_RENDER)
+
+    response = JsonResponse({'mensagem': "O PDF ainda está sendo gerado.", 'tarefa': job_json(request, job)}, status=202)
+    response['Location'] = request.build_absolute_uri(reverse('api_job', args=[job.id]))
+    response['Retry-After'] = str(busy_retry_after())
+    return response
+
+
+@api_token_required
+@require_safe
+def project_manifest_view(request, cod_envio):
+    """Manifesto amostra -> placa/poço; a ETag muda junto com os dados do projeto"""
+    project = PlateProject.objects.filter(cod_envio=cod_envio).first()
+    if not project:
+        return error_response(f"Projeto não encontrado: {cod_envio}", 404)
+
+    formato = request.GET.get('formato', 'csv')
+    if formato not in MANIFEST_FORMATS:
+        return error_response(f"Formato inválido: {formato}")
+
+    render_key = PlateRenderCache.key_for(PlateService.get_project_data(project), cod_envio, compact=False)
+    etag = make_etag('manifesto', formato, render_key)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = manifest_response(project, formato)
+    response['ETag'] = etag
+    return response
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class PlateAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'plate_app'
-    verbose_name = 'Gerador de Templates de Placas'
\ No newline at end of file
+    verbose_name = 'Gerador de Templates de Placas'
+
+    def ready(self):
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='plate_app.configure_sqlite')
@@ -0,0 +1,163 @@
+"""
+Versões assíncronas das views de formulário, sucesso e download
+
+Usadas quando a aplicação roda em um servidor ASGI (ver plate_generator/asgi.py
+e PLATE_ASYNC_VIEWS). O acesso ao banco usa o ORM assíncrono do Django e a
+renderização de PDFs roda em um pool de processos limitado, de modo que o
+event loop continua atendendo outras requisições enquanto um PDF é gerado.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError
+from django.shortcuts import render, redirect
+
+from . import metrics
+from .admission import RenderAdmission, RenderBusy, render_units
+from .downloads import serve_pdf
+from .forms import PlateProjectForm, PlateProjectRowForm
+from .jobs import PlateJobQueue
+from .models import PlateProject
+from .render_cache import PlateRenderCache
+from .services import PlateService
+from .utils import resources
+from .views import busy_message, busy_response, pdf_pending_response, remember_job, success_data_for
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    """
+    Pool de processos compartilhado para renderização
+
+    Os processos são iniciados com 'spawn' (e não fork) para não herdar o
+    event loop e as threads do servidor ASGI.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PLATE_ASYNC_RENDER_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=resources.init_process,
+            )
+        return _executor
+
+
+async def render_project(project):
+    """Gera (ou reaproveita do cache) o PDF do projeto sem bloquear o event loop"""
+    project_data = PlateService.get_project_data(project)
+    cod_envio = project.get_cod_envio()
+    render_key = PlateRenderCache.key_for(project_data, cod_envio)
+
+    rendered = PlateRenderCache.lookup(project.pdf_file.storage, render_key) is None
+    if rendered:
+        loop = asyncio.get_running_loop()
+        # Reserva no orçamento global de renderização (RenderBusy se esgotado)
+        token = await sync_to_async(RenderAdmission.acquire, thread_sensitive=False)(render_units(project_data))
+        try:
+            # O processo do pool grava o PDF no storage; só o nome e o tamanho voltam
+            with metrics.in_flight(), metrics.span('pdf_render', project.total_amostras, cod_envio=cod_envio) as span:
+                _, span['bytes'] = await loop.run_in_executor(
+                    get_render_executor(), PlateService.render_to_storage, project_data, cod_envio, render_key
+                )
+        finally:
+            await sync_to_async(RenderAdmission.release, thread_sensitive=False)(token)
+
+    with metrics.span('file_save', project.total_amostras, cod_envio=cod_envio, cache=not rendered):
+        if PlateService.attach_pdf(project, render_key):
+            await project.asave(update_fields=['pdf_file', 'render_key'])
+
+
+async def form_view(request):
+    if request.method == 'POST':
+        # Validação dos campos sem consultas; a duplicidade é verificada com o ORM assíncrono
+        form = PlateProjectRowForm(request.POST)
+        with metrics.span('form_validation') as span:
+            valid = form.is_valid()
+            if valid and await PlateProject.objects.filter(
+                empresa=form.cleaned_data['empresa'], projeto=form.cleaned_data['projeto']
+            ).aexists():
+                form.add_error(None, PlateProjectForm.duplicate_message)
+                valid = False
+            span['valido'] = valid
+
+        if valid:
+            try:
+                # Projetos grandes com a fila cheia recebem "ocupado" em vez de esperar
+                await sync_to_async(RenderAdmission.check_queue)(form.cleaned_data)
+            except RenderBusy as e:
+                messages.warning(request, busy_message(e))
+                response = await sync_to_async(render)(request, 'plate_app/form.html', {'form': form}, status=503)
+                response['Retry-After'] = str(e.retry_after)
+                return response
+            try:
+                with metrics.span('db_save', form.cleaned_data['total_amostras']):
+                    project = form.save(commit=False)
+                    await project.asave()
+                    job = await PlateJobQueue.aenqueue(project)
+            except IntegrityError:
+                # Outro envio com a mesma empresa+projeto foi gravado entre a verificação e o INSERT
+                form.add_error(None, PlateProjectForm.duplicate_message)
+            else:
+                await sync_to_async(request.session.__setitem__)('success_data', success_data_for(project, job))
+                await sync_to_async(remember_job)(request.session, job)
+                return redirect('plate_success')
+
+        messages.error(request, "Por favor, corrija os erros no formulário.")
+    else:
+        form = PlateProjectForm()
+
+    return await sync_to_async(render)(request, 'plate_app/form.html', {'form': form})
+
+
+async def success_view(request):
+    # Recuperar e limpar os dados da sessão
+    success_data = await sync_to_async(request.session.pop)('success_data', {})
+
+    # Se não houver dados de sucesso, redirecionar para o formulário
+    if not success_data:
+        return redirect('plate_form')
+
+    return await sync_to_async(render)(request, 'plate_app/success.html', success_data)
+
+
+async def download_pdf_view(request, cod_envio):
+    """
+    Download do PDF; enquanto a tarefa do projeto não termina, responde 202
+    com a situação dela. Um PDF removido do cache depois de gerado é
+    renderizado agora no pool de processos enquanto a requisição aguarda
+    """
+    project = await PlateProject.objects.filter(cod_envio=cod_envio).afirst()
+    if not project:
+        messages.error(request, f"Não foi possível encontrar o projeto com código: {cod_envio}")
+        return redirect('plate_form')
+
+    try:
+        if not project.pdf_file or not os.path.exists(project.pdf_file.path):
+            job = await sync_to_async(PlateJobQueue.active_job)(project)
+            if job is not None:
+                return pdf_pending_response(request, job)
+            await render_project(project)
+
+        with metrics.span('download', project.total_amostras, cod_envio=cod_envio) as span:
+            response = serve_pdf(request, project, f"{project.empresa}-{project.projeto}-{cod_envio}.pdf")
+            span['http_status'] = response.status_code
+        return response
+
+    except RenderBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logger.exception("Erro ao fazer download do PDF %s: %s", cod_envio, e)
+        messages.error(request, f"Ocorreu um erro ao fazer o download do PDF: {str(e)}")
+        return redirect('plate_form')
@@ -0,0 +1,235 @@
+import hashlib
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import reportlab
+from django.db import connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .utils import resources
+from .utils.generator import PlateTemplateGenerator
+
+TARGETS = ('generate_pdf', 'generate_pdf_for_project', 'render_and_send')
+MODES = ('normal', 'compact')
+DEFAULT_SAMPLES = (90, 1000, 4500, 20000, 40000)
+
+# Métricas comparadas com a linha de base para detectar regressões
+COMPARED_METRICS = ('wall_ms', 'bytes', 'peak_python_kb')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _traced_peak():
+    """Pico de memória Python até aqui, quando a execução está sob o tracemalloc"""
+    return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+
+
+def _bench_generate_pdf(total_samples, processes, compact):
+    buffer = BytesIO()
+    project_data = {'empresa': '001', 'projeto': 'BENCH', 'total_amostras': total_samples}
+    start = time.perf_counter()
+    PlateTemplateGenerator(compact=compact).generate_pdf(buffer, project_data, '0000000', processes=processes)
+    elapsed = time.perf_counter() - start
+    return elapsed, buffer.getvalue(), _traced_peak()
+
+
+def _bench_project(total_samples, processes, compact, send=False):
+    from django.core import mail as django_mail
+    from .models import PlateProject
+    from .services import PlateService
+
+    # Transação desfeita ao final e MEDIA_ROOT temporário: nada do benchmark permanece
+    media_root = tempfile.mkdtemp(prefix='plate-bench-')
+    try:
+        with override_settings(
+            MEDIA_ROOT=media_root, PLATE_PAGE_RENDER_PROCESSES=processes, PLATE_PDF_COMPACT=compact,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        ):
+            try:
+                with transaction.atomic():
+                    project = PlateProject.objects.create(
+                        empresa='999', projeto='BENCH', total_amostras=total_samples, email='bench@example.com'
+                    )
+                    start = time.perf_counter()
+                    pdf_path, filename, cod_envio = PlateService.generate_pdf_for_project(project)
+                    if send and not PlateService.send_pdf_by_email(project, pdf_path, filename, cod_envio):
+                        raise RuntimeError("Falha ao enviar o email")
+                    elapsed = time.perf_counter() - start
+                    # Antes de ler o arquivo para o hash, que não faz parte do caso medido
+                    peak = _traced_peak()
+                    with open(pdf_path, 'rb') as f:
+                        content = f.read()
+                    raise _Rollback
+            except _Rollback:
+                pass
+    finally:
+        django_mail.outbox = []
+        shutil.rmtree(media_root, ignore_errors=True)
+    return elapsed, content, peak
+
+
+def _bench_generate_pdf_for_project(total_samples, processes, compact):
+    return _bench_project(total_samples, processes, compact)
+
+
+def _bench_render_and_send(total_samples, processes, compact):
+    """Renderização e envio por email (backend locmem), como na tarefa da fila"""
+    return _bench_project(total_samples, processes, compact, send=True)
+
+
+BENCHMARKS = {
+    'generate_pdf': _bench_generate_pdf,
+    'generate_pdf_for_project': _bench_generate_pdf_for_project,
+    'render_and_send': _bench_render_and_send,
+}
+
+
+def _measure(target, total_samples, processes, repeat, mode, conn):
+    """
+    Executado em um processo novo, para que o pico de RSS seja o do próprio caso
+
+    Fontes e logo já vêm carregados do processo pai (run_case); a decodificação
+    do logo original não entra no pico medido aqui.
+    """
+    try:
+        # RSS herdado do processo pai, descontado do pico
+        baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        func = BENCHMARKS[target]
+        compact = mode == 'compact'
+        # Aquecimento: o primeiro PDF carrega módulos e caches do processo
+        func(total_samples, processes, compact)
+
+        times = []
+        for _ in range(repeat):
+            elapsed, content, _ = func(total_samples, processes, compact)
+            times.append(elapsed)
+
+        # Execução separada para o pico de memória: o tracemalloc distorce os tempos
+        tracemalloc.start()
+        _, _, peak_python = func(total_samples, processes, compact)
+        tracemalloc.stop()
+
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send({
+            'wall_ms': round(min(times) * 1000, 2),
+            'wall_ms_median': round(statistics.median(times) * 1000, 2),
+            'peak_rss_kb': peak_rss,
+            # Crescimento do RSS durante o caso, acima do que o processo já tinha ao iniciar
+            'rss_growth_kb': peak_rss - baseline_rss,
+            'peak_python_kb': peak_python // 1024,
+            # Pico de memória Python em múltiplos do tamanho do PDF
+            'peak_ratio': round(peak_python / len(content), 2),
+            'bytes': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+        })
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+        connections.close_all()
+
+
+def run_case(target, total_samples, processes=1, repeat=3, mode='normal'):
+    """
+    Mede um caso em um processo filho isolado
+
+    Returns:
+        dict com tempo (melhor e mediana), pico e crescimento do RSS, pico de
+        memória Python (também em relação ao tamanho do PDF), bytes, bytes por
+        placa e hash do PDF
+    """
+    # Aquecimento uma única vez, aqui: os filhos herdam fontes e logo prontos
+    if not resources.warm_up_status()['ready']:
+        resources.warm_up()
+    # Conexões abertas não devem ser compartilhadas com o processo filho
+    connections.close_all()
+    ctx = multiprocessing.get_context('fork')
+    receiver, sender = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_measure, args=(target, total_samples, processes, repeat, mode, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error': f"processo de medição encerrou com código {process.exitcode}"}
+    process.join()
+
+    plates = PlateTemplateGenerator().calculate_plates_needed(total_samples)
+    record = {'target': target, 'mode': mode, 'samples': total_samples, 'processes': processes, 'plates': plates}
+    record.update(result)
+    if 'bytes' in result:
+        record['bytes_per_plate'] = round(result['bytes'] / plates, 1)
+    return record
+
+
+def environment():
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'reportlab': reportlab.Version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'generator_version': PlateTemplateGenerator.VERSION,
+    }
+
+
+def case_key(record):
+    return (record['target'], record.get('mode', 'normal'), record['samples'], record['processes'])
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compara os resultados com uma execução anterior
+
+    Args:
+        results: Lista de registros da execução atual
+        baseline: Lista de registros da linha de base
+        threshold: Aumento máximo tolerado, em porcentagem
+
+    Returns:
+        Lista de mensagens, uma por métrica que piorou além do limite
+    """
+    previous = {case_key(record): record for record in baseline}
+    regressions = []
+    for record in results:
+        base = previous.get(case_key(record))
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in record or not base.get(metric):
+                continue
+            change = (record[metric] - base[metric]) / base[metric] * 100
+            if change > threshold:
+                regressions.append(
+                    f"{record['target']} [{record.get('mode', 'normal')}] {record['samples']} amostras "
+                    f"({record['processes']} proc.): "
+                    f"{metric} {base[metric]} -> {record[metric]} (+{change:.1f}%)"
+                )
+    return regressions
+
+
+def find_memory_excess(results, max_ratio):
+    """
+    Casos cujo pico de memória Python passou de ``max_ratio`` vezes o tamanho do PDF
+
+    Cópias desnecessárias do documento (buffers intermediários, leitura do
+    arquivo para o anexo) aparecem como aumento dessa razão.
+    """
+    return [
+        f"{record['target']} [{record.get('mode', 'normal')}] {record['samples']} amostras "
+        f"({record['processes']} proc.): pico de {record['peak_python_kb'] / 1024:.1f} MB = "
+        f"{record['peak_ratio']}x o PDF (limite {max_ratio:g}x)"
+        for record in results
+        if record.get('peak_ratio') is not None and record['peak_ratio'] > max_ratio
+    ]
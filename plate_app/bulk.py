@@ -0,0 +1,195 @@
+import csv
+import io
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .admission import RenderAdmission, is_small, render_units
+from .forms import PlateProjectRowForm
+from .jobs import PlateJobQueue
+from .models import PlateProject
+
+COLUMNS = ('empresa', 'projeto', 'total_amostras', 'email')
+# Colunas opcionais; vazias ou ausentes usam o padrão do formulário
+OPTIONAL_COLUMNS = ('formato_placa', 'layout_pagina', 'pocos_controle')
+
+
+class BulkImportError(Exception):
+    """Erro que impede o processamento do arquivo inteiro"""
+
+
+class PlateBulkImporter:
+    """Cadastro de vários projetos a partir de um CSV.
+
+    Todas as linhas são validadas em uma passada, a duplicidade de
+    empresa+projeto é verificada com uma única consulta, os projetos são
+    criados com ``bulk_create`` e as tarefas de geração e envio são
+    registradas com um único INSERT. A renderização fica a cargo dos workers
+    da fila (run_plate_worker), fora da requisição: as linhas são renderizadas
+    em paralelo pelos vários processos de worker (um por núcleo no deploy.sh).
+    """
+
+    @staticmethod
+    def read_csv(data):
+        """
+        Lê o conteúdo do CSV (bytes ou str) e retorna uma lista de (linha, dados)
+        """
+        if isinstance(data, bytes):
+            try:
+                data = data.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                data = data.decode('latin-1')
+        if not data.strip():
+            raise BulkImportError("O arquivo CSV está vazio.")
+
+        try:
+            dialect = csv.Sniffer().sniff(data[:4096], delimiters=',;')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(io.StringIO(data), dialect=dialect)
+        header = [name.strip().lower() for name in (reader.fieldnames or [])]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise BulkImportError(f"Colunas ausentes no CSV: {', '.join(missing)}")
+        reader.fieldnames = header
+
+        max_rows = getattr(settings, 'PLATE_BULK_MAX_ROWS', 500)
+        rows = []
+        for row in reader:
+            values = {column: (row.get(column) or '').strip() for column in COLUMNS + OPTIONAL_COLUMNS}
+            if not any(values.values()):
+                continue
+            rows.append((reader.line_num, values))
+            if len(rows) > max_rows:
+                raise BulkImportError(f"O arquivo excede o limite de {max_rows} projetos.")
+        if not rows:
+            raise BulkImportError("O arquivo CSV não contém projetos.")
+        return rows
+
+    @staticmethod
+    def validate(rows):
+        """
+        Valida todas as linhas
+
+        Returns:
+            (results, valid): resultado por linha e lista de (resultado, form) válidos
+        """
+        results, valid, seen = [], [], {}
+        for line, values in rows:
+            result = {'linha': line, **values, 'status': 'erro', 'erros': [], 'duplicado': False}
+            results.append(result)
+            form = PlateProjectRowForm(data=values)
+            if not form.is_valid():
+                result['erros'] = [error for errors in form.errors.values() for error in errors]
+                continue
+            pair = (form.cleaned_data['empresa'], form.cleaned_data['projeto'])
+            if pair in seen:
+                result['erros'] = [f"Empresa e projeto repetidos no arquivo (linha {seen[pair]})."]
+                result['duplicado'] = True
+                continue
+            seen[pair] = line
+            valid.append((result, form))
+
+        PlateBulkImporter.reject_existing(valid)
+        return results, [(result, form) for result, form in valid if not result['erros']]
+
+    @staticmethod
+    def reject_existing(valid):
+        """Marca com erro as linhas cujo empresa+projeto já existe (uma única consulta)"""
+        if not valid:
+            return
+        empresas = {form.cleaned_data['empresa'] for _, form in valid}
+        projetos = {form.cleaned_data['projeto'] for _, form in valid}
+        existing = set(
+            PlateProject.objects
+            .filter(empresa__in=empresas, projeto__in=projetos)
+            .values_list('empresa', 'projeto')
+        )
+        for result, form in valid:
+            if (form.cleaned_data['empresa'], form.cleaned_data['projeto']) in existing:
+                result['erros'] = [PlateProjectRowForm.duplicate_message]
+                result['duplicado'] = True
+
+    @staticmethod
+    def create(valid):
+        """
+        Cria os projetos válidos com bulk_create e atribui os códigos de envio
+
+        Raises:
+            IntegrityError: se o conflito persistir após a nova verificação (nada é criado)
+        """
+        for attempt in range(2):
+            # is_valid() já preencheu form.instance com os dados da linha
+            projects = [form.instance for _, form in valid]
+            try:
+                with transaction.atomic():
+                    created = PlateProject.objects.bulk_create(projects)
+                    PlateBulkImporter.assign_cod_envio(created)
+                return created
+            except IntegrityError:
+                if attempt:
+                    raise
+                # Outro envio criou um dos pares entre a validação e o INSERT
+                for project in projects:
+                    project.pk = None
+                PlateBulkImporter.reject_existing(valid)
+                valid[:] = [(result, form) for result, form in valid if not result['erros']]
+        return []
+
+    @staticmethod
+    def assign_cod_envio(projects):
+        for project in projects:
+            project.cod_envio = project.build_cod_envio()
+        taken = set(
+            PlateProject.objects
+            .filter(cod_envio__in=[project.cod_envio for project in projects])
+            .values_list('cod_envio', flat=True)
+        )
+        free = [project for project in projects if project.cod_envio not in taken]
+        PlateProject.objects.bulk_update(free, ['cod_envio'])
+        for project in projects:
+            if project.cod_envio in taken:
+                project.cod_envio = None
+                project.assign_cod_envio()
+
+    @staticmethod
+    def check_queue(valid):
+        """
+        Admissão do lote pela fila de tarefas (ver RenderAdmission.check_queue)
+
+        Os projetos pequenos do lote são sempre aceitos; os grandes contam
+        juntos contra PLATE_QUEUE_BUDGET.
+
+        Raises:
+            RenderBusy: se o lote deve ser enviado mais tarde
+        """
+        units = [render_units(form.cleaned_data) for _, form in valid]
+        RenderAdmission.check_queue_units(sum(unit for unit in units if not is_small(unit)))
+
+    @staticmethod
+    def run(data):
+        """
+        Processa o CSV completo: cadastra os projetos e registra as tarefas,
+        sem renderizar nenhum PDF na requisição
+
+        Returns:
+            list: resultado por linha (status 'ok' ou 'erro', erros, duplicado, cod_envio, job_id)
+
+        Raises:
+            BulkImportError: se o arquivo não puder ser processado
+            RenderBusy: se a fila não comporta os projetos grandes do lote (nada é criado)
+            IntegrityError: se a gravação conflitou mesmo após a nova verificação (nada é criado)
+        """
+        rows = PlateBulkImporter.read_csv(data)
+        results, valid = PlateBulkImporter.validate(rows)
+        PlateBulkImporter.check_queue(valid)
+        projects = PlateBulkImporter.create(valid)
+        if not projects:
+            return results
+
+        jobs = PlateJobQueue.enqueue_many(projects)
+        for (result, _), project, job in zip(valid, projects, jobs):
+            result['status'] = 'ok'
+            result['cod_envio'] = project.cod_envio
+            result['job_id'] = job.id
+        return results
@@ -0,0 +1,37 @@
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs aplicados a cada nova conexão SQLite (sobrescrevíveis em PLATE_SQLITE_PRAGMAS)
+DEFAULT_PRAGMAS = {
+    # Leitores não bloqueiam o escritor e vice-versa; persiste no arquivo do banco
+    'journal_mode': 'WAL',
+    # Com WAL, NORMAL só sincroniza nos checkpoints e continua seguro contra corrupção
+    'synchronous': 'NORMAL',
+    # Milissegundos aguardando o lock de escrita antes de "database is locked"
+    'busy_timeout': 5000,
+}
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Ajusta cada conexão SQLite nova (sinal connection_created)
+
+    Com vários workers do gunicorn gravando no mesmo db.sqlite3, o modo de
+    journal padrão bloqueia as leituras durante as escritas e as escritas
+    concorrentes falham imediatamente; WAL e busy_timeout evitam os erros
+    "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'PLATE_SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+            if name == 'journal_mode':
+                # Bancos em memória não suportam WAL e continuam em 'memory'
+                mode = cursor.fetchone()[0]
+                if str(mode).lower() != str(value).lower():
+                    logger.debug("journal_mode %s não aplicado ao banco %s (%s)", value, connection.alias, mode)
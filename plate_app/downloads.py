@@ -0,0 +1,184 @@
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .render_cache import PlateRenderCache
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def pdf_etag(project, stat):
+    """
+    ETag forte do PDF
+
+    Como a renderização é determinística, a chave de renderização identifica
+    exatamente os bytes do arquivo; PDFs antigos, sem chave, usam tamanho e mtime.
+    """
+    if project.render_key:
+        return f'"{project.render_key}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Interpreta um cabeçalho Range com um único intervalo de bytes
+
+    Returns:
+        (início, fim) inclusivos, None para ignorar o cabeçalho (resposta
+        completa) ou False se o intervalo não puder ser atendido
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Formato desconhecido ou múltiplos intervalos: envia o arquivo inteiro
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Sufixo: os últimos N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, mtime):
+    """Verifica a pré-condição If-Range (o Range só vale se o arquivo não mudou)"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(mtime) <= date
+
+
+def iter_file_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def aiter_chunks(iterator, size=CHUNK_SIZE):
+    """
+    Consome um iterador síncrono (de bytes ou textos) em uma thread, em
+    blocos de ~``size``, sem bloquear o event loop
+
+    Sob ASGI, o Django só transmite em streaming iteradores assíncronos; um
+    iterador síncrono seria lido inteiro para a memória antes do envio.
+    """
+    iterator = iter(iterator)
+
+    def next_chunk():
+        parts, length = [], 0
+        for part in iterator:
+            parts.append(part)
+            length += len(part)
+            if length >= size:
+                break
+        return parts
+
+    try:
+        while True:
+            parts = await sync_to_async(next_chunk, thread_sensitive=False)()
+            if not parts:
+                return
+            yield (b'' if isinstance(parts[0], bytes) else '').join(parts)
+    finally:
+        # Cliente desconectado no meio: fecha o arquivo do gerador
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # Ainda em execução na thread de um bloco cancelado; fechado pelo coletor
+                pass
+
+
+def streaming_content(iterator):
+    """
+    Conteúdo de StreamingHttpResponse adequado ao servidor: o próprio
+    iterador sob WSGI e aiter_chunks sob ASGI (PLATE_ASYNC_VIEWS)
+    """
+    if getattr(settings, 'PLATE_ASYNC_VIEWS', False):
+        return aiter_chunks(iterator)
+    return iterator
+
+
+def serve_pdf(request, project, filename):
+    """
+    Resposta de download do PDF do projeto com ETag, Last-Modified, GET
+    condicional (304) e requisições parciais (Range)
+
+    Com PLATE_PDF_X_ACCEL_REDIRECT definido, apenas os cabeçalhos são gerados
+    aqui e o nginx envia os bytes a partir do MEDIA_ROOT, liberando o worker.
+    Sob ASGI, o arquivo é lido em blocos por um iterador assíncrono
+    (streaming_content), sem carregá-lo inteiro na memória.
+    """
+    path = project.pdf_file.path
+    stat = os.stat(path)
+    PlateRenderCache.touch(project.pdf_file.storage, project.pdf_file.name)
+    etag = pdf_etag(project, stat)
+    last_modified = http_date(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        accel_prefix = getattr(settings, 'PLATE_PDF_X_ACCEL_REDIRECT', None)
+        range_header = request.META.get('HTTP_RANGE')
+        byte_range = None
+        if range_header and request.method in ('GET', 'HEAD') and if_range_matches(request, etag, stat.st_mtime):
+            byte_range = parse_range(range_header, stat.st_size)
+
+        if accel_prefix:
+            # O nginx trata Range e envia o arquivo diretamente; a ETag abaixo é
+            # repassada por ele (etag off + $upstream_http_etag no deploy.sh)
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(project.pdf_file.name)
+        elif byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                streaming_content(iter_file_range(path, start, length)),
+                status=206,
+                content_type='application/pdf',
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        elif getattr(settings, 'PLATE_ASYNC_VIEWS', False):
+            # O FileResponse entregaria um iterador síncrono ao servidor ASGI
+            response = StreamingHttpResponse(
+                streaming_content(iter_file_range(path, 0, stat.st_size)),
+                content_type='application/pdf',
+            )
+            response['Content-Length'] = str(stat.st_size)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return response
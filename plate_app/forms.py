@@ -1,6 +1,7 @@
 from django import forms
 from django.core.validators import RegexValidator
 from .models import PlateProject
+from .utils.layout import DEFAULT_PAGE_LAYOUT, DEFAULT_PLATE_FORMAT
 
 class PlateProjectForm(forms.ModelForm):
     """Formulário para solicitação de geração de templates de placas"""
@@ -23,18 +24,33 @@ class PlateProjectForm(forms.ModelForm):
         widget=forms.TextInput(attrs={'placeholder': 'Ex: PROJ123ABC'})
     )
     
+    duplicate_message = "Já existe um projeto cadastrado com esta combinação de empresa e projeto."
+    
     class Meta:
         model = PlateProject
-        fields = ['empresa', 'projeto', 'total_amostras', 'email']
+        fields = ['empresa', 'projeto', 'total_amostras', 'email', 'formato_placa', 'layout_pagina', 'pocos_controle']
         widgets = {
             'total_amostras': forms.NumberInput(attrs={
                 'min': 90, 
                 'max': 40000,
                 'placeholder': 'Entre 90 e 40000'
             }),
-            'email': forms.EmailInput(attrs={'placeholder': 'seu@email.com'})
+            'email': forms.EmailInput(attrs={'placeholder': 'seu@email.com'}),
+            'pocos_controle': forms.TextInput(attrs={'placeholder': 'A1, B1, C1, D1, E1, F1'}),
         }
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Opcionais: envios sem esses campos (ex.: CSVs antigos) usam o padrão
+        self.fields['formato_placa'].required = False
+        self.fields['layout_pagina'].required = False
+    
+    def clean_formato_placa(self):
+        return self.cleaned_data.get('formato_placa') or DEFAULT_PLATE_FORMAT
+    
+    def clean_layout_pagina(self):
+        return self.cleaned_data.get('layout_pagina') or DEFAULT_PAGE_LAYOUT
+    
     def clean(self):
         """Validação adicional de formulário"""
         cleaned_data = super().clean()
@@ -45,8 +61,35 @@ class PlateProjectForm(forms.ModelForm):
         
         if empresa and projeto:
             if PlateProject.objects.filter(empresa=empresa, projeto=projeto).exists():
-                raise forms.ValidationError(
-                    "Já existe um projeto cadastrado com esta combinação de empresa e projeto."
-                )
+                raise forms.ValidationError(self.duplicate_message)
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+
+class PlateProjectRowForm(PlateProjectForm):
+    """
+    Validação de uma linha do envio em lote
+    
+    Valida apenas os campos; a verificação de duplicidade de empresa+projeto
+    é feita para todas as linhas de uma vez por PlateBulkImporter.
+    """
+    
+    def clean(self):
+        return super(PlateProjectForm, self).clean()
+    
+    def validate_unique(self):
+        pass
+
+
+class PlateProjectBulkForm(forms.Form):
+    """Formulário para envio de vários projetos em um arquivo CSV"""
+    
+    arquivo = forms.FileField(
+        label="Arquivo CSV",
+        help_text=(
+            "Colunas: empresa, projeto, total_amostras, email e, opcionalmente, formato_placa, "
+            "layout_pagina e pocos_controle (separadas por vírgula ou ponto e vírgula)"
+        ),
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,text/csv'})
+    )
+
@@ -0,0 +1,243 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import mail, metrics
+from .admission import RenderBusy
+from .models import PlateJob
+from .services import PlateService
+
+logger = logging.getLogger(__name__)
+
+
+class PlateJobQueue:
+    """Fila de tarefas persistida no banco de dados.
+
+    A view apenas registra a tarefa; o comando ``run_plate_worker`` reserva
+    e executa as tarefas pendentes fora do ciclo HTTP.
+    """
+
+    @staticmethod
+    def enqueue(project, kind=PlateJob.KIND_RENDER_SEND):
+        """Registra uma nova tarefa para o projeto e a retorna"""
+        return PlateJob.objects.create(
+            project=project,
+            kind=kind,
+            max_attempts=getattr(settings, 'PLATE_JOB_MAX_ATTEMPTS', 3),
+        )
+
+    @staticmethod
+    async def aenqueue(project, kind=PlateJob.KIND_RENDER_SEND):
+        """Versão assíncrona de ``enqueue`` (ORM assíncrono do Django)"""
+        return await PlateJob.objects.acreate(
+            project=project,
+            kind=kind,
+            max_attempts=getattr(settings, 'PLATE_JOB_MAX_ATTEMPTS', 3),
+        )
+
+    @staticmethod
+    def enqueue_many(projects, kind=PlateJob.KIND_RENDER_SEND):
+        """Registra uma tarefa por projeto com um único INSERT"""
+        max_attempts = getattr(settings, 'PLATE_JOB_MAX_ATTEMPTS', 3)
+        return PlateJob.objects.bulk_create([
+            PlateJob(project=project, kind=kind, max_attempts=max_attempts)
+            for project in projects
+        ])
+
+    @staticmethod
+    def active_project_ids(projects, kind):
+        """Ids dos projetos que já têm uma tarefa do tipo na fila ou em execução"""
+        return set(
+            PlateJob.objects
+            .filter(
+                project__in=projects,
+                kind=kind,
+                status__in=(PlateJob.STATUS_PENDING, PlateJob.STATUS_RUNNING),
+            )
+            .values_list('project_id', flat=True)
+        )
+
+    @staticmethod
+    def active_job(project):
+        """Tarefa mais recente do projeto ainda na fila ou em execução (ambos os tipos geram o PDF), ou None"""
+        return (
+            PlateJob.objects
+            .select_related('project')
+            .filter(project=project, status__in=(PlateJob.STATUS_PENDING, PlateJob.STATUS_RUNNING))
+            .order_by('-created_at')
+            .first()
+        )
+
+    @staticmethod
+    def worker_name():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def claim(worker=''):
+        """
+        Reserva a próxima tarefa pendente de forma atômica
+
+        O UPDATE condicional garante que apenas um worker (entre processos e
+        threads) consiga mudar a tarefa de 'pending' para 'running'.
+
+        Returns:
+            PlateJob reservada ou None se a fila estiver vazia
+        """
+        now = timezone.now()
+        candidates = (
+            PlateJob.objects
+            .filter(status=PlateJob.STATUS_PENDING, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:10]
+        )
+        for job_id in candidates:
+            claimed = PlateJob.objects.filter(id=job_id, status=PlateJob.STATUS_PENDING).update(
+                status=PlateJob.STATUS_RUNNING,
+                worker=worker,
+                started_at=now,
+                updated_at=now,
+            )
+            if claimed:
+                return PlateJob.objects.select_related('project').get(id=job_id)
+        return None
+
+    @staticmethod
+    def worker_alive(worker):
+        """Indica se o worker ("host:pid/thread") é um processo vivo desta máquina"""
+        host, _, rest = worker.partition(':')
+        pid = rest.partition('/')[0]
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+        return metrics.pid_alive(int(pid))
+
+    @staticmethod
+    def requeue_stale(timeout):
+        """
+        Recupera tarefas 'running' abandonadas por um worker interrompido (ex.: morto pelo OOM)
+
+        A recuperação conta como tentativa: uma tarefa que derruba o worker a
+        cada execução termina como 'failed' depois de ``max_attempts``, em vez
+        de voltar para a fila indefinidamente. Tarefas de workers ainda vivos
+        nesta máquina não são tocadas, por mais que demorem.
+
+        Returns:
+            (devolvidas para a fila, marcadas como falha)
+        """
+        now = timezone.now()
+        running = PlateJob.objects.filter(status=PlateJob.STATUS_RUNNING, started_at__lt=now - timedelta(seconds=timeout))
+        stale = [job_id for job_id, worker in running.values_list('id', 'worker') if not PlateJobQueue.worker_alive(worker)]
+        if not stale:
+            return 0, 0
+
+        # O UPDATE condicional (ainda 'running') não recupera uma tarefa concluída nesse meio-tempo
+        jobs = PlateJob.objects.filter(id__in=stale, status=PlateJob.STATUS_RUNNING)
+        reclaimed = {
+            'attempts': F('attempts') + 1,
+            'worker': '',
+            'last_error': "Tarefa abandonada: o worker foi interrompido durante a execução.",
+            'updated_at': now,
+        }
+        failed = jobs.filter(attempts__gte=F('max_attempts') - 1).update(
+            status=PlateJob.STATUS_FAILED, finished_at=now, **reclaimed
+        )
+        requeued = jobs.update(status=PlateJob.STATUS_PENDING, run_after=now, **reclaimed)
+        return requeued, failed
+
+    @staticmethod
+    def execute(job):
+        """Executa o trabalho da tarefa, levantando exceção em caso de falha"""
+        project = job.project
+
+        if job.kind == PlateJob.KIND_RENDER_SEND:
+            # Em novas tentativas o PDF já gerado é reutilizado pelo cache de renderização;
+            # o anexo é o próprio arquivo armazenado, mapeado em memória
+            _, filename, cod_envio = PlateService.render_project(project)
+            PlateService.send_pdf_by_email(project, project.pdf_file.path, filename, cod_envio, raise_errors=True)
+        elif job.kind == PlateJob.KIND_RENDER:
+            # Um PDF já armazenado com a chave atual é apenas reassociado ao projeto
+            PlateService.render_project(project)
+        else:
+            raise ValueError(f"Tipo de tarefa desconhecido: {job.kind}")
+
+    @staticmethod
+    def run(job):
+        """
+        Executa uma tarefa já reservada e registra o resultado
+
+        Falhas são reagendadas com espera exponencial até ``max_attempts``;
+        depois disso a tarefa fica com a situação 'failed'. Uma recusa
+        definitiva do servidor de email (ex.: destinatário inexistente) marca
+        a falha na hora. Com o orçamento de renderização esgotado, a tarefa
+        volta para a fila sem contar tentativa.
+
+        Returns:
+            bool: True se a tarefa foi concluída com sucesso
+        """
+        job.attempts += 1
+        try:
+            PlateJobQueue.execute(job)
+        except RenderBusy as e:
+            # Volta para o fim da fila; o worker segue com as tarefas seguintes (menores cabem na reserva)
+            logger.info("Tarefa %s adiada por %s s: %s", job.id, e.retry_after, e)
+            job.attempts -= 1
+            job.status = PlateJob.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=e.retry_after)
+            job.save(update_fields=['attempts', 'status', 'run_after', 'updated_at'])
+            return False
+        except Exception as e:
+            logger.warning("Tarefa %s falhou (tentativa %s/%s): %s", job.id, job.attempts, job.max_attempts, e)
+            job.last_error = traceback.format_exc()
+            if job.attempts < job.max_attempts and not mail.is_permanent(e):
+                delay = getattr(settings, 'PLATE_JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+                job.status = PlateJob.STATUS_PENDING
+                job.run_after = timezone.now() + timedelta(seconds=delay)
+            else:
+                job.status = PlateJob.STATUS_FAILED
+                job.finished_at = timezone.now()
+            job.save(update_fields=['attempts', 'status', 'last_error', 'run_after', 'finished_at', 'updated_at'])
+            return False
+
+        job.status = PlateJob.STATUS_DONE
+        job.last_error = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['attempts', 'status', 'last_error', 'finished_at', 'updated_at'])
+        return True
+
+    @staticmethod
+    def work(worker='', stop=None, poll_interval=2.0, once=False):
+        """
+        Laço de um worker: reserva e executa tarefas até ``stop`` ser sinalizado
+
+        Args:
+            worker: Identificação gravada nas tarefas reservadas
+            stop: threading.Event usado para encerrar o laço
+            poll_interval: Espera em segundos quando a fila está vazia
+            once: Encerra assim que a fila estiver vazia
+
+        Returns:
+            int: Número de tarefas processadas
+        """
+        processed = 0
+        while stop is None or not stop.is_set():
+            close_old_connections()
+            job = PlateJobQueue.claim(worker)
+            if job is None:
+                if once:
+                    break
+                if stop is not None:
+                    stop.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+                continue
+            PlateJobQueue.run(job)
+            processed += 1
+        close_old_connections()
+        return processed
@@ -0,0 +1,184 @@
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+def is_transient(error):
+    """
+    Indica se vale a pena tentar o envio novamente
+
+    Respostas 4xx do servidor, desconexões e erros de rede são temporários;
+    respostas 5xx (destinatário inexistente, mensagem recusada) não são.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+
+def is_permanent(error):
+    """Recusa do servidor que nenhuma nova tentativa resolve (ex.: 5xx, destinatário inexistente)"""
+    return isinstance(error, smtplib.SMTPException) and not is_transient(error)
+
+
+class PlateMailer:
+    """
+    Envio de emails com conexões reaproveitadas
+
+    As mensagens entram em uma fila e são enviadas em lotes por threads de
+    envio; cada thread mantém sua própria conexão aberta (obtida com
+    ``get_connection``), fechada depois de ``max_idle`` segundos sem uso ou
+    após um erro. Falhas temporárias são repetidas com espera exponencial.
+    Funciona com qualquer backend do Django (smtp, locmem, console...).
+    """
+
+    def __init__(self, connections=None, batch_size=None, max_attempts=None, retry_delay=None, max_idle=None):
+        self.connections = connections or getattr(settings, 'PLATE_EMAIL_CONNECTIONS', 1)
+        self.batch_size = batch_size or getattr(settings, 'PLATE_EMAIL_BATCH_SIZE', 20)
+        self.max_attempts = max_attempts or getattr(settings, 'PLATE_EMAIL_MAX_ATTEMPTS', 3)
+        self.retry_delay = retry_delay if retry_delay is not None else getattr(settings, 'PLATE_EMAIL_RETRY_DELAY', 1.0)
+        self.max_idle = max_idle if max_idle is not None else getattr(settings, 'PLATE_EMAIL_MAX_IDLE', 30.0)
+        self.queue = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, message):
+        """Coloca a mensagem na fila; o Future recebe True ou a exceção do envio"""
+        future = Future()
+        self._start()
+        self.queue.put((message, future))
+        return future
+
+    def send(self, message, timeout=None):
+        """Envia uma mensagem pela fila e aguarda o resultado (levanta a exceção em caso de falha)"""
+        return self.submit(message).result(timeout)
+
+    def close(self):
+        """Encerra as threads de envio depois de esvaziar a fila"""
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for index in range(self.connections):
+                thread = threading.Thread(target=self._sender, name=f"plate-mailer-{index}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _next_batch(self, connection):
+        """Aguarda a primeira mensagem e junta as que já estiverem na fila"""
+        try:
+            item = self.queue.get(timeout=self.max_idle if connection is not None else None)
+        except queue.Empty:
+            return None
+        if item is None:
+            return []
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Repassa o sinal de parada depois deste lote
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _sender(self):
+        connection = None
+        while True:
+            batch = self._next_batch(connection)
+            if batch is None:
+                # Conexão ociosa: fechar antes que o servidor a derrube
+                connection = self._close(connection)
+                continue
+            if not batch:
+                self._close(connection)
+                return
+            connection = self.send_batch(batch, connection)
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception as e:
+                logger.debug("Erro ao fechar conexão de email: %s", e)
+        return None
+
+    def send_batch(self, batch, connection=None):
+        """
+        Envia um lote de (mensagem, Future) pela mesma conexão
+
+        Returns:
+            Conexão ainda aberta (ou None), para reaproveitamento no próximo lote
+        """
+        for message, future in batch:
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    if connection is None:
+                        connection = get_connection(fail_silently=False)
+                        connection.open()
+                    connection.send_messages([message])
+                except Exception as e:
+                    connection = self._close(connection)
+                    if attempt < self.max_attempts and is_transient(e):
+                        delay = self.retry_delay * 2 ** (attempt - 1)
+                        logger.warning(
+                            "Falha temporária ao enviar email para %s (tentativa %s/%s): %s",
+                            ', '.join(message.to), attempt, self.max_attempts, e
+                        )
+                        time.sleep(delay)
+                        continue
+                    future.set_exception(e)
+                else:
+                    future.set_result(True)
+                break
+        return connection
+
+
+_mailer = None
+_mailer_pid = None
+_mailer_lock = threading.Lock()
+
+
+def get_mailer():
+    """Mailer compartilhado pelo processo (recriado após um fork)"""
+    global _mailer, _mailer_pid
+    with _mailer_lock:
+        if _mailer is None or _mailer_pid != os.getpid():
+            _mailer = PlateMailer()
+            _mailer_pid = os.getpid()
+        return _mailer
+
+
+def reset():
+    """Encerra o mailer compartilhado (ex.: ao final do worker ou em testes)"""
+    global _mailer
+    with _mailer_lock:
+        mailer, _mailer = _mailer, None
+    if mailer is not None and _mailer_pid == os.getpid():
+        mailer.close()
@@ -0,0 +1,109 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from plate_app import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede generate_pdf, generate_pdf_for_project e a renderização com envio por "
+        "email (tempo, crescimento do RSS, pico de memória Python, bytes e bytes por placa), salva "
+        "os resultados em JSON e falha se houver regressão em relação a uma linha de "
+        "base ou se o pico de memória passar do limite"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--samples', type=int, nargs='+', default=list(benchmarks.DEFAULT_SAMPLES),
+            help="Totais de amostras a medir",
+        )
+        parser.add_argument(
+            '--targets', nargs='+', choices=benchmarks.TARGETS, default=list(benchmarks.TARGETS),
+            help="Funções a medir",
+        )
+        parser.add_argument(
+            '--modes', nargs='+', choices=benchmarks.MODES, default=['normal'],
+            help="Modos de saída do gerador a medir (ex.: --modes normal compact para comparar)",
+        )
+        parser.add_argument(
+            '--processes', type=int, nargs='+', default=[1],
+            help="Números de processos da renderização por faixas de páginas (1 = sequencial)",
+        )
+        parser.add_argument('--repeat', type=int, default=3, help="Execuções por medida (vale a melhor)")
+        parser.add_argument('--output', '-o', help="Arquivo JSON onde salvar os resultados")
+        parser.add_argument('--baseline', help="Arquivo JSON de uma execução anterior para comparação")
+        parser.add_argument(
+            '--threshold', type=float,
+            default=getattr(settings, 'PLATE_BENCHMARK_THRESHOLD', 20.0),
+            help="Piora máxima tolerada em relação à linha de base, em porcentagem",
+        )
+        parser.add_argument(
+            '--max-peak-ratio', type=float,
+            default=getattr(settings, 'PLATE_BENCHMARK_MAX_PEAK_RATIO', None),
+            help="Pico de memória Python máximo por renderização, em múltiplos do tamanho do PDF",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            if not os.path.exists(options['baseline']):
+                raise CommandError(f"Linha de base não encontrada: {options['baseline']}")
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+
+        self.stdout.write(f"CPUs disponíveis: {os.cpu_count()}")
+        self.stdout.write(
+            f"{'função':<26} {'modo':<8} {'amostras':>8} {'proc.':>5} {'tempo (ms)':>11} {'speedup':>8} "
+            f"{'RSS+ (MB)':>9} {'pico (MB)':>9} {'x PDF':>6} {'bytes':>10} {'B/placa':>8}"
+        )
+
+        results = []
+        for target in options['targets']:
+            for mode in options['modes']:
+                for total_samples in options['samples']:
+                    sequential = None
+                    for processes in sorted(set(options['processes'])):
+                        record = benchmarks.run_case(target, total_samples, processes, max(1, options['repeat']), mode)
+                        results.append(record)
+                        if 'error' in record:
+                            raise CommandError(f"{target} com {total_samples} amostras falhou: {record['error']}")
+
+                        if sequential is None:
+                            sequential = record
+                        elif record['sha256'] != sequential['sha256']:
+                            raise CommandError(
+                                f"Saída de {target} com {processes} processos difere da execução com "
+                                f"{sequential['processes']} para {total_samples} amostras"
+                            )
+                        self.stdout.write(
+                            f"{target:<26} {mode:<8} {total_samples:>8} {processes:>5} {record['wall_ms']:>11.1f} "
+                            f"{sequential['wall_ms'] / record['wall_ms']:>7.2f}x "
+                            f"{record['rss_growth_kb'] / 1024:>9.1f} {record['peak_python_kb'] / 1024:>9.1f} "
+                            f"{record['peak_ratio']:>6.2f} {record['bytes']:>10} {record['bytes_per_plate']:>8.0f}"
+                        )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'environment': benchmarks.environment(), 'results': results}, f, indent=2)
+            self.stdout.write(f"Resultados salvos em {options['output']}")
+
+        if options['max_peak_ratio']:
+            excess = benchmarks.find_memory_excess(results, options['max_peak_ratio'])
+            if excess:
+                raise CommandError("Pico de memória acima do limite:\n" + "\n".join(excess))
+            self.stdout.write(self.style.SUCCESS(
+                f"Pico de memória dentro do limite de {options['max_peak_ratio']:g}x o tamanho do PDF"
+            ))
+
+        if baseline is not None:
+            regressions = benchmarks.find_regressions(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError(
+                    f"Regressões acima de {options['threshold']:g}%:\n" + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Nenhuma regressão acima de {options['threshold']:g}% em relação a {options['baseline']}"
+            ))
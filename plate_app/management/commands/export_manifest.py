@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from plate_app.manifest import FORMATS
+from plate_app.models import PlateProject
+from plate_app.services import PlateService
+
+
+class Command(BaseCommand):
+    help = "Exporta o mapa amostra -> placa/poço de um projeto (CSV ou JSON) para importação no LIMS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('cod_envio', help="Código de envio do projeto")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help="Formato de saída")
+        parser.add_argument('--output', '-o', help="Arquivo de destino (padrão: saída padrão)")
+
+    def handle(self, *args, **options):
+        project = PlateProject.objects.filter(cod_envio=options['cod_envio']).first()
+        if project is None:
+            raise CommandError(f"Projeto com código {options['cod_envio']} não encontrado.")
+
+        iter_rows, _ = FORMATS[options['format']]
+        rows = iter_rows(PlateService.get_project_data(project))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for chunk in rows:
+                    f.write(chunk)
+        else:
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from plate_app.admission import RenderAdmission, render_units
+from plate_app.bulk import BulkImportError, PlateBulkImporter
+from plate_app.jobs import PlateJobQueue
+from plate_app.models import PlateProject
+from plate_app.render_cache import PlateRenderCache
+from plate_app.services import PlateService
+from plate_app.utils.layout import PlateLayout
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Data inválida: {value} (use AAAA-MM-DD)")
+
+
+def render_admitted(project_data, cod_envio, render_key):
+    """
+    Renderiza no processo do pool dentro do orçamento global (RenderAdmission)
+
+    Em vez de falhar com o orçamento esgotado, aguarda a vez: o lote divide a
+    máquina com os workers do gunicorn e da fila sem ultrapassar o limite.
+    """
+    with RenderAdmission.admit(render_units(project_data), wait=None):
+        return PlateService.render_to_storage(project_data, cod_envio, render_key)
+
+
+class Checkpoint:
+    """
+    Progresso de uma execução, gravado em JSON a cada projeto concluído
+
+    Guarda a seleção (ids dos projetos, na ordem de processamento) e os ids
+    já concluídos; uma execução interrompida continua de onde parou quando o
+    comando é chamado de novo com os mesmos argumentos.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.ids = None
+        self.done = set()
+        self.last_write = 0.0
+
+    def load(self):
+        """Retorna True se havia uma execução compatível para continuar"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('signature') != self.signature:
+            raise CommandError(
+                f"O checkpoint {self.path} é de uma execução com outros argumentos; "
+                "use --restart para descartá-lo."
+            )
+        self.ids = data['ids']
+        self.done = set(data['done'])
+        return True
+
+    def mark_done(self, project_id):
+        self.done.add(project_id)
+        # Gravação limitada a uma por segundo; a perda máxima é refazer esses projetos
+        if time.monotonic() - self.last_write >= 1.0:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': self.signature, 'ids': self.ids, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+        self.last_write = time.monotonic()
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera os PDFs de vários projetos fora do servidor web, em um pool de processos, "
+        "a partir de um CSV (mesmo formato do envio em lote) ou de filtros por empresa e "
+        "data, dentro do orçamento global de renderização (PLATE_RENDER_BUDGET); "
+        "execuções interrompidas continuam de onde pararam"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            help="CSV de projetos (empresa, projeto, total_amostras, email...); os que ainda não existem são cadastrados",
+        )
+        parser.add_argument('--empresa', nargs='+', help="Códigos de empresa")
+        parser.add_argument('--since', type=parse_date, help="Projetos criados a partir desta data (AAAA-MM-DD)")
+        parser.add_argument('--until', type=parse_date, help="Projetos criados até esta data, inclusive (AAAA-MM-DD)")
+        parser.add_argument('--all', action='store_true', help="Todos os projetos (sem filtros)")
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help="Processos de renderização (padrão: número de CPUs)",
+        )
+        parser.add_argument('--force', action='store_true', help="Renderiza mesmo os PDFs já atualizados")
+        parser.add_argument(
+            '--send', action='store_true',
+            help="Coloca na fila o envio por email dos projetos gerados (processado pelo run_plate_worker)",
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=getattr(settings, 'PLATE_GENERATE_CHECKPOINT', 'generate_plates.checkpoint.json'),
+            help="Arquivo de progresso usado para continuar uma execução interrompida (padrão: PLATE_GENERATE_CHECKPOINT)",
+        )
+        parser.add_argument('--restart', action='store_true', help="Descarta o progresso salvo e começa do início")
+
+    def handle(self, *args, **options):
+        filters = [options['csv'], options['empresa'], options['since'], options['until'], options['all']]
+        if not any(filters):
+            raise CommandError("Informe --csv, --empresa, --since/--until ou --all.")
+
+        checkpoint = Checkpoint(options['checkpoint'], self.signature(options))
+        if options['restart']:
+            checkpoint.remove()
+        if checkpoint.load():
+            self.stdout.write(
+                f"Continuando a execução anterior: {len(checkpoint.done)} de {len(checkpoint.ids)} projeto(s) já concluído(s)"
+            )
+        else:
+            projects = self.select_projects(options)
+            # Maiores primeiro, para que o último projeto não segure o pool sozinho
+            projects.sort(key=lambda project: -project.total_amostras)
+            checkpoint.ids = [project.id for project in projects]
+            checkpoint.save()
+
+        projects = PlateProject.objects.in_bulk([pk for pk in checkpoint.ids if pk not in checkpoint.done])
+        pending = [projects[pk] for pk in checkpoint.ids if pk in projects]
+        self.render(pending, checkpoint, options)
+
+    def signature(self, options):
+        """Identifica os argumentos que definem a seleção, para não continuar outra execução"""
+        selection = {
+            key: options[key] for key in ('empresa', 'all', 'force')
+        }
+        selection['since'] = str(options['since'] or '')
+        selection['until'] = str(options['until'] or '')
+        if options['csv']:
+            try:
+                with open(options['csv'], 'rb') as f:
+                    selection['csv'] = hashlib.sha256(f.read()).hexdigest()
+            except OSError as e:
+                raise CommandError(str(e))
+        return hashlib.sha256(json.dumps(selection, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def select_projects(self, options):
+        queryset = PlateProject.objects.all()
+        if options['empresa']:
+            queryset = queryset.filter(empresa__in=options['empresa'])
+        if options['since']:
+            queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(options['since'], dt_time.min)))
+        if options['until']:
+            queryset = queryset.filter(
+                created_at__lt=timezone.make_aware(datetime.combine(options['until'] + timedelta(days=1), dt_time.min))
+            )
+
+        if options['csv']:
+            projects = self.projects_from_csv(options['csv'])
+            if options['empresa'] or options['since'] or options['until']:
+                allowed = set(queryset.filter(id__in=[project.id for project in projects]).values_list('id', flat=True))
+                projects = [project for project in projects if project.id in allowed]
+        else:
+            projects = list(queryset)
+
+        if not options['force']:
+            current = {project.id for project in projects if PlateService.pdf_is_current(project)}
+            if current:
+                self.stdout.write(f"{len(current)} projeto(s) com o PDF já atualizado (use --force para renderizar mesmo assim)")
+            projects = [project for project in projects if project.id not in current]
+        return projects
+
+    def projects_from_csv(self, path):
+        """Projetos do CSV: os já cadastrados são reaproveitados e os novos são criados"""
+        try:
+            with open(path, 'rb') as f:
+                rows = PlateBulkImporter.read_csv(f.read())
+        except (OSError, BulkImportError) as e:
+            raise CommandError(str(e))
+
+        existing = {
+            (project.empresa, project.projeto): project
+            for project in PlateProject.objects.filter(
+                empresa__in={values['empresa'] for _, values in rows},
+                projeto__in={values['projeto'] for _, values in rows},
+            )
+        }
+        projects = [existing[key] for key in dict.fromkeys((v['empresa'], v['projeto']) for _, v in rows) if key in existing]
+
+        new_rows = [(line, values) for line, values in rows if (values['empresa'], values['projeto']) not in existing]
+        if new_rows:
+            results, valid = PlateBulkImporter.validate(new_rows)
+            for result in results:
+                for error in result['erros']:
+                    self.stderr.write(f"Linha {result['linha']}: {error}")
+            created = PlateBulkImporter.create(valid)
+            self.stdout.write(f"{len(created)} projeto(s) cadastrado(s) a partir do CSV")
+            projects.extend(created)
+        return projects
+
+    def render(self, projects, checkpoint, options):
+        total = len(projects)
+        if not total:
+            checkpoint.remove()
+            self.stdout.write(self.style.SUCCESS("Nada a gerar."))
+            return
+
+        processes = max(1, min(options['processes'], total))
+        self.stdout.write(f"Gerando {total} PDF(s) com {processes} processo(s)...")
+
+        rendered = []
+        failed = plates = size = 0
+        start = time.perf_counter()
+        # Os processos filhos não devem herdar as conexões abertas com o banco
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=processes)
+        try:
+            futures = {}
+            for project in projects:
+                project_data = PlateService.get_project_data(project)
+                key = PlateRenderCache.key_for(project_data, project.get_cod_envio())
+                future = pool.submit(render_admitted, project_data, project.get_cod_envio(), key)
+                futures[future] = (project, key, project_data)
+
+            for future in as_completed(futures):
+                project, key, project_data = futures[future]
+                label = f"{project.empresa}-{project.projeto} ({project.get_cod_envio()})"
+                try:
+                    _, project_size = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Erro ao gerar {label}: {e}")
+                    continue
+
+                if PlateService.attach_pdf(project, key):
+                    project.save(update_fields=['pdf_file', 'render_key'])
+                checkpoint.mark_done(project.id)
+                rendered.append(project)
+                size += project_size
+                plates += PlateLayout.for_project(project_data).plates_needed(project.total_amostras)
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f"[{len(rendered) + failed}/{total}] {label}: {project_size / 1024:.0f} KB")
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            checkpoint.save()
+            raise CommandError(
+                f"Interrompido após {len(rendered)} projeto(s); execute o mesmo comando novamente para continuar."
+            )
+        finally:
+            pool.shutdown()
+            checkpoint.save()
+            if options['send'] and rendered:
+                # Os PDFs já estão no cache: o worker apenas anexa e envia
+                PlateJobQueue.enqueue_many(rendered)
+
+        done = len(rendered)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{done} PDF(s), {plates} placa(s), {size / 1024 / 1024:.1f} MB em {elapsed:.1f} s: "
+            f"{done / elapsed:.2f} projetos/s, {plates / elapsed:.1f} placas/s"
+        )
+        if failed:
+            raise CommandError(
+                f"{failed} projeto(s) falharam; execute o mesmo comando novamente para tentar de novo."
+            )
+        checkpoint.remove()
+        self.stdout.write(self.style.SUCCESS("Concluído"))
@@ -0,0 +1,210 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from plate_app.db import configure_sqlite
+from plate_app.models import PlateProject
+
+
+def _submit_many(process_index, thread_index, submissions, results):
+    """Envia o formulário e abre a página de sucesso, como um usuário faria"""
+    client = Client()
+    stats = {'ok': 0, 'lock_errors': 0, 'errors': [], 'latencies': []}
+    for index in range(submissions):
+        data = {
+            'empresa': f"{process_index % 1000:03d}",
+            'projeto': f"L{thread_index}X{index}"[:10],
+            'total_amostras': 90,
+            'email': 'carga@example.com',
+        }
+        start = time.perf_counter()
+        try:
+            response = client.post(reverse('plate_form'), data, secure=True)
+            if response.status_code != 302:
+                stats['errors'].append(f"formulário respondeu {response.status_code}")
+                continue
+            # A página de sucesso grava (e apaga) os dados da sessão no banco
+            response = client.get(reverse('plate_success'), secure=True)
+            if response.status_code != 200:
+                stats['errors'].append(f"página de sucesso respondeu {response.status_code}")
+                continue
+        except OperationalError as e:
+            if 'locked' in str(e):
+                stats['lock_errors'] += 1
+            else:
+                stats['errors'].append(f"{type(e).__name__}: {e}")
+            continue
+        except Exception as e:
+            stats['errors'].append(f"{type(e).__name__}: {e}")
+            continue
+        finally:
+            stats['latencies'].append(time.perf_counter() - start)
+        stats['ok'] += 1
+    connections.close_all()
+    results.append(stats)
+
+
+def _read_slowly(hold, stop, results):
+    """
+    Leituras longas (relatórios, exportações, listagens do admin) enquanto
+    houver envios: cada transação mantém o lock de leitura por ``hold`` segundos
+    """
+    stats = {'ok': 0, 'lock_errors': 0, 'errors': [], 'latencies': [], 'reads': 0}
+    while not stop.is_set():
+        try:
+            with transaction.atomic():
+                list(PlateProject.objects.order_by('-created_at').values_list('id', flat=True)[:100])
+                stop.wait(hold)
+            stats['reads'] += 1
+        except OperationalError as e:
+            if 'locked' in str(e):
+                stats['lock_errors'] += 1
+            else:
+                stats['errors'].append(f"leitura: {type(e).__name__}: {e}")
+    connections.close_all()
+    results.append(stats)
+
+
+def _worker_process(process_index, threads, submissions, readers, read_hold, tuned, queue):
+    """Um processo por worker do gunicorn, com várias threads enviando ao mesmo tempo"""
+    # Os erros são contados no resumo; o traceback de cada requisição só poluiria a saída
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    if not tuned:
+        connection_created.disconnect(configure_sqlite, dispatch_uid='plate_app.configure_sqlite')
+    results = []
+    workers = [
+        threading.Thread(target=_submit_many, args=(process_index, process_index * threads + t, submissions, results))
+        for t in range(threads)
+    ]
+    stop = threading.Event()
+    reading = [threading.Thread(target=_read_slowly, args=(read_hold, stop, results)) for _ in range(readers)]
+    for thread in workers + reading:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    stop.set()
+    for thread in reading:
+        thread.join()
+    queue.put(results)
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga do banco: vários processos enviam o formulário e abrem a "
+        "página de sucesso ao mesmo tempo, enquanto outras threads fazem leituras "
+        "longas, em uma cópia temporária do SQLite, e contam os erros "
+        "\"database is locked\""
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=3, help="Processos simultâneos (workers do gunicorn)")
+        parser.add_argument('--threads', type=int, default=2, help="Threads por processo")
+        parser.add_argument('--submissions', type=int, default=50, help="Envios por thread")
+        parser.add_argument(
+            '--readers', type=int, default=1,
+            help="Threads por processo com leituras longas (0 = apenas envios)",
+        )
+        parser.add_argument(
+            '--read-hold', type=float, default=6.0,
+            help="Segundos de cada transação de leitura; acima do busy_timeout (5 s), o journal "
+                 "padrão faz as gravações falharem com \"database is locked\"",
+        )
+        parser.add_argument(
+            '--without-tuning', action='store_true',
+            help="Não aplica PLATE_SQLITE_PRAGMAS (configuração padrão do Django, para comparação)",
+        )
+        parser.add_argument('--keep', action='store_true', help="Mantém o banco temporário ao final")
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("O teste de carga é específico para o SQLite.")
+
+        tuned = not options['without_tuning']
+        directory = tempfile.mkdtemp(prefix='plate-load-')
+        path = os.path.join(directory, 'load.sqlite3')
+
+        # Todas as conexões (inclusive as dos processos filhos) passam a usar o banco temporário
+        connections.close_all()
+        connections.settings['default']['NAME'] = path
+        if not tuned:
+            connection_created.disconnect(configure_sqlite, dispatch_uid='plate_app.configure_sqlite')
+        try:
+            call_command('migrate', verbosity=0)
+            with connections['default'].cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = cursor.fetchone()[0]
+            connections.close_all()
+
+            self.stdout.write(
+                f"Banco temporário: {path} (journal_mode={journal_mode}, "
+                f"{'com' if tuned else 'sem'} PLATE_SQLITE_PRAGMAS)"
+            )
+            total = options['processes'] * options['threads'] * options['submissions']
+            self.stdout.write(
+                f"{options['processes']} processo(s) x {options['threads']} thread(s) x "
+                f"{options['submissions']} envio(s) = {total} envios; "
+                f"{options['readers']} leitor(es) por processo com transações de {options['read_hold']:g} s"
+            )
+
+            ctx = multiprocessing.get_context('fork')
+            queue = ctx.Queue()
+            processes = [
+                ctx.Process(
+                    target=_worker_process,
+                    args=(
+                        index, options['threads'], options['submissions'],
+                        options['readers'], options['read_hold'], tuned, queue,
+                    ),
+                )
+                for index in range(options['processes'])
+            ]
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            results = [stats for _ in processes for stats in queue.get()]
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            connections.close_all()
+            if options['keep']:
+                self.stdout.write(f"Banco mantido em {path}")
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+            if not tuned:
+                connection_created.connect(configure_sqlite, dispatch_uid='plate_app.configure_sqlite')
+
+        ok = sum(stats['ok'] for stats in results)
+        reads = sum(stats.get('reads', 0) for stats in results)
+        lock_errors = sum(stats['lock_errors'] for stats in results)
+        errors = [error for stats in results for error in stats['errors']]
+        latencies = sorted(latency for stats in results for latency in stats['latencies'])
+
+        self.stdout.write(f"Concluídos: {ok}/{total} em {elapsed:.1f} s ({ok / elapsed:.1f} envios/s)")
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f"Latência por envio: mediana {statistics.median(latencies) * 1000:.1f} ms, "
+                f"p95 {p95 * 1000:.1f} ms, máxima {latencies[-1] * 1000:.1f} ms"
+            )
+        if options['readers']:
+            self.stdout.write(f"Leituras longas concluídas: {reads}")
+        self.stdout.write(f"Erros \"database is locked\": {lock_errors}")
+        for error in sorted(set(errors))[:10]:
+            self.stdout.write(f"  outro erro: {error}")
+
+        if lock_errors or errors:
+            raise CommandError(f"{lock_errors} erro(s) de lock e {len(errors)} outro(s) erro(s)")
+        self.stdout.write(self.style.SUCCESS("Nenhum erro de lock"))
@@ -0,0 +1,106 @@
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from plate_app.render_cache import PlateRenderCache
+
+LEGACY_DIRECTORY = 'pdfs'
+SIZE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMG]?)B?$', re.IGNORECASE)
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(value):
+    """'500M', '2G', '1048576' -> bytes"""
+    match = SIZE_RE.match(value.strip())
+    if not match:
+        raise CommandError(f"Tamanho inválido: {value} (use por exemplo 800M ou 2G)")
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+
+def format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Mostra o espaço ocupado pelos PDFs em MEDIA_ROOT e aplica o limite do "
+        "cache (PLATE_PDF_CACHE_MAX_BYTES), removendo os PDFs usados há mais tempo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enforce', action='store_true', help="Remove PDFs até o total caber no limite")
+        parser.add_argument('--max-bytes', type=parse_size, help="Limite a aplicar (ex.: 800M); padrão: PLATE_PDF_CACHE_MAX_BYTES")
+        parser.add_argument(
+            '--min-age', type=int, default=getattr(settings, 'PLATE_PDF_CACHE_MIN_AGE', 300),
+            help="Segundos desde o último uso abaixo dos quais um PDF não é removido",
+        )
+        parser.add_argument(
+            '--purge-legacy', action='store_true',
+            help=f"Remove os PDFs antigos de MEDIA_ROOT/{LEGACY_DIRECTORY}/ (são renderizados de novo quando pedidos)",
+        )
+
+    def handle(self, *args, **options):
+        max_bytes = options['max_bytes'] or getattr(settings, 'PLATE_PDF_CACHE_MAX_BYTES', None)
+
+        entries = PlateRenderCache.entries(default_storage)
+        total = sum(size for _, size, _ in entries)
+        self.stdout.write(f"Cache ({PlateRenderCache.DIRECTORY}/): {len(entries)} PDF(s), {format_size(total)}")
+        if entries:
+            now = time.time()
+            self.stdout.write(
+                f"  último uso: mais antigo há {(now - entries[0][2]) / 3600:.1f} h, "
+                f"mais recente há {(now - entries[-1][2]) / 3600:.1f} h"
+            )
+        if max_bytes:
+            self.stdout.write(f"  limite: {format_size(max_bytes)} ({total / max_bytes:.0%} em uso)")
+        else:
+            self.stdout.write("  limite: nenhum (PLATE_PDF_CACHE_MAX_BYTES não definido)")
+
+        legacy = self.legacy_files()
+        if legacy:
+            self.stdout.write(
+                f"Arquivos antigos ({LEGACY_DIRECTORY}/): {len(legacy)} PDF(s), "
+                f"{format_size(sum(size for _, size, _ in legacy))}"
+            )
+
+        if options['enforce']:
+            if not max_bytes:
+                raise CommandError("Nenhum limite definido: use --max-bytes ou PLATE_PDF_CACHE_MAX_BYTES.")
+            removed, freed = PlateRenderCache.enforce_budget(default_storage, max_bytes, options['min_age'])
+            self.stdout.write(self.style.SUCCESS(f"{removed} PDF(s) removido(s), {format_size(freed)} liberados"))
+
+        if options['purge_legacy']:
+            limit = time.time() - options['min_age']
+            removed = freed = 0
+            for path, size, last_used in legacy:
+                if last_used > limit:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += size
+            self.stdout.write(self.style.SUCCESS(
+                f"{removed} arquivo(s) antigo(s) removido(s), {format_size(freed)} liberados"
+            ))
+
+    def legacy_files(self):
+        root = default_storage.path(LEGACY_DIRECTORY)
+        files = []
+        if os.path.isdir(root):
+            with os.scandir(root) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith('.pdf'):
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+        return files
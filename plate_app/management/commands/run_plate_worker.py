@@ -0,0 +1,92 @@
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from plate_app import mail
+from plate_app.jobs import PlateJobQueue
+
+# Segundos entre as verificações de tarefas abandonadas enquanto o worker roda
+STALE_SWEEP_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de tarefas de geração de PDF e envio de email"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'PLATE_WORKER_CONCURRENCY', 2),
+            help=(
+                "Número de tarefas processadas em paralelo (threads); a renderização usa um "
+                "núcleo por processo, então para usar mais núcleos inicie vários processos "
+                "(deploy.sh: WORKER_PROCESSES)"
+            ),
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help="Espera em segundos entre consultas quando a fila está vazia",
+        )
+        parser.add_argument(
+            '--stale-timeout', type=int,
+            default=getattr(settings, 'PLATE_JOB_STALE_TIMEOUT', 600),
+            help="Segundos após os quais uma tarefa 'running' é considerada abandonada",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Processa as tarefas pendentes e encerra",
+        )
+
+    def requeue_stale(self, timeout):
+        requeued, failed = PlateJobQueue.requeue_stale(timeout)
+        if requeued:
+            self.stdout.write(f"{requeued} tarefa(s) abandonada(s) devolvida(s) para a fila")
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f"{failed} tarefa(s) abandonada(s) marcada(s) como falha (tentativas esgotadas)"
+            ))
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Encerrando após concluir as tarefas em andamento...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.requeue_stale(options['stale_timeout'])
+        last_sweep = time.monotonic()
+
+        base_name = PlateJobQueue.worker_name()
+        results = [0] * concurrency
+
+        def loop(index):
+            results[index] = PlateJobQueue.work(
+                worker=f"{base_name}/{index}",
+                stop=stop,
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+
+        self.stdout.write(f"Worker {base_name} iniciado com {concurrency} thread(s)")
+        threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        # join com timeout para que os sinais continuem sendo tratados; entre
+        # um e outro, tarefas de workers que morreram voltam para a fila
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1.0)
+            if time.monotonic() - last_sweep >= STALE_SWEEP_INTERVAL and not stop.is_set():
+                self.requeue_stale(options['stale_timeout'])
+                last_sweep = time.monotonic()
+
+        # Fecha as conexões SMTP mantidas abertas pelo mailer
+        mail.reset()
+
+        self.stdout.write(self.style.SUCCESS(f"{sum(results)} tarefa(s) processada(s)"))
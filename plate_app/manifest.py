@@ -0,0 +1,66 @@
+import csv
+import json
+
+from .utils.layout import PlateLayout
+
+FIELDS = ('placa', 'poco', 'amostra', 'controle')
+
+
+def iter_manifest(project_data, layout=None):
+    """
+    Gera o mapa amostra -> placa/poço linha a linha
+
+    Cada placa lista seus poços de controle e os poços com amostra, em ordem
+    de leitura (A1, A2, ..., H12 ou P24); poços vazios da última placa são omitidos.
+    Nenhuma lista é montada, então a memória não depende do tamanho do projeto.
+    """
+    layout = layout or PlateLayout.for_project(project_data)
+    total_samples = project_data['total_amostras']
+    prefix = f"{project_data['empresa']}-{project_data['projeto']}"
+
+    for plate in range(1, layout.plates_needed(total_samples) + 1):
+        plate_id = f"{prefix}-{plate:03d}"
+        for index, well_id in enumerate(layout.well_ids):
+            if layout.control_mask[index]:
+                yield {'placa': plate_id, 'poco': well_id, 'amostra': None, 'controle': True}
+                continue
+            sample = layout.sample_at(plate, index)
+            if sample > total_samples:
+                continue
+            yield {'placa': plate_id, 'poco': well_id, 'amostra': sample, 'controle': False}
+
+
+class _Echo:
+    """Pseudo-arquivo que devolve o que é escrito, para o csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_manifest_csv(project_data, layout=None):
+    """Manifesto em CSV, uma linha de texto por vez"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in iter_manifest(project_data, layout):
+        yield writer.writerow((
+            row['placa'],
+            row['poco'],
+            '' if row['amostra'] is None else row['amostra'],
+            1 if row['controle'] else 0,
+        ))
+
+
+def iter_manifest_json(project_data, layout=None):
+    """Manifesto como um array JSON, emitido elemento a elemento"""
+    yield '['
+    separator = '\n'
+    for row in iter_manifest(project_data, layout):
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+FORMATS = {
+    'csv': (iter_manifest_csv, 'text/csv; charset=utf-8'),
+    'json': (iter_manifest_json, 'application/json'),
+}
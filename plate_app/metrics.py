@@ -0,0 +1,393 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import multiprocessing.util
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Limites (em segundos) dos buckets do histograma de duração
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Faixas de total de amostras usadas como rótulo dos histogramas
+SAMPLE_BUCKETS = (1000, 4500, 20000, 40000)
+
+# Arquivo de PLATE_METRICS_DIR com a soma dos processos já encerrados
+TOTALS_FILE = 'totals.json'
+
+HELP = {
+    'plate_stage_duration_seconds': ('histogram', "Duração de cada etapa do pipeline, por faixa de amostras"),
+    'plate_renders_in_flight': ('gauge', "Renderizações de PDF em andamento"),
+    'plate_email_failures_total': ('counter', "Falhas no envio de emails com o PDF"),
+    'plate_admission_rejected_total': ('counter', "Pedidos recusados pelo controle de admissão (ocupado)"),
+}
+
+
+def sample_bucket(total_samples):
+    """Rótulo da faixa de amostras (ex.: '<=4500')"""
+    if total_samples is None:
+        return 'n/a'
+    for limit in SAMPLE_BUCKETS:
+        if total_samples <= limit:
+            return f"<={limit}"
+    return f">{SAMPLE_BUCKETS[-1]}"
+
+
+class MetricsRegistry:
+    """
+    Métricas do processo atual
+
+    Cada processo (workers do gunicorn, run_plate_worker) mantém seus próprios
+    valores e, quando PLATE_METRICS_DIR está definido, grava-os em um arquivo
+    próprio nesse diretório; o endpoint /metrics soma os arquivos de todos os
+    processos. Processos que não registram nada (ex.: manage.py check) não
+    gravam arquivo. Eventos dentro do intervalo entre gravações são gravados
+    ao fim dele, mesmo que nenhum outro evento chegue.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Começa do zero (processo filho após um fork), com um arquivo novo"""
+        self.lock = threading.Lock()
+        # Uma gravação por vez: um snapshot antigo não sobrescreve um mais novo
+        self.flush_lock = threading.Lock()
+        # Gravação adiada para o fim do intervalo (threading.Timer), se houver
+        self.timer = None
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.last_flush = 0.0
+        # Valores ainda não gravados em PLATE_METRICS_DIR
+        self.dirty = False
+        # O nome do arquivo não é só o pid: um pid reutilizado não sobrescreve
+        # o arquivo de um processo encerrado antes de ele ser somado aos totais
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for index, limit in enumerate(DURATION_BUCKETS):
+                if value <= limit:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+            self.dirty = True
+        self.flush()
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.dirty = True
+        self.flush()
+
+    def add_gauge(self, name, amount, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+            self.dirty = True
+        # Medidores mudam de sentido rapidamente: gravar sempre
+        self.flush(force=True)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'name': self.name,
+                'histograms': [[name, dict(labels), list(h[0]), h[1], h[2]] for (name, labels), h in self.histograms.items()],
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, dict(labels), value] for (name, labels), value in self.gauges.items()],
+            }
+
+    def flush(self, force=False):
+        """
+        Grava os valores do processo em PLATE_METRICS_DIR (no máximo uma vez
+        por intervalo e só quando algo mudou desde a última gravação)
+        """
+        if not self.dirty:
+            return
+        directory = getattr(settings, 'PLATE_METRICS_DIR', None)
+        if not directory:
+            # Sem diretório não há o que gravar, nem agora nem ao encerrar
+            self.dirty = False
+            return
+        interval = getattr(settings, 'PLATE_METRICS_FLUSH_INTERVAL', 1.0)
+        with self.flush_lock:
+            now = time.monotonic()
+            if not force and now - self.last_flush < interval:
+                self.schedule_flush(interval - (now - self.last_flush))
+                return
+            self.last_flush = now
+            self.dirty = False
+            try:
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, self.name)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning("Erro ao gravar métricas em %s: %s", directory, e)
+
+    def schedule_flush(self, delay):
+        """Grava ao fim do intervalo o que ficou pendente (um timer por vez)"""
+        with self.lock:
+            if self.timer is not None:
+                return
+            self.timer = threading.Timer(delay, self._deferred_flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _deferred_flush(self):
+        with self.lock:
+            self.timer = None
+        self.flush(force=True)
+
+
+def _flush_at_process_exit(registry):
+    multiprocessing.util.Finalize(None, registry.flush, kwargs={'force': True}, exitpriority=0)
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush, force=True)
+# Um processo filho (workers do gunicorn, pools de renderização) não herda os valores do pai
+os.register_at_fork(after_in_child=registry.reset)
+# Processos do multiprocessing encerram sem executar o atexit
+multiprocessing.util.register_after_fork(registry, _flush_at_process_exit)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _directory_lock(directory):
+    """Bloqueio exclusivo de PLATE_METRICS_DIR, para somar e remover arquivos"""
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def aggregate(snapshots):
+    """
+    Soma os snapshots
+
+    Returns:
+        (histogramas, contadores, medidores): dicionários (nome, rótulos) -> valor
+    """
+    histograms, counters, gauges = {}, {}, {}
+    for snapshot in snapshots:
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            current = histograms.setdefault(key, [[0] * len(DURATION_BUCKETS), 0.0, 0])
+            for index, value in enumerate(buckets[:len(DURATION_BUCKETS)]):
+                current[0][index] += value
+            current[1] += total
+            current[2] += count
+        for target, entries in ((counters, snapshot['counters']), (gauges, snapshot['gauges'])):
+            for name, labels, value in entries:
+                key = (name, tuple(sorted(labels.items())))
+                target[key] = target.get(key, 0) + value
+    return histograms, counters, gauges
+
+
+def _totals_snapshot(histograms, counters):
+    return {
+        'histograms': [[name, dict(labels), h[0], h[1], h[2]] for (name, labels), h in histograms.items()],
+        'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        'gauges': [],
+    }
+
+
+def read_directory(directory):
+    """
+    Snapshots gravados em PLATE_METRICS_DIR pelos outros processos
+
+    Os arquivos de processos encerrados são somados em TOTALS_FILE e
+    removidos: os contadores continuam acumulados entre reinícios dos workers
+    e o diretório guarda apenas um arquivo por processo vivo, mais os totais.
+    Tudo é lido com o diretório bloqueado, para que uma consulta simultânea
+    não conte o mesmo arquivo duas vezes (ou nenhuma).
+
+    Returns:
+        Lista de snapshots: os totais e um por processo vivo
+    """
+    totals_path = os.path.join(directory, TOTALS_FILE)
+    with _directory_lock(directory):
+        totals = _read_snapshot(totals_path) or {'histograms': [], 'counters': [], 'gauges': []}
+        live, dead = [], []
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            name = os.path.basename(path)
+            if name in (TOTALS_FILE, registry.name):
+                continue
+            snapshot = _read_snapshot(path)
+            if snapshot is not None and pid_alive(snapshot.get('pid', 0)):
+                live.append(snapshot)
+                continue
+            dead.append(path)
+            if snapshot is not None:
+                # Medidores (ex.: renderizações em andamento) só valem para processos vivos
+                snapshot['gauges'] = []
+                histograms, counters, _ = aggregate([totals, snapshot])
+                totals = _totals_snapshot(histograms, counters)
+
+        if dead:
+            # Totais gravados antes de remover: uma falha no meio não perde contagens
+            _write_snapshot(totals_path, totals)
+            for path in dead:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning("Erro ao remover as métricas de %s: %s", path, e)
+    return [totals] + live
+
+
+def collect():
+    """
+    Snapshots de todos os processos
+
+    Contadores e histogramas de processos encerrados continuam contando (por
+    meio de TOTALS_FILE); medidores só valem para processos vivos.
+    """
+    snapshots = [registry.snapshot()]
+    directory = getattr(settings, 'PLATE_METRICS_DIR', None)
+    if directory and os.path.isdir(directory):
+        snapshots.extend(read_directory(directory))
+    return snapshots
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render_prometheus():
+    """Métricas agregadas no formato de texto do Prometheus"""
+    histograms, counters, gauges = aggregate(collect())
+
+    # Métricas sem observações também aparecem, com valor zero
+    for name, (kind, _) in HELP.items():
+        target = {'counter': counters, 'gauge': gauges}.get(kind)
+        if target is not None and not any(key[0] == name for key in target):
+            target[(name, ())] = 0
+
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'histogram':
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                labels = dict(labels)
+                for limit, value in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': limit})} {value}")
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        else:
+            values = counters if kind == 'counter' else gauges
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def span(stage, total_samples=None, **fields):
+    """
+    Mede a duração de uma etapa do pipeline
+
+    Registra a duração no histograma ``plate_stage_duration_seconds`` e emite
+    um log estruturado (JSON) no logger ``plate_app.metrics``. O dicionário
+    devolvido pode receber campos adicionais para o log.
+
+    Uso:
+        with metrics.span('pdf_render', project.total_amostras, cod_envio=cod):
+            ...
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield fields
+    except BaseException:
+        status = 'erro'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe(
+            'plate_stage_duration_seconds', elapsed,
+            stage=stage, amostras=sample_bucket(total_samples), status=status
+        )
+        logger.info(json.dumps({
+            'evento': 'span',
+            'etapa': stage,
+            'duracao_ms': round(elapsed * 1000, 3),
+            'status': status,
+            'total_amostras': total_samples,
+            **fields,
+        }, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def in_flight(name='plate_renders_in_flight'):
+    """Incrementa um medidor enquanto o bloco executa"""
+    registry.add_gauge(name, 1)
+    try:
+        yield
+    finally:
+        registry.add_gauge(name, -1)
+
+
+def email_failed(reason):
+    registry.inc('plate_email_failures_total', reason=reason)
+
+
+def admission_rejected(stage, small):
+    registry.inc('plate_admission_rejected_total', stage=stage, tamanho='pequeno' if small else 'grande')
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:03
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plate_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='plateproject',
+            name='total_amostras',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(90, message='O número mínimo de amostras é 90.'), django.core.validators.MaxValueValidator(40000, message='O número máximo de amostras é 40000.')], verbose_name='Total de Amostras'),
+        ),
+        migrations.CreateModel(
+            name='PlateJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('render_send', 'Gerar PDF e enviar por email')], default='render_send', max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('pending', 'Na fila'), ('running', 'Em processamento'), ('done', 'Concluída'), ('failed', 'Falhou')], default='pending', max_length=10, verbose_name='Situação')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='Máximo de Tentativas')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Executar a partir de')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='plate_app.plateproject', verbose_name='Projeto')),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Geração',
+                'verbose_name_plural': 'Tarefas de Geração',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['status', 'run_after'], name='plate_job_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plate_app', '0002_platejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plateproject',
+            name='render_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='Chave de Renderização'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+def backfill_cod_envio(apps, schema_editor):
+    """
+    Preenche o código de envio dos projetos existentes
+
+    Mantém o código no formato antigo (ano + dia do ano sem zeros + id), que já
+    foi enviado por email aos clientes. Quando o formato antigo gera códigos
+    repetidos, os projetos seguintes recebem o formato novo, com o dia do ano
+    em 3 dígitos.
+    """
+    PlateProject = apps.get_model('plate_app', 'PlateProject')
+    used = set(
+        PlateProject.objects.exclude(cod_envio=None).values_list('cod_envio', flat=True)
+    )
+    for project in PlateProject.objects.filter(cod_envio=None).order_by('id'):
+        year = str(project.created_at.year)[-2:]
+        day_of_year = project.created_at.timetuple().tm_yday
+        sequence = str(project.id).zfill(2)
+
+        code = f"{year}{day_of_year}{sequence}"
+        if code in used:
+            code = f"{year}{day_of_year:03d}{sequence}"
+        candidate, suffix = code, 0
+        while candidate in used:
+            suffix += 1
+            candidate = f"{code}{suffix}"
+
+        used.add(candidate)
+        PlateProject.objects.filter(pk=project.pk).update(cod_envio=candidate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plate_app', '0003_plateproject_render_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plateproject',
+            name='cod_envio',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True, unique=True, verbose_name='Código de Envio'),
+        ),
+        migrations.RunPython(backfill_cod_envio, migrations.RunPython.noop),
+    ]
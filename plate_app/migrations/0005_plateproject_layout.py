@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plate_app', '0004_plateproject_cod_envio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plateproject',
+            name='formato_placa',
+            field=models.CharField(choices=[('96', '96 poços (8 x 12)'), ('384', '384 poços (16 x 24)')], default='96', max_length=10, verbose_name='Formato da Placa'),
+        ),
+        migrations.AddField(
+            model_name='plateproject',
+            name='layout_pagina',
+            field=models.CharField(choices=[('a4-2', 'A4 retrato, 2 placas por página'), ('a4-4', 'A4 paisagem, 4 placas por página (reduzidas)'), ('a3-6', 'A3 retrato, 6 placas por página')], default='a4-2', max_length=10, verbose_name='Placas por Página'),
+        ),
+        migrations.AddField(
+            model_name='plateproject',
+            name='pocos_controle',
+            field=models.CharField(blank=True, help_text='Ex.: A1, B1, C1 (vazio = A1 a F1)', max_length=200, verbose_name='Poços de Controle'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plate_app', '0005_plateproject_layout'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plateproject',
+            index=models.Index(fields=['-created_at'], name='plate_project_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plateproject',
+            index=models.Index(fields=['email'], name='plate_project_email_idx'),
+        ),
+    ]
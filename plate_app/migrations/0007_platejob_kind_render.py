@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plate_app', '0006_plateproject_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='platejob',
+            name='kind',
+            field=models.CharField(choices=[('render_send', 'Gerar PDF e enviar por email'), ('render', 'Regerar PDF')], default='render_send', max_length=20, verbose_name='Tipo'),
+        ),
+    ]
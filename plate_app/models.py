@@ -2,10 +2,16 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 import uuid
 import os
 
+from .utils.layout import (
+    DEFAULT_PAGE_LAYOUT, DEFAULT_PLATE_FORMAT, PAGE_LAYOUTS, PLATE_FORMATS, PlateLayout, parse_control_wells,
+)
+
 def pdf_upload_path(instance, filename):
     """Gera um caminho único para salvar os arquivos PDF"""
     ext = filename.split('.')[-1]
@@ -24,22 +30,155 @@ class PlateProject(models.Model):
         verbose_name="Total de Amostras"
     )
     email = models.EmailField(verbose_name="Email para Envio")
+    formato_placa = models.CharField(
+        max_length=10,
+        choices=[(name, spec['label']) for name, spec in PLATE_FORMATS.items()],
+        default=DEFAULT_PLATE_FORMAT,
+        verbose_name="Formato da Placa"
+    )
+    layout_pagina = models.CharField(
+        max_length=10,
+        choices=[(name, layout.label) for name, layout in PAGE_LAYOUTS.items()],
+        default=DEFAULT_PAGE_LAYOUT,
+        verbose_name="Placas por Página"
+    )
+    pocos_controle = models.CharField(
+        max_length=200,
+        blank=True,
+        help_text="Ex.: A1, B1, C1 (vazio = A1 a F1)",
+        verbose_name="Poços de Controle"
+    )
     pdf_file = models.FileField(upload_to=pdf_upload_path, blank=True, null=True)
+    render_key = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="Chave de Renderização"
+    )
+    cod_envio = models.CharField(
+        max_length=20,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Código de Envio"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name = "Projeto de Placas"
         verbose_name_plural = "Projetos de Placas"
         unique_together = ('empresa', 'projeto')  # Impede duplicação de empresa+projeto
+        indexes = [
+            # Ordenação padrão e filtro por data do admin
+            models.Index(fields=['-created_at'], name='plate_project_created_idx'),
+            # Buscas e filtros por email
+            models.Index(fields=['email'], name='plate_project_email_idx'),
+        ]
     
     def __str__(self):
         return f"{self.empresa}-{self.projeto} ({self.total_amostras} amostras)"
     
+    def clean(self):
+        """Os poços de controle precisam existir no formato escolhido e deixar poços para amostras"""
+        super().clean()
+        if self.formato_placa not in PLATE_FORMATS:
+            return  # informado pela validação das opções do campo
+        try:
+            PlateLayout.get(self.formato_placa, parse_control_wells(self.pocos_controle))
+        except ValueError as e:
+            raise ValidationError({'pocos_controle': str(e)})
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # O código depende do id, portanto só pode ser atribuído após o INSERT
+        if not self.cod_envio:
+            self.assign_cod_envio()
+    
+    def build_cod_envio(self):
+        """
+        Monta o código de envio: ano (2 dígitos) + dia do ano (3 dígitos) + id
+        
+        O prefixo tem largura fixa e o id é único, portanto dois projetos nunca
+        recebem o mesmo código por esta regra.
+        """
+        year = str(self.created_at.year)[-2:]
+        day_of_year = self.created_at.timetuple().tm_yday
+        sequence = str(self.id).zfill(2)
+        return f"{year}{day_of_year:03d}{sequence}"
+    
+    def assign_cod_envio(self):
+        """Atribui e persiste o código de envio de um projeto já salvo"""
+        code = self.build_cod_envio()
+        candidate, suffix = code, 0
+        # Códigos antigos preservados pela migração usavam outro formato e, em
+        # teoria, podem coincidir com um código novo; nesse caso usa-se um sufixo
+        while PlateProject.objects.filter(cod_envio=candidate).exclude(pk=self.pk).exists():
+            suffix += 1
+            candidate = f"{code}{suffix}"
+        PlateProject.objects.filter(pk=self.pk).update(cod_envio=candidate)
+        self.cod_envio = candidate
+        return candidate
+    
     def get_cod_envio(self):
-        """Gera o código de envio baseado na data de criação"""
-        if self.created_at:
-            year = str(self.created_at.year)[-2:]
-            day_of_year = self.created_at.timetuple().tm_yday
-            sequence = str(self.id).zfill(2)
-            return f"{year}{day_of_year}{sequence}"
-        return "000000"
\ No newline at end of file
+        """Retorna o código de envio do projeto"""
+        if self.cod_envio:
+            return self.cod_envio
+        return "000000"
+
+
+class PlateJob(models.Model):
+    """Tarefa de geração/envio de PDF processada fora do ciclo HTTP"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Na fila'),
+        (STATUS_RUNNING, 'Em processamento'),
+        (STATUS_DONE, 'Concluída'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    KIND_RENDER_SEND = 'render_send'
+    KIND_RENDER = 'render'
+    KIND_CHOICES = [
+        (KIND_RENDER_SEND, 'Gerar PDF e enviar por email'),
+        (KIND_RENDER, 'Regerar PDF'),
+    ]
+
+    project = models.ForeignKey(
+        PlateProject,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name="Projeto"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_RENDER_SEND, verbose_name="Tipo")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Situação")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Máximo de Tentativas")
+    last_error = models.TextField(blank=True, verbose_name="Último Erro")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Executar a partir de")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Worker")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Tarefa de Geração"
+        verbose_name_plural = "Tarefas de Geração"
+        ordering = ('-created_at',)
+        indexes = [
+            # Consulta usada pelo worker para encontrar a próxima tarefa
+            models.Index(fields=['status', 'run_after'], name='plate_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.project.empresa}-{self.project.projeto} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
@@ -0,0 +1,106 @@
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .render_cache import PlateRenderCache
+from .utils.layout import PageLayout, PlateLayout
+
+# Incrementar sempre que o SVG gerado mudar, para invalidar caches e ETags
+VERSION = 1
+
+# Espaço acima do contorno para o identificador da placa, em mm
+TITLE_HEIGHT = 9.0
+PT = 0.352777778  # mm por ponto
+
+# Atributos de apresentação (e não CSS) para que qualquer visualizador de SVG
+# mostre o mapa corretamente
+TEXT = 'font-family="Helvetica,Arial,sans-serif" text-anchor="middle"'
+# Deslocamento da linha de base para centralizar verticalmente, em frações do corpo
+BASELINE = 0.35
+
+
+def preview_etag(project_data, cod_envio, plate):
+    """
+    ETag forte da prévia de uma placa
+
+    Derivada das mesmas entradas da chave de renderização do PDF (sem o modo
+    compacto, que não altera a prévia), portanto muda junto com o projeto.
+    """
+    render_key = PlateRenderCache.key_for(project_data, cod_envio, compact=False)
+    digest = hashlib.sha256(f"{render_key}:{VERSION}:{plate}".encode('ascii')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def render_plate_svg(project_data, plate, layout=None):
+    """
+    Mapa de uma placa em SVG, gerado diretamente da geometria do layout
+
+    Mesma disposição da placa no PDF (cabeçalhos, poços de controle em
+    vermelho e números das amostras), em milímetros, sem renderizar o PDF.
+    """
+    layout = layout or PlateLayout.for_project(project_data)
+    total_samples = project_data['total_amostras']
+    first, count = layout.plate_samples(plate, total_samples)
+    plate_id = f"{project_data['empresa']}-{project_data['projeto']}-{plate:03d}"
+
+    width = PageLayout.BLOCK_WIDTH
+    height = PageLayout.BLOCK_TOP + TITLE_HEIGHT
+    pitch = layout.pitch
+    header_size = 7 * PT * pitch / 9
+    number_size = 6 * PT * pitch / 9
+    # Centro do poço A1 em coordenadas SVG (eixo y para baixo)
+    x0 = layout.a1_x
+    y0 = TITLE_HEIGHT + PageLayout.BLOCK_TOP - layout.a1_y
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width:g} {height:g}" '
+        f'width="{width:g}mm" height="{height:g}mm">',
+        f'<title>{escape(plate_id)}</title>',
+        f'<text x="2" y="{TITLE_HEIGHT / 2 + 6 * BASELINE:g}" font-family="Courier,monospace" font-size="6">'
+        f'{escape(plate_id)}</text>',
+        f'<rect x="0.2" y="{TITLE_HEIGHT:g}" width="{width - 0.4:g}" height="{PageLayout.BLOCK_TOP - 0.2:g}" '
+        f'rx="5" fill="#fff" stroke="#000" stroke-width="0.35"/>',
+        f'<g {TEXT} font-size="{header_size:.2f}">',
+    ]
+    for column in range(layout.columns):
+        parts.append(f'<text x="{x0 + pitch * column:.2f}" y="{y0 - pitch * 0.8 + header_size * BASELINE:.2f}">{column + 1:02d}</text>')
+    for row, label in enumerate(layout.row_labels):
+        parts.append(f'<text x="{x0 - pitch * 8 / 9:.2f}" y="{y0 + pitch * row + header_size * BASELINE:.2f}">{label}</text>')
+    parts.append('</g>')
+
+    # Poços: brancos para amostras, vermelhos para controles
+    radius = f"{layout.radius:g}"
+    for fill, control in (('#fff', 0), ('#f00', 1)):
+        parts.append(f'<g fill="{fill}" stroke="#000" stroke-width="0.25">')
+        for index in range(layout.well_count):
+            if layout.control_mask[index] == control:
+                row, column = divmod(index, layout.columns)
+                parts.append(f'<circle cx="{x0 + pitch * column:.2f}" cy="{y0 + pitch * row:.2f}" r="{radius}"/>')
+        parts.append('</g>')
+
+    # Números das amostras
+    parts.append(f'<g {TEXT} font-size="{number_size:.2f}">')
+    for position in range(count):
+        row, column = divmod(layout.sample_wells[position], layout.columns)
+        parts.append(f'<text x="{x0 + pitch * column:.2f}" y="{y0 + pitch * row + number_size * BASELINE:.2f}">{first + position}</text>')
+    parts.append('</g></svg>\n')
+    return ''.join(parts)
+
+
+def get_plate_svg(project_data, cod_envio, plate, etag=None):
+    """
+    SVG da placa a partir do cache (PLATE_PREVIEW_CACHE), gerado na primeira consulta
+
+    Os projetos não mudam depois de criados, então cada (projeto, placa) é
+    gerado uma única vez enquanto estiver no cache.
+    """
+    etag = etag or preview_etag(project_data, cod_envio, plate)
+    cache = caches[getattr(settings, 'PLATE_PREVIEW_CACHE', 'default')]
+    key = 'plate_preview:' + etag.strip('"')
+    svg = cache.get(key)
+    if svg is None:
+        svg = render_plate_svg(project_data, plate)
+        cache.set(key, svg, getattr(settings, 'PLATE_PREVIEW_CACHE_TIMEOUT', 24 * 3600))
+    return svg
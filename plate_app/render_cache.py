@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .utils.generator import PlateTemplateGenerator
+from .utils.layout import DEFAULT_CONTROL_WELLS, DEFAULT_PAGE_LAYOUT, DEFAULT_PLATE_FORMAT, parse_control_wells
+
+logger = logging.getLogger(__name__)
+
+
+class PlateRenderCache:
+    """Cache de PDFs endereçado pelo conteúdo das entradas da renderização.
+
+    Como ``generate_pdf`` é determinístico, o hash das entradas identifica os
+    bytes do PDF; um arquivo já armazenado com esse hash pode ser reutilizado
+    sem renderizar novamente.
+
+    Com PLATE_PDF_CACHE_MAX_BYTES definido, o diretório funciona como um
+    cache limitado: os arquivos usados há mais tempo são removidos quando o
+    total ultrapassa o limite, e o PDF é renderizado de novo quando pedido
+    (o projeto guarda todos os parâmetros necessários). O último uso é
+    registrado no atime do arquivo, preservando o mtime usado no Last-Modified.
+    """
+
+    DIRECTORY = 'renders'
+
+    @staticmethod
+    def key_for(project_data, cod_envio, compact=None):
+        """Hash SHA-256 das entradas que determinam o PDF"""
+        if compact is None:
+            compact = getattr(settings, 'PLATE_PDF_COMPACT', False)
+        payload = {
+            'version': PlateTemplateGenerator.VERSION,
+            'empresa': project_data['empresa'],
+            'projeto': project_data['projeto'],
+            'total_amostras': project_data['total_amostras'],
+            'cod_envio': cod_envio,
+        }
+        # Só entram no hash quando diferentes do padrão, preservando as chaves dos PDFs já armazenados
+        if compact:
+            payload['compact'] = True
+        plate_format = project_data.get('formato_placa') or DEFAULT_PLATE_FORMAT
+        if plate_format != DEFAULT_PLATE_FORMAT:
+            payload['formato_placa'] = plate_format
+        page_layout = project_data.get('layout_pagina') or DEFAULT_PAGE_LAYOUT
+        if page_layout != DEFAULT_PAGE_LAYOUT:
+            payload['layout_pagina'] = page_layout
+        control_wells = parse_control_wells(project_data.get('pocos_controle'))
+        if control_wells != DEFAULT_CONTROL_WELLS:
+            payload['pocos_controle'] = sorted(control_wells)
+        encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def name_for(key):
+        """Nome do arquivo no storage para a chave informada"""
+        return f"{PlateRenderCache.DIRECTORY}/{key[:2]}/{key}.pdf"
+
+    @staticmethod
+    def lookup(storage, key):
+        """Retorna o nome armazenado para a chave ou None se ainda não existir"""
+        name = PlateRenderCache.name_for(key)
+        if not storage.exists(name):
+            return None
+        PlateRenderCache.touch(storage, name)
+        return name
+
+    @staticmethod
+    def touch(storage, name):
+        """Registra o uso do arquivo agora (ordem de remoção do LRU)"""
+        try:
+            path = storage.path(name)
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except (OSError, NotImplementedError):
+            pass
+
+    @staticmethod
+    def store(storage, key, content):
+        """
+        Armazena o PDF sob o nome derivado da chave
+
+        Se outro processo gravou a mesma chave ao mesmo tempo, o storage cria
+        um nome alternativo; como o conteúdo é idêntico, a cópia é descartada.
+        """
+        name = PlateRenderCache.name_for(key)
+        saved = storage.save(name, content)
+        if saved != name:
+            storage.delete(saved)
+        if getattr(settings, 'PLATE_PDF_CACHE_MAX_BYTES', None):
+            PlateRenderCache.enforce_budget(storage)
+        return name
+
+    @staticmethod
+    @contextmanager
+    def writer(storage, key):
+        """
+        Arquivo aberto para gravar o PDF da chave diretamente no storage
+
+        O PDF é gravado em um arquivo temporário no mesmo diretório e movido
+        para o nome final (os.replace) ao fim do bloco; leitores nunca veem
+        um arquivo incompleto, e um arquivo já mapeado em memória (anexo de
+        email, download em andamento) continua válido mesmo que outro
+        processo grave a mesma chave. Exige um storage com ``path()``.
+
+        Yields:
+            Arquivo binário aberto para escrita
+        """
+        path = storage.path(PlateRenderCache.name_for(key))
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        f = tempfile.NamedTemporaryFile(dir=directory, prefix=f".{key}.", suffix='.tmp', delete=False)
+        try:
+            with f:
+                yield f
+            # NamedTemporaryFile cria o arquivo com 0600; o storage usaria FILE_UPLOAD_PERMISSIONS
+            os.chmod(f.name, storage.file_permissions_mode or 0o644)
+            os.replace(f.name, path)
+        except BaseException:
+            try:
+                os.remove(f.name)
+            except FileNotFoundError:
+                pass
+            raise
+        if getattr(settings, 'PLATE_PDF_CACHE_MAX_BYTES', None):
+            PlateRenderCache.enforce_budget(storage)
+
+    @staticmethod
+    def entries(storage):
+        """
+        PDFs armazenados no cache
+
+        Returns:
+            Lista de (caminho, tamanho em bytes, último uso), do uso mais antigo ao mais recente
+        """
+        root = storage.path(PlateRenderCache.DIRECTORY)
+        entries = []
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if not filename.endswith('.pdf'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    @staticmethod
+    def enforce_budget(storage, max_bytes=None, min_age=None):
+        """
+        Remove os PDFs usados há mais tempo até o total caber em ``max_bytes``
+
+        Arquivos usados há menos de ``min_age`` segundos são mantidos, para não
+        remover um PDF que está sendo enviado por email ou baixado.
+
+        Returns:
+            (arquivos removidos, bytes liberados)
+        """
+        if max_bytes is None:
+            max_bytes = getattr(settings, 'PLATE_PDF_CACHE_MAX_BYTES', None)
+        if min_age is None:
+            min_age = getattr(settings, 'PLATE_PDF_CACHE_MIN_AGE', 300)
+        if not max_bytes:
+            return 0, 0
+
+        entries = PlateRenderCache.entries(storage)
+        total = sum(size for _, size, _ in entries)
+        limit = time.time() - min_age
+        removed = freed = 0
+        for path, size, last_used in entries:
+            if total <= max_bytes or last_used > limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Erro ao remover %s do cache de PDFs: %s", path, e)
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        if removed:
+            logger.info("Cache de PDFs: %s arquivo(s) removido(s), %s bytes liberados", removed, freed)
+        return removed, freed
@@ -1,3 +1,5 @@
+import logging
+import mmap
 import os
 from django.conf import settings
 from django.core.mail import EmailMessage
@@ -6,9 +8,95 @@ from django.template.loader import render_to_string
 from io import BytesIO
 
 from .utils.generator import PlateTemplateGenerator
+from .admission import RenderAdmission, render_units
 from .models import PlateProject
+from .render_cache import PlateRenderCache
+from . import mail, metrics
+
+logger = logging.getLogger(__name__)
 
 class PlateService:
+    @staticmethod
+    def get_project_data(project):
+        """Dados do projeto usados pelo gerador de templates"""
+        return {
+            'empresa': project.empresa,
+            'projeto': project.projeto,
+            'total_amostras': project.total_amostras,
+            'formato_placa': project.formato_placa,
+            'layout_pagina': project.layout_pagina,
+            'pocos_controle': project.pocos_controle,
+        }
+    
+    @staticmethod
+    def write_pdf(output, project_data, cod_envio, processes=1, compact=None):
+        """
+        Renderiza o PDF em ``output`` (caminho ou arquivo aberto para escrita)
+        
+        Não acessa o banco de dados, podendo ser executado em outro processo.
+        Com processes > 1, as páginas de projetos grandes são desenhadas em
+        paralelo (não usar dentro de um pool de processos). ``compact``
+        (padrão: PLATE_PDF_COMPACT) gera a saída compacta do gerador.
+        """
+        if compact is None:
+            compact = getattr(settings, 'PLATE_PDF_COMPACT', False)
+        
+        # Criar gerador de templates com o formato e a disposição do projeto
+        generator = PlateTemplateGenerator.for_project(project_data, compact=compact)
+        generator.generate_pdf(output, dict(project_data), cod_envio, processes=processes)
+    
+    @staticmethod
+    def render_pdf(project_data, cod_envio, processes=1, compact=None):
+        """
+        Renderiza o PDF e retorna seus bytes (ver write_pdf)
+        
+        Para gravar no storage, render_to_storage evita manter o PDF em memória.
+        """
+        buffer = BytesIO()
+        PlateService.write_pdf(buffer, project_data, cod_envio, processes=processes, compact=compact)
+        return buffer.getvalue()
+    
+    @staticmethod
+    def render_to_storage(project_data, cod_envio, render_key, processes=1):
+        """
+        Renderiza o PDF diretamente no arquivo do cache de renderização
+        
+        O ReportLab grava o documento no arquivo sem passar por um buffer
+        intermediário, e apenas o nome e o tamanho voltam ao chamador (também
+        quando executado em um pool de processos). Storages sem sistema de
+        arquivos local recebem os bytes pelo caminho tradicional.
+        
+        Returns:
+            (nome no storage, tamanho em bytes)
+        """
+        storage = PlateProject._meta.get_field('pdf_file').storage
+        name = PlateRenderCache.name_for(render_key)
+        try:
+            storage.path(name)
+        except NotImplementedError:
+            content = PlateService.render_pdf(project_data, cod_envio, processes=processes)
+            return PlateRenderCache.store(storage, render_key, ContentFile(content)), len(content)
+        
+        with PlateRenderCache.writer(storage, render_key) as f:
+            PlateService.write_pdf(f, project_data, cod_envio, processes=processes)
+            size = f.tell()
+        return name, size
+    
+    @staticmethod
+    def attach_pdf(project, render_key):
+        """
+        Aponta o projeto para o PDF da chave no cache de renderização
+        
+        Returns:
+            bool: True se o projeto foi alterado
+        """
+        name = PlateRenderCache.name_for(render_key)
+        if project.pdf_file.name == name and project.render_key == render_key:
+            return False
+        project.pdf_file.name = name
+        project.render_key = render_key
+        return True
+    
     @staticmethod
     def generate_pdf_for_project(project):
         """
@@ -20,46 +108,79 @@ class PlateService:
         Returns:
             Caminho para o arquivo PDF gerado
         """
-        # Configurar dados do projeto para o gerador
-        project_data = {
-            'empresa': project.empresa,
-            'projeto': project.projeto,
-            'total_amostras': project.total_amostras
-        }
-        
-        # Gerar código de envio
-        cod_envio = project.get_cod_envio()
+        _, filename, cod_envio = PlateService.render_project(project)
+        return project.pdf_file.path, filename, cod_envio
+    
+    @staticmethod
+    def pdf_is_current(project):
+        """Indica se o PDF armazenado do projeto corresponde à versão atual do gerador e dos dados"""
+        if not project.pdf_file or not project.render_key:
+            return False
+        render_key = PlateRenderCache.key_for(PlateService.get_project_data(project), project.get_cod_envio())
+        return (
+            project.render_key == render_key
+            and project.pdf_file.name == PlateRenderCache.name_for(render_key)
+            and project.pdf_file.storage.exists(project.pdf_file.name)
+        )
+    
+    @staticmethod
+    def render_project(project):
+        """
+        Gera (ou reaproveita do cache) o PDF do projeto e o associa ao projeto
         
-        # Criar gerador de templates
-        generator = PlateTemplateGenerator()
+        A renderização ocupa o número de placas do projeto no orçamento
+        global (RenderAdmission).
         
-        # Criar um buffer em memória para o PDF
-        buffer = BytesIO()
+        Returns:
+            (renderizado, nome do arquivo, código de envio); renderizado é
+            False quando o PDF já estava armazenado
         
-        # Gerar o PDF no buffer
-        generator.generate_pdf(buffer, project_data, cod_envio)
+        Raises:
+            RenderBusy: se o orçamento de renderização estiver esgotado
+        """
+        # Configurar dados do projeto para o gerador
+        project_data = PlateService.get_project_data(project)
         
-        # Resetar o ponteiro do buffer para o início
-        buffer.seek(0)
+        # Gerar código de envio
+        cod_envio = project.get_cod_envio()
         
         # Nome do arquivo PDF
         filename = f"{project.empresa}-{project.projeto}-{cod_envio}.pdf"
         
-        # Salvar o PDF no campo do modelo
-        project.pdf_file.save(filename, ContentFile(buffer.getvalue()), save=True)
+        # A saída é determinística: entradas iguais reutilizam o PDF já armazenado
+        render_key = PlateRenderCache.key_for(project_data, cod_envio)
+        rendered = PlateRenderCache.lookup(project.pdf_file.storage, render_key) is None
+        if rendered:
+            # O PDF é gravado direto no arquivo do cache, sem cópias em memória
+            with RenderAdmission.admit(render_units(project_data)), metrics.in_flight(), \
+                    metrics.span('pdf_render', project.total_amostras, cod_envio=cod_envio) as span:
+                _, span['bytes'] = PlateService.render_to_storage(
+                    project_data, cod_envio, render_key,
+                    processes=getattr(settings, 'PLATE_PAGE_RENDER_PROCESSES', 1)
+                )
         
-        return project.pdf_file.path, filename, cod_envio
+        # Apontar o projeto para o arquivo armazenado
+        with metrics.span('file_save', project.total_amostras, cod_envio=cod_envio, cache=not rendered):
+            if PlateService.attach_pdf(project, render_key):
+                project.save(update_fields=['pdf_file', 'render_key'])
+        
+        return rendered, filename, cod_envio
     
     @staticmethod
-    def send_pdf_by_email(project, pdf_path, filename, cod_envio):
+    def send_pdf_by_email(project, pdf_path, filename, cod_envio, raise_errors=False):
         """
         Envia o PDF gerado por email para o destinatário especificado no projeto
         
+        A mensagem é entregue pelo mailer do processo (plate_app.mail), que
+        reaproveita a conexão SMTP e repete falhas temporárias. O anexo é o
+        próprio arquivo mapeado em memória (mmap), sem lê-lo para um buffer.
+        
         Args:
             project: Instância do modelo PlateProject
             pdf_path: Caminho para o arquivo PDF
             filename: Nome do arquivo PDF
             cod_envio: Código de envio gerado
+            raise_errors: Levanta a exceção do envio em vez de retornar False
         
         Returns:
             bool: True se o email foi enviado com sucesso, False caso contrário
@@ -103,14 +224,22 @@ class PlateService:
             )
             
             # Anexar o PDF ao email
-            with open(pdf_path, 'rb') as f:
-                email.attach(filename, f.read(), 'application/pdf')
+            with metrics.span('email_attach', project.total_amostras, cod_envio=cod_envio):
+                with open(pdf_path, 'rb') as f:
+                    # O mapeamento continua válido depois de fechar o arquivo (e mesmo
+                    # se o cache o substituir) e é desfeito junto com a mensagem
+                    pdf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                email.attach(filename, pdf, 'application/pdf')
             
             # Enviar o email
-            email.send(fail_silently=False)
+            with metrics.span('email_send', project.total_amostras, cod_envio=cod_envio):
+                mail.get_mailer().send(email)
             
             return True
         
         except Exception as e:
-            print(f"Erro ao enviar email: {e}")
-            return False
\ No newline at end of file
+            metrics.email_failed(type(e).__name__)
+            logger.error("Erro ao enviar email do projeto %s: %s", cod_envio, e)
+            if raise_errors:
+                raise
+            return False
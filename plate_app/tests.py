@@ -1,3 +1,637 @@
-from django.test import TestCase
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail as django_mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.db import IntegrityError, connection, connections
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from reportlab import rl_config
+
+from . import mail, metrics
+from .admission import RenderAdmission, RenderBusy
+from .bulk import PlateBulkImporter
+from .db import configure_sqlite
+from .jobs import PlateJobQueue
+from .models import PlateJob, PlateProject
+from .render_cache import PlateRenderCache
+from .services import PlateService
+from .utils import resources
+from .utils.generator import PlateTemplateGenerator
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Backend locmem que levanta os erros de ``failures``, um por envio, antes de voltar a entregar"""
+    failures = []
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            raise FlakyEmailBackend.failures.pop(0)
+        return super().send_messages(messages)
+
+
+def refused(code):
+    return smtplib.SMTPRecipientsRefused({'cliente@example.com': (code, b'recusado')})
+
+
+@override_settings(EMAIL_BACKEND='plate_app.tests.FlakyEmailBackend')
+class PlateMailerTests(SimpleTestCase):
+    def setUp(self):
+        FlakyEmailBackend.failures = []
+        FlakyEmailBackend.opened = 0
+        self.mailer = mail.PlateMailer(connections=1, batch_size=10, max_attempts=3, retry_delay=0)
+
+    def tearDown(self):
+        self.mailer.close()
+
+    def message(self, index=0):
+        return EmailMessage(f"Template {index}", "corpo", 'noreply@example.com', ['cliente@example.com'])
+
+    def test_batch_shares_one_connection(self):
+        futures = [self.mailer.submit(self.message(index)) for index in range(5)]
+        self.assertEqual([future.result(5) for future in futures], [True] * 5)
+        self.assertEqual([message.subject for message in django_mail.outbox], [f"Template {i}" for i in range(5)])
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+
+    def test_send_batch_returns_open_connection(self):
+        connection = self.mailer.send_batch([(self.message(), Future())])
+        self.assertIsNotNone(connection)
+        self.mailer.send_batch([(self.message(1), Future())], connection)
+        self.assertEqual(len(django_mail.outbox), 2)
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+
+    def test_transient_failure_is_retried(self):
+        FlakyEmailBackend.failures = [smtplib.SMTPServerDisconnected("conexão perdida"), refused(451)]
+        self.assertTrue(self.mailer.send(self.message(), timeout=5))
+        self.assertEqual(len(django_mail.outbox), 1)
+        # Uma conexão nova depois de cada falha
+        self.assertEqual(FlakyEmailBackend.opened, 3)
+
+    def test_transient_failure_gives_up_after_max_attempts(self):
+        FlakyEmailBackend.failures = [smtplib.SMTPServerDisconnected("conexão perdida")] * 3
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.mailer.send(self.message(), timeout=5)
+        self.assertEqual(django_mail.outbox, [])
+
+    def test_permanent_failure_is_not_retried(self):
+        FlakyEmailBackend.failures = [refused(550)]
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            self.mailer.send(self.message(), timeout=5)
+        self.assertEqual(django_mail.outbox, [])
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(FlakyEmailBackend.failures, [])
+
+
+class MetricsFlushTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='plate-metrics-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_events_inside_interval_reach_aggregate(self):
+        with override_settings(PLATE_METRICS_DIR=self.directory, PLATE_METRICS_FLUSH_INTERVAL=0.2):
+            registry = metrics.MetricsRegistry()
+            registry.observe('plate_stage_duration_seconds', 0.5, stage='pdf_render', amostras='<=1000', status='ok')
+            # Dentro do intervalo: gravados pelo timer, sem precisar de outro evento
+            registry.observe('plate_stage_duration_seconds', 0.1, stage='email_send', amostras='<=1000', status='ok')
+            registry.inc('plate_email_failures_total', reason='X')
+            time.sleep(0.5)
+            histograms, counters, _ = metrics.aggregate(metrics.read_directory(self.directory))
+
+        stages = {dict(labels)['stage']: h[2] for (_, labels), h in histograms.items()}
+        self.assertEqual(stages, {'pdf_render': 1, 'email_send': 1})
+        self.assertEqual(counters[('plate_email_failures_total', (('reason', 'X'),))], 1)
+
+
+class ParallelRenderTests(SimpleTestCase):
+    """A renderização paralela repete operadores internos do ReportLab (ver requirements.txt)"""
+    PAGES = 6
+
+    def render(self, compact, processes):
+        generator = PlateTemplateGenerator(compact=compact)
+        # Paralelo mesmo em poucas páginas e em máquinas com uma CPU
+        generator.PARALLEL_MIN_PAGES = 2
+        samples = generator.layout.samples_per_plate * generator.page.plates_per_page * self.PAGES
+        output = BytesIO()
+        with mock.patch('plate_app.utils.generator.os.cpu_count', return_value=2):
+            generator.generate_pdf(output, {'empresa': '001', 'projeto': 'PARALELO', 'total_amostras': samples}, '2612345',
+                                   processes=processes)
+        return output.getvalue()
+
+    def test_parallel_output_is_byte_identical(self):
+        for compact in (False, True):
+            with self.subTest(compact=compact):
+                sequential = self.render(compact, processes=1)
+                self.assertEqual(sequential.count(b'/Type /Page\n'), self.PAGES)
+                self.assertEqual(self.render(compact, processes=2), sequential)
+
+
+class CompactStreamTests(SimpleTestCase):
+    def render(self, compact):
+        output = BytesIO()
+        PlateTemplateGenerator(compact=compact).generate_pdf(
+            output, {'empresa': '001', 'projeto': 'COMPACTO', 'total_amostras': 500}, '2612345'
+        )
+        return output.getvalue()
+
+    def test_compact_filters_are_per_document(self):
+        use_a85 = rl_config.useA85
+        compact = self.render(compact=True)
+        # Nenhuma configuração global do ReportLab é alterada (nem durante o save)
+        self.assertEqual(rl_config.useA85, use_a85)
+        self.assertNotIn(b'/ASCII85Decode', compact)
+        self.assertIn(b'/FlateDecode', compact)
+        self.assertEqual(b'/ASCII85Decode' in self.render(compact=False), bool(use_a85))
+
+
+class PlateAppTestCase(TestCase):
+    """Arquivos do teste (PDFs, reservas de renderização) em um diretório temporário"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='plate-test-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=directory,
+            PLATE_RENDER_ADMISSION_FILE=f"{directory}/render_admission.json",
+            PLATE_METRICS_DIR=None,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_project(self, **fields):
+        fields = {'empresa': '001', 'projeto': 'TESTE', 'total_amostras': 90, 'email': 'cliente@example.com', **fields}
+        project = PlateProject.objects.create(**fields)
+        project.assign_cod_envio()
+        return project
+
+
+@override_settings(PLATE_RENDER_BUDGET=100, PLATE_RENDER_SMALL_RESERVE=10)
+class RenderAdmissionTests(PlateAppTestCase):
+    def test_busy_budget_rejects_immediately(self):
+        with RenderAdmission.admit(80):
+            with self.assertRaises(RenderBusy):
+                RenderAdmission.acquire(50)
+
+    def test_wait_admits_after_release(self):
+        token = RenderAdmission.acquire(80)
+        timer = threading.Timer(0.2, RenderAdmission.release, (token,))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        # Como o generate_plates: aguarda a vez em vez de falhar
+        with RenderAdmission.admit(50, wait=None):
+            self.assertFalse(timer.is_alive())
+        with RenderAdmission.ledger() as entries:
+            self.assertEqual(entries, {})
+
+
+@override_settings(PLATE_API_TOKENS=['segredo'])
+class ProjectsApiTests(PlateAppTestCase):
+    def post(self, payload, token='segredo'):
+        headers = {'Authorization': f"Token {token}"} if token else {}
+        return self.client.post('/api/projetos/', payload, content_type='application/json', headers=headers, secure=True)
+
+    def item(self, projeto):
+        return {'empresa': '001', 'projeto': projeto, 'total_amostras': 90, 'email': 'cliente@example.com'}
+
+    def test_requires_token(self):
+        self.create_project()
+        for token in (None, 'outro'):
+            headers = {'Authorization': f"Token {token}"} if token else {}
+            response = self.client.get('/api/projetos/', headers=headers, secure=True)
+            self.assertEqual(response.status_code, 401)
+            self.assertNotIn(b'cliente@example.com', response.content)
+        response = self.client.get('/api/projetos/', headers={'Authorization': "Token segredo"}, secure=True)
+        self.assertEqual(response.json()['resultados'][0]['email'], 'cliente@example.com')
+        self.assertEqual(self.post([self.item('NOVO')], token=None).status_code, 401)
+        self.assertFalse(PlateProject.objects.filter(projeto='NOVO').exists())
+
+    def test_batch_creates_jobs(self):
+        response = self.post([self.item('A'), self.item('B')])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['criados'], 2)
+        self.assertEqual(PlateJob.objects.count(), 2)
+
+    def test_batch_of_duplicates_conflicts(self):
+        self.create_project()
+        response = self.post([self.item('TESTE'), self.item('NOVO'), self.item('NOVO')])
+        self.assertEqual(response.status_code, 202)
+        response = self.post([self.item('TESTE'), self.item('NOVO')])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['criados'], 0)
+
+    def test_batch_with_invalid_item_is_bad_request(self):
+        self.create_project()
+        response = self.post([self.item('TESTE'), {**self.item('NOVO'), 'total_amostras': 1}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_write_conflict_conflicts(self):
+        with mock.patch.object(PlateBulkImporter, 'create', side_effect=IntegrityError):
+            response = self.post([self.item('A')])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(PlateJob.objects.count(), 0)
+
+
+@override_settings(PLATE_API_TOKENS=['segredo'])
+class JobStatusViewTests(PlateAppTestCase):
+    def status(self, job_id, **headers):
+        return self.client.get(f"/status/{job_id}/", headers=headers, secure=True)
+
+    def test_only_creating_session_or_token_reads_status(self):
+        other = PlateJobQueue.enqueue(self.create_project(projeto='OUTRO'))
+        response = self.client.post('/form/', {
+            'empresa': '001', 'projeto': 'NOVO', 'total_amostras': 90, 'email': 'cliente@example.com',
+        }, secure=True)
+        self.assertRedirects(response, '/success/', fetch_redirect_response=False)
+        job = PlateJob.objects.get(project__projeto='NOVO')
+
+        self.assertEqual(self.status(job.id).json()['cod_envio'], job.project.cod_envio)
+        # Ids sequenciais: a tarefa de outro cliente não é exposta
+        self.assertEqual(self.status(other.id).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.status(job.id).status_code, 404)
+        self.assertEqual(self.status(other.id, Authorization="Token segredo").status_code, 200)
+
+
+class CodEnvioTests(PlateAppTestCase):
+    def test_collision_gets_suffix_and_is_stable(self):
+        legacy = self.create_project()
+        self.assertEqual(legacy.cod_envio, legacy.build_cod_envio())
+        # Código antigo (preservado pela migração) igual ao código novo do próximo projeto
+        pk = legacy.pk + 100
+        code = PlateProject(id=pk, created_at=timezone.now()).build_cod_envio()
+        PlateProject.objects.filter(pk=legacy.pk).update(cod_envio=code)
+
+        project = self.create_project(id=pk, projeto='NOVO')
+        self.assertEqual(project.build_cod_envio(), code)
+        self.assertEqual(project.cod_envio, f"{code}1")
+        # Uma nova atribuição mantém o código
+        self.assertEqual(project.assign_cod_envio(), f"{code}1")
+        self.assertEqual(
+            dict(PlateProject.objects.values_list('id', 'cod_envio')), {legacy.pk: code, pk: f"{code}1"}
+        )
+
+
+class CodEnvioMigrationTests(TransactionTestCase):
+    """Preenchimento de cod_envio dos projetos existentes (0004_plateproject_cod_envio)"""
+    before = [('plate_app', '0003_plateproject_render_key')]
+    after = [('plate_app', '0004_plateproject_cod_envio')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_backfill_keeps_old_codes_and_resolves_collisions(self):
+        Project = self.migrate(self.before).get_model('plate_app', 'PlateProject')
+        # Formato antigo (dia do ano sem zeros): 12/01 + id 345 e 03/05 (dia 123) + id 45 dão 2612345
+        for pk, projeto, day in ((345, 'A', datetime(2026, 1, 12, 12)), (45, 'B', datetime(2026, 5, 3, 12)),
+                                 (7, 'C', datetime(2026, 2, 1, 12))):
+            Project.objects.create(id=pk, empresa='001', projeto=projeto, total_amostras=90, email='a@example.com')
+            Project.objects.filter(pk=pk).update(created_at=day.replace(tzinfo=dt_timezone.utc))
+
+        Project = self.migrate(self.after).get_model('plate_app', 'PlateProject')
+        codes = dict(Project.objects.values_list('id', 'cod_envio'))
+        # O menor id mantém o código já enviado; o outro recebe o formato novo
+        self.assertEqual(codes, {45: '2612345', 345: '26012345', 7: '263207'})
+
+        # Estável: as migrações seguintes e o modelo atual preservam os códigos
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        self.assertEqual(dict(PlateProject.objects.values_list('id', 'cod_envio')), codes)
+        self.assertEqual(PlateProject.objects.get(pk=7).get_cod_envio(), '263207')
+
+
+class DownloadViewTests(PlateAppTestCase):
+    def download(self, project):
+        return self.client.get(f"/download/{project.cod_envio}/", secure=True)
+
+    def test_pending_job_is_not_rendered_in_request(self):
+        project = self.create_project()
+        job = PlateJobQueue.enqueue(project)
+        with mock.patch.object(PlateService, 'render_project') as render_project:
+            response = self.download(project)
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response['Location'].endswith(f"/status/{job.id}/"))
+        render_project.assert_not_called()
+
+    def test_evicted_pdf_of_finished_project_is_rendered_again(self):
+        project = self.create_project()
+        self.assertTrue(PlateJobQueue.run(PlateJobQueue.enqueue(project, PlateJob.KIND_RENDER)))
+        project.refresh_from_db()
+        project.pdf_file.storage.delete(project.pdf_file.name)
+
+        response = self.download(project)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content)[:5], b'%PDF-')
+
+
+@override_settings(PLATE_JOB_RETRY_DELAY=30)
+class PlateJobQueueTests(PlateAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = PlateJobQueue.enqueue(self.create_project())
+
+    def test_claim_skips_job_taken_by_another_worker(self):
+        other = PlateJobQueue.enqueue(self.create_project(projeto='OUTRO'))
+        update = QuerySet.update
+
+        def racing_update(queryset, **fields):
+            # Outro worker reserva a primeira candidata entre a consulta e o UPDATE condicional
+            if not PlateJob.objects.filter(worker='outro').exists():
+                update(PlateJob.objects.filter(id=self.job.id), status=PlateJob.STATUS_RUNNING, worker='outro')
+            return update(queryset, **fields)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            claimed = PlateJobQueue.claim('este')
+        self.assertEqual(claimed.id, other.id)
+        self.assertEqual(claimed.worker, 'este')
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.worker, 'outro')
+        self.assertIsNone(PlateJobQueue.claim('este'))
+
+    def test_failure_is_retried_with_backoff_then_fails(self):
+        with mock.patch.object(PlateJobQueue, 'execute', side_effect=RuntimeError("falhou")):
+            for attempt, delay in ((1, 30), (2, 60)):
+                before = timezone.now()
+                self.assertFalse(PlateJobQueue.run(PlateJobQueue.claim()))
+                self.job.refresh_from_db()
+                self.assertEqual((self.job.status, self.job.attempts), (PlateJob.STATUS_PENDING, attempt))
+                self.assertAlmostEqual((self.job.run_after - before).total_seconds(), delay, delta=5)
+                # Aguardando a espera: nada a reservar
+                self.assertIsNone(PlateJobQueue.claim())
+                PlateJob.objects.filter(id=self.job.id).update(run_after=timezone.now())
+
+            self.assertFalse(PlateJobQueue.run(PlateJobQueue.claim()))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), (PlateJob.STATUS_FAILED, 3))
+        self.assertIn('RuntimeError', self.job.last_error)
+
+    def test_render_busy_requeues_without_counting_attempt(self):
+        with mock.patch.object(PlateJobQueue, 'execute', side_effect=RenderBusy(200, 950, 1000, 15)):
+            self.assertFalse(PlateJobQueue.run(PlateJobQueue.claim()))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), (PlateJob.STATUS_PENDING, 0))
+        self.assertGreater(self.job.run_after, timezone.now() + timedelta(seconds=10))
+
+    def mark_running(self, worker, attempts=0):
+        PlateJob.objects.filter(id=self.job.id).update(
+            status=PlateJob.STATUS_RUNNING, worker=worker, attempts=attempts,
+            started_at=timezone.now() - timedelta(hours=1),
+        )
+
+    def test_stale_job_reclaim_counts_attempt_and_fails_at_max(self):
+        self.mark_running('outra-maquina:123/0')
+        self.assertEqual(PlateJobQueue.requeue_stale(600), (1, 0))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), (PlateJob.STATUS_PENDING, 1))
+
+        # Derrubou o worker nas outras tentativas também
+        self.mark_running('outra-maquina:123/0', attempts=2)
+        self.assertEqual(PlateJobQueue.requeue_stale(600), (0, 1))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), (PlateJob.STATUS_FAILED, 3))
+        self.assertIsNotNone(self.job.finished_at)
+
+    def test_stale_sweep_leaves_live_local_worker(self):
+        self.mark_running(f"{PlateJobQueue.worker_name()}/0")
+        self.assertEqual(PlateJobQueue.requeue_stale(600), (0, 0))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, PlateJob.STATUS_RUNNING)
+
+
+class ServePdfTests(PlateAppTestCase):
+    """Downloads com GET condicional e Range, servidos pela aplicação e pelo nginx (X-Accel-Redirect)"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project()
+        PlateService.render_project(self.project)
+        with open(self.project.pdf_file.path, 'rb') as f:
+            self.pdf = f.read()
+        self.etag = f'"{self.project.render_key}"'
+
+    def download(self, **headers):
+        response = self.client.get(f"/download/{self.project.cod_envio}/", headers=headers, secure=True)
+        self.assertEqual(response['ETag'], self.etag)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.content(response), self.pdf)
+
+    def test_single_range(self):
+        response = self.download(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 100-199/{len(self.pdf)}")
+        self.assertEqual(self.content(response), self.pdf[100:200])
+
+    def test_suffix_range(self):
+        response = self.download(Range='bytes=-50')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes {len(self.pdf) - 50}-{len(self.pdf) - 1}/{len(self.pdf)}")
+        self.assertEqual(self.content(response), self.pdf[-50:])
+
+    def test_range_with_current_if_range(self):
+        response = self.download(Range='bytes=0-9', **{'If-Range': self.etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), self.pdf[:10])
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.download(Range='bytes=0-9', **{'If-Range': '"versao-antiga"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.pdf)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(
+            f"/download/{self.project.cod_envio}/", headers={'Range': f"bytes={len(self.pdf)}-"}, secure=True
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{len(self.pdf)}")
+
+    def test_matching_if_none_match(self):
+        response = self.download(**{'If-None-Match': self.etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(PLATE_PDF_X_ACCEL_REDIRECT='/protected-media/')
+    def test_x_accel_redirect_keeps_app_etag(self):
+        response = self.download(Range='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f"/protected-media/{self.project.pdf_file.name}")
+        self.assertEqual(response.content, b'')
+        # A revalidação continua respondida pela aplicação, antes do redirecionamento
+        response = self.download(**{'If-None-Match': self.etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+
+@override_settings(EMAIL_BACKEND='plate_app.tests.FlakyEmailBackend', PLATE_EMAIL_RETRY_DELAY=0)
+class PlateJobEmailTests(PlateAppTestCase):
+    def setUp(self):
+        super().setUp()
+        FlakyEmailBackend.failures = []
+        FlakyEmailBackend.opened = 0
+        # Mailer do processo criado com as configurações do teste
+        mail.reset()
+        self.addCleanup(mail.reset)
+        self.job = PlateJobQueue.enqueue(self.create_project())
+
+    def test_job_sends_pdf(self):
+        self.assertTrue(PlateJobQueue.run(self.job))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, PlateJob.STATUS_DONE)
+        self.assertEqual(len(django_mail.outbox), 1)
+        filename, content, mimetype = django_mail.outbox[0].attachments[0]
+        self.assertEqual(filename, f"001-TESTE-{self.job.project.cod_envio}.pdf")
+        self.assertEqual(mimetype, 'application/pdf')
+        self.assertEqual(content[:5], b'%PDF-')
+
+    def test_transient_failure_is_retried_by_the_mailer(self):
+        FlakyEmailBackend.failures = [refused(421)]
+        self.assertTrue(PlateJobQueue.run(self.job))
+        self.assertEqual(len(django_mail.outbox), 1)
+
+    def test_transient_failure_requeues_job(self):
+        FlakyEmailBackend.failures = [smtplib.SMTPServerDisconnected("conexão perdida")] * 3
+        self.assertFalse(PlateJobQueue.run(self.job))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, PlateJob.STATUS_PENDING)
+        self.assertEqual(self.job.attempts, 1)
+        self.assertEqual(django_mail.outbox, [])
+
+    def test_permanent_failure_marks_job_failed(self):
+        FlakyEmailBackend.failures = [refused(550)]
+        self.assertFalse(PlateJobQueue.run(self.job))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, PlateJob.STATUS_FAILED)
+        self.assertEqual(self.job.attempts, 1)
+        self.assertIsNotNone(self.job.finished_at)
+        self.assertIn('SMTPRecipientsRefused', self.job.last_error)
+        self.assertEqual(django_mail.outbox, [])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class RenderMemoryTests(PlateAppTestCase):
+    """
+    Pico de memória Python de uma renderização com envio, em múltiplos do PDF
+
+    O PDF é gravado direto no arquivo do cache e anexado por mmap; um buffer
+    intermediário ou a leitura do arquivo para o anexo aumentam essas razões.
+    """
+    SAMPLES = 20000
+    # Medido: ~8.2x na renderização (objetos do ReportLab) e ~5x no envio (MIME em
+    # base64); um BytesIO com o PDF (buffer e getvalue) na renderização ou uma cópia
+    # a mais no envio passam dos limites
+    MAX_PEAK_RATIO = 9.5
+    MAX_SEND_PEAK_RATIO = 5.5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Módulos, fontes e logo carregados fora da medição
+        resources.warm_up()
+
+    def setUp(self):
+        super().setUp()
+        mail.reset()
+        self.addCleanup(mail.reset)
+
+    def render_and_send(self, project):
+        """
+        Renderização no storage e envio por email (backend locmem)
+
+        Returns:
+            (tamanho do PDF, pico da renderização, pico do envio); picos None sem tracemalloc
+        """
+        project_data = PlateService.get_project_data(project)
+        render_key = PlateRenderCache.key_for(project_data, project.cod_envio)
+        _, size = PlateService.render_to_storage(project_data, project.cod_envio, render_key)
+        render_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        PlateService.attach_pdf(project, render_key)
+        PlateService.send_pdf_by_email(
+            project, project.pdf_file.path, f"{project.projeto}.pdf", project.cod_envio, raise_errors=True
+        )
+        send_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        return size, render_peak, send_peak
+
+    def test_render_and_send_peak(self):
+        # Como no benchmark, uma execução completa antes: a primeira preenche caches do processo
+        self.render_and_send(self.create_project(projeto='AQUEC', total_amostras=self.SAMPLES))
+        django_mail.outbox = []
+
+        project = self.create_project(total_amostras=self.SAMPLES)
+        tracemalloc.start()
+        try:
+            size, render_peak, send_peak = self.render_and_send(project)
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(django_mail.outbox), 1)
+        self.assertEqual(len(django_mail.outbox[0].attachments[0][1]), size)
+        self.assertLess(
+            max(render_peak, send_peak), self.MAX_PEAK_RATIO * size,
+            f"pico de {max(render_peak, send_peak) / size:.2f}x o PDF de {size} bytes",
+        )
+        self.assertLess(send_peak, self.MAX_SEND_PEAK_RATIO * size, f"envio com pico de {send_peak / size:.2f}x o PDF")
+
+
+class SQLitePragmaTests(SimpleTestCase):
+    """configure_sqlite (sinal connection_created) em um banco em arquivo, como o de produção"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='plate-db-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = f"{directory}/db.sqlite3"
+
+    def pragmas(self, *names):
+        connection = DatabaseWrapper({**connections['default'].settings_dict, 'NAME': self.path}, alias='pragmas')
+        try:
+            with connection.cursor() as cursor:
+                values = {}
+                for name in names:
+                    cursor.execute(f"PRAGMA {name}")
+                    values[name] = cursor.fetchone()[0]
+                return values
+        finally:
+            connection.close()
+
+    def test_new_connection_uses_wal_and_busy_timeout(self):
+        self.assertEqual(
+            self.pragmas('journal_mode', 'busy_timeout', 'synchronous'),
+            {'journal_mode': 'wal', 'busy_timeout': 5000, 'synchronous': 1},
+        )
+
+    @override_settings(PLATE_SQLITE_PRAGMAS={'journal_mode': 'WAL', 'busy_timeout': 1234})
+    def test_pragmas_come_from_settings(self):
+        self.assertEqual(self.pragmas('journal_mode', 'busy_timeout'), {'journal_mode': 'wal', 'busy_timeout': 1234})
+
+    def test_without_handler_sqlite_defaults_apply(self):
+        connection_created.disconnect(configure_sqlite, dispatch_uid='plate_app.configure_sqlite')
+        self.addCleanup(connection_created.connect, configure_sqlite, dispatch_uid='plate_app.configure_sqlite')
+        self.assertEqual(self.pragmas('journal_mode')['journal_mode'], 'delete')
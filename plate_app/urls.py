@@ -1,10 +1,34 @@
+from django.conf import settings
 from django.urls import path
 from django.views.generic import RedirectView
-from . import views
+from . import api, views
+
+# Em servidores ASGI, formulário, sucesso e download usam as views assíncronas
+if getattr(settings, 'PLATE_ASYNC_VIEWS', False):
+    from . import async_views
+    form_view = async_views.form_view
+    success_view = async_views.success_view
+    download_pdf_view = async_views.download_pdf_view
+else:
+    form_view = views.PlateFormView.as_view()
+    success_view = views.success_view
+    download_pdf_view = views.download_pdf_view
 
 urlpatterns = [
     path('', RedirectView.as_view(pattern_name='plate_form'), name='home'),
-    path('form/', views.PlateFormView.as_view(), name='plate_form'),
-    path('success/', views.success_view, name='plate_success'),
-    path('download/<str:cod_envio>/', views.download_pdf_view, name='download_pdf'),
+    path('form/', form_view, name='plate_form'),
+    path('bulk/', views.bulk_upload_view, name='plate_bulk'),
+    path('api/bulk/', views.bulk_upload_api, name='plate_bulk_api'),
+    path('api/projetos/', api.projects_view, name='api_projects'),
+    path('api/projetos/<str:cod_envio>/', api.project_view, name='api_project'),
+    path('api/projetos/<str:cod_envio>/pdf/', api.project_pdf_view, name='api_project_pdf'),
+    path('api/projetos/<str:cod_envio>/manifesto/', api.project_manifest_view, name='api_project_manifest'),
+    path('api/tarefas/<int:job_id>/', api.job_view, name='api_job'),
+    path('success/', success_view, name='plate_success'),
+    path('status/<int:job_id>/', views.job_status_view, name='job_status'),
+    path('download/<str:cod_envio>/', download_pdf_view, name='download_pdf'),
+    path('manifest/<str:cod_envio>/', views.manifest_view, name='plate_manifest'),
+    path('preview/<str:cod_envio>/<int:placa>.svg', views.plate_preview_view, name='plate_preview'),
+    path('metrics', views.metrics_view, name='plate_metrics'),
+    path('ready', views.ready_view, name='plate_ready'),
 ]
\ No newline at end of file
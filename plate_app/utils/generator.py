@@ -1,15 +1,56 @@
+from reportlab.pdfbase.pdfdoc import PDFZCompress
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import logging
 import math
+import multiprocessing
 import os
-from django.conf import settings
+
+from . import resources
+from .layout import (
+    DEFAULT_CONTROL_WELLS, DEFAULT_PAGE_LAYOUT, DEFAULT_PLATE_FORMAT, PageLayout, PlateLayout, parse_control_wells,
+)
+
+logger = logging.getLogger(__name__)
 
 class PlateTemplateGenerator:
-    def __init__(self):
-        self.CONTROL_WELLS = ['A1', 'B1', 'C1', 'D1','E1','F1']
-        #self.CONTROL_WELLS = ['C1', 'D1']
-        self.WELLS_PER_PLATE = 96
-        self.SAMPLES_PER_PLATE = 90  # 96 - 6 control wells
+    # Incrementar sempre que a saída gerada mudar, para invalidar o cache de PDFs
+    VERSION = 3
+    PAGE_FORM = 'page_skeleton'
+    PLATE_FORM = 'plate_skeleton'
+    # Below this page count the process start-up costs more than it saves
+    PARALLEL_MIN_PAGES = 100
+    
+    def __init__(self, compact=False, plate_format=DEFAULT_PLATE_FORMAT, page_layout=DEFAULT_PAGE_LAYOUT,
+                 control_wells=DEFAULT_CONTROL_WELLS):
+        # Compact mode: Flate-only binary streams (no ASCII85), vector logo
+        # with base-14 fonts instead of the raster image, and each plate's
+        # sample numbers in a single text object
+        self.compact = compact
+        # Precomputed geometry shared by every document with this layout
+        self.layout = PlateLayout.get(plate_format, tuple(control_wells))
+        self.page = PageLayout.get(page_layout)
+        self.CONTROL_WELLS = list(self.layout.control_wells)
+        self.WELLS_PER_PLATE = self.layout.well_count
+        self.SAMPLES_PER_PLATE = self.layout.samples_per_plate  # wells minus control wells
+        self.PLATES_PER_PAGE = self.page.plates_per_page
+        
+        # Text sizes follow the well pitch (7/6 pt on 96-well plates)
+        scale = self.layout.pitch / 9.0
+        self.header_font_size = 7 * scale
+        self.number_font_size = 6 * scale
+    
+    @classmethod
+    def for_project(cls, project_data, compact=False):
+        """Generator configured with the plate format and page layout chosen for the project."""
+        return cls(
+            compact=compact,
+            plate_format=project_data.get('formato_placa') or DEFAULT_PLATE_FORMAT,
+            page_layout=project_data.get('layout_pagina') or DEFAULT_PAGE_LAYOUT,
+            control_wells=parse_control_wells(project_data.get('pocos_controle')),
+        )
         
     def mm(self, mm):
         """Convert millimeters to points."""
@@ -17,149 +58,89 @@ class PlateTemplateGenerator:
         
     def calculate_plates_needed(self, total_samples):
         """Calculate number of plates needed for given sample count."""
-        return math.ceil(total_samples / self.SAMPLES_PER_PLATE)
-        
-    def get_well_coordinates(self, plate_number):
-        """Get base coordinates for a plate based on its position (1 or 2)."""
-        if plate_number == 1:
-            return {
-                'x_start': 20,
-                'y_start': 192,
-                'col_pos_ini': 34.38,  # 20 + 14.38
-                'lin_pos_ini': 265.76  # 297 - 20 - 11.24
-            }
-        else:
-            return {
-                'x_start': 20,  # Mesmo x_start da primeira placa
-                'y_start': 50,  # Ajustado para evitar sobreposição
-                'col_pos_ini': 34.38,  # Mesmo col_pos_ini da primeira placa
-                'lin_pos_ini': 123.76  # Ajustado para manter proporção com novo y_start
-            }
+        return self.layout.plates_needed(total_samples)
     
     def draw_logo(self, c):
         """Desenha o logo da Agromarkers no canto superior direito da página."""
-        try:
-            # Tentativa 1: Caminho usando STATIC_ROOT
-            logo_path = os.path.join(settings.STATIC_ROOT, 'plate_app', 'images', 'agromarkers_logo.png')
-            
-            # Se não existir, tente caminhos alternativos
-            if not os.path.exists(logo_path):
-                # Tentativa 2: Caminho direto para /static/
-                logo_path = '/var/www/plate_generator/static/plate_app/images/agromarkers_logo.png'
-                
-                if not os.path.exists(logo_path):
-                    # Tentativa 3: Caminho absoluto direto para staticfiles
-                    logo_path = '/var/www/plate_generator/staticfiles/plate_app/images/agromarkers_logo.png'
-            
-            # Verificar se o arquivo existe
-            if os.path.exists(logo_path):
-                print(f"Logo encontrado em: {logo_path}")
-                
-                # Calcular posição (canto superior direito)
-                logo_width = 50  # mm
-                logo_height = 25  # mm
-                margin = 5  # mm
-                
-                # A4 é 210x297 mm, calculamos a posição para o canto superior direito
-                x = 210 - logo_width - margin
-                y = 297 - logo_height - margin
-                
-                # Desenhar o logo com tratamento de erro
-                try:
-                    c.drawImage(logo_path, 
-                            self.mm(x), 
-                            self.mm(y), 
-                            width=self.mm(logo_width), 
-                            height=self.mm(logo_height),
-                            preserveAspectRatio=True,
-                            mask='auto')
-                    print("Logo desenhado com sucesso!")
-                except Exception as e:
-                    print(f"Erro ao desenhar o logo: {e}")
-                    # Fallback: desenhar um retângulo colorido com o texto "AGROMARKERS"
-                    c.setFillColorRGB(0, 0.4, 0)  # Verde escuro
-                    c.rect(self.mm(x), self.mm(y), self.mm(logo_width), self.mm(logo_height), fill=1)
-                    c.setFillColorRGB(1, 1, 1)  # Branco
-                    c.setFont("Helvetica-Bold", 10)
-                    c.drawCentredString(self.mm(x + logo_width/2), self.mm(y + logo_height/2 - 3), "AGROMARKERS")
-            else:
-                print(f"Logo não encontrado. Caminhos verificados: {settings.STATIC_ROOT}/plate_app/images/agromarkers_logo.png, /var/www/plate_generator/static/plate_app/images/agromarkers_logo.png, /var/www/plate_generator/staticfiles/plate_app/images/agromarkers_logo.png")
-                # Fallback: desenhar um retângulo colorido com o texto "AGROMARKERS"
-                c.setFillColorRGB(0, 0.4, 0)  # Verde escuro
-                x = 210 - 50 - 5  # Largura, margem
-                y = 297 - 25 - 5  # Altura, margem
-                c.rect(self.mm(x), self.mm(y), self.mm(50), self.mm(25), fill=1)
-                c.setFillColorRGB(1, 1, 1)  # Branco
-                c.setFont("Helvetica-Bold", 10)
-                c.drawCentredString(self.mm(x + 25), self.mm(y + 25/2 - 3), "AGROMARKERS")
-        except Exception as e:
-            print(f"Erro geral ao processar o logo: {e}")
-            # Não fazemos nada, apenas seguimos sem o logo para não quebrar a geração do PDF        
+        # Calcular posição (canto superior direito)
+        logo_width = 50  # mm
+        logo_height = 25  # mm
+        margin = 5  # mm
+        
+        # Canto superior direito da página (210x297 mm no A4 retrato)
+        x = self.page.width - logo_width - margin
+        y = self.page.height - logo_height - margin
+        
+        # Logo resolvido e decodificado uma única vez por processo; o modo
+        # compacto não embute a imagem e usa o bloco vetorial abaixo
+        logo = None if self.compact else resources.get_logo()
+        if logo is not None:
+            try:
+                c.drawImage(logo, 
+                        self.mm(x), 
+                        self.mm(y), 
+                        width=self.mm(logo_width), 
+                        height=self.mm(logo_height),
+                        preserveAspectRatio=True,
+                        mask='auto')
+                return
+            except Exception as e:
+                logger.warning("Erro ao desenhar o logo: %s", e)
+        
+        # Fallback: desenhar um retângulo colorido com o texto "AGROMARKERS"
+        c.setFillColorRGB(0, 0.4, 0)  # Verde escuro
+        c.rect(self.mm(x), self.mm(y), self.mm(logo_width), self.mm(logo_height), fill=1)
+        c.setFillColorRGB(1, 1, 1)  # Branco
+        c.setFont("Helvetica-Bold", 10)
+        c.drawCentredString(self.mm(x + logo_width/2), self.mm(y + logo_height/2 - 3), "AGROMARKERS")
 
 
-    def draw_plate_grid(self, c, coords, sample_counter, total_samples):
-        """Draw a single plate grid with wells and numbers."""
+    def draw_plate_skeleton(self, c):
+        """Draw the static part of a plate: outline, headers and empty/control wells."""
+        layout = self.layout
+        
         # Draw plate outline
-        c.roundRect(self.mm(coords['x_start']), self.mm(coords['y_start']), 
-                   self.mm(127.76), self.mm(85.48), self.mm(5))
-        
-        # Setup initial positions
-        col_pos_ini = coords['col_pos_ini']
-        lin_pos_ini = coords['lin_pos_ini']
-        diametro = 4.5
-        
-        # Draw column headers (01-12)
-        c.setFont("Helvetica", 7)
-        for i in range(12):
-            c.drawCentredString(self.mm(col_pos_ini + diametro * (i*2)),
-                              self.mm(lin_pos_ini + 6),
+        c.roundRect(0, 0, self.mm(PageLayout.BLOCK_WIDTH), self.mm(PageLayout.BLOCK_TOP), self.mm(5))
+        
+        # Setup initial positions (centre of well A1)
+        col_pos_ini = layout.a1_x
+        lin_pos_ini = layout.a1_y
+        pitch = layout.pitch
+        
+        # Draw column headers (01-12 / 01-24)
+        c.setFont("Helvetica", self.header_font_size)
+        for i in range(layout.columns):
+            c.drawCentredString(self.mm(col_pos_ini + pitch * i),
+                              self.mm(lin_pos_ini + pitch * 2 / 3),
                               f"{i+1:02d}")
         
-        # Draw row headers (A-H)
-        rows = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-        for i, row in enumerate(rows):
-            c.drawCentredString(self.mm(col_pos_ini - 8),
-                              self.mm(lin_pos_ini - 1.5 - diametro * (i*2)),
+        # Draw row headers (A-H / A-P)
+        for i, row in enumerate(layout.row_labels):
+            c.drawCentredString(self.mm(col_pos_ini - pitch * 8 / 9),
+                              self.mm(lin_pos_ini - pitch / 6 - pitch * i),
                               row)
         
-        # Draw wells and numbers
-        current_sample = sample_counter
-        for row in range(8):
-            for col in range(12):
-                x = col_pos_ini + diametro * (col*2)
-                y = lin_pos_ini + diametro * (-row*2)
-                
-                well_id = f"{rows[row]}{col+1}"
-                if well_id in self.CONTROL_WELLS:
-                    # Control well - red
-                    c.setFillColorRGB(1, 0, 0)
-                    c.circle(self.mm(x), self.mm(y), self.mm(diametro-0.50), fill=1)
-                else:
-                    # Sample well - white with number
-                    if current_sample <= total_samples:
-                        c.setFillColorRGB(1, 1, 1)
-                        c.circle(self.mm(x), self.mm(y), self.mm(diametro-0.50), fill=1)
-                        c.setFillColorRGB(0, 0, 0)
-                        c.setFont("Helvetica", 6)
-                        c.drawCentredString(self.mm(x), self.mm(y-1), str(current_sample))
-                        current_sample += 1
-                    else:
-                        # Empty well - white
-                        c.setFillColorRGB(1, 1, 1)
-                        c.circle(self.mm(x), self.mm(y), self.mm(diametro-0.50), fill=1)
-        
-        return current_sample
-    
-    def draw_plate_info(self, c, coords, plate_data, cod_envio):
-        """Draw plate identification and information."""
-        # Draw plate ID
-        c.setFont("Courier", 20)
-        x = coords['x_start'] + 5
-        y = coords['y_start'] - 15
-        plate_id = f"{plate_data['empresa']}-{plate_data['projeto']}-{plate_data['placa']:03d}"
-        c.drawString(self.mm(x), self.mm(y+5), plate_id)
+        # Draw wells: all sample wells share the white fill, so the fill color
+        # only changes once for the white wells and once for the control wells
+        origin_x, origin_y = self.mm(col_pos_ini), self.mm(lin_pos_ini)
+        radius = self.mm(layout.radius)
+        dx, dy, mask = layout.dx, layout.dy, layout.control_mask
+        
+        c.setFillColorRGB(1, 1, 1)
+        for i in range(layout.well_count):
+            if not mask[i]:
+                c.circle(origin_x + dx[i], origin_y + dy[i], radius, fill=1)
         
-        # Draw labels
+        # Control wells - red
+        c.setFillColorRGB(1, 0, 0)
+        for i in range(layout.well_count):
+            if mask[i]:
+                c.circle(origin_x + dx[i], origin_y + dy[i], radius, fill=1)
+    
+    def draw_plate_labels(self, c, cod_envio):
+        """Draw the fixed labels printed below every plate."""
+        x = 5
+        y = -15
         c.setFont("Courier", 10)
         c.drawString(self.mm(x), self.mm(y), "EMPRESA-PROJETO-PLACA")
         c.setFont("Courier", 7)
@@ -167,40 +148,190 @@ class PlateTemplateGenerator:
         c.setFont("Courier", 5)
         c.drawString(self.mm(x+90), self.mm(y+18), f"COD.TEMPLATE: {cod_envio}")
     
-    def generate_pdf(self, output, project_data, cod_envio):
-        """Generate PDF with plate templates based on project data."""
+    def define_forms(self, c, cod_envio):
+        """
+        Define the static page and plate skeletons once per document as form
+        XObjects; every page and plate then only references them with doForm.
+        """
+        c.beginForm(self.PAGE_FORM)
+        # Draw page border
+        c.rect(self.mm(1), self.mm(1), self.mm(self.page.width - 2), self.mm(self.page.height - 2))
+        # Adicionar o logo ao topo da página
+        self.draw_logo(c)
+        c.endForm()
+        
+        # The plate skeleton is drawn in plate coordinates (lower-left corner
+        # of the outline at the origin) and placed on each slot of the page
+        # The bounding box must include the labels below the outline
+        c.beginForm(self.PLATE_FORM, 0, self.mm(PageLayout.BLOCK_BOTTOM),
+                    self.mm(PageLayout.BLOCK_WIDTH), self.mm(PageLayout.BLOCK_TOP))
+        self.draw_plate_labels(c, cod_envio)
+        self.draw_plate_skeleton(c)
+        c.endForm()
+    
+    def draw_plate_grid(self, c, sample_counter, total_samples):
+        """Draw a single plate grid with wells and numbers, in plate coordinates."""
+        # Static skeleton shared by every plate of the document
+        c.doForm(self.PLATE_FORM)
+        
+        layout = self.layout
+        origin_x = self.mm(layout.a1_x)
+        origin_y = self.mm(layout.a1_y) - self.mm(layout.pitch / 9)
+        dx, dy, sample_wells = layout.dx, layout.dy, layout.sample_wells
+        count = max(0, min(layout.samples_per_plate, total_samples - sample_counter + 1))
+        
+        # Sample numbers - the only part of the grid that changes between plates
+        if self.compact:
+            self.draw_sample_numbers_text(c, origin_x, origin_y, sample_counter, count)
+            return sample_counter + count
+        
+        c.setFillColorRGB(0, 0, 0)
+        c.setFont("Helvetica", self.number_font_size)
+        for k in range(count):
+            i = sample_wells[k]
+            c.drawCentredString(origin_x + dx[i], origin_y + dy[i], str(sample_counter + k))
+        
+        return sample_counter + count
+    
+    def draw_sample_numbers_text(self, c, origin_x, origin_y, first_sample, count):
+        """
+        Draw a plate's sample numbers as one text object.
+        
+        Font and colour are set once and each number is placed with a move
+        relative to the previous one, instead of a BT/Tf/Tm/ET block per well.
+        Positions are rounded to 0.01 pt before taking differences so the
+        relative moves do not accumulate error.
+        """
+        layout = self.layout
+        dx, dy, sample_wells = layout.dx, layout.dy, layout.sample_wells
+        size = self.number_font_size
+        text = c.beginText()
+        text.setFont("Helvetica", size)
+        text.setFillColorRGB(0, 0, 0)
+        last_x = last_y = None
+        for k in range(count):
+            i = sample_wells[k]
+            label = str(first_sample + k)
+            x = round(origin_x + dx[i] - stringWidth(label, "Helvetica", size) / 2, 2)
+            y = round(origin_y + dy[i], 2)
+            if last_x is None:
+                text.setTextOrigin(x, y)
+            else:
+                # moveCursor takes the vertical offset top-down
+                text.moveCursor(round(x - last_x, 2), round(last_y - y, 2))
+            text.textOut(label)
+            last_x, last_y = x, y
+        c.drawText(text)
+    
+    def draw_plate_info(self, c, plate_data):
+        """Draw plate identification."""
+        c.setFont("Courier", 20)
+        plate_id = f"{plate_data['empresa']}-{plate_data['projeto']}-{plate_data['placa']:03d}"
+        c.drawString(self.mm(5), self.mm(-10), plate_id)
+    
+    def draw_page(self, c, page, project_data, cod_envio):
+        """
+        Draw one page (PLATES_PER_PAGE plates).
+        
+        Sample numbering is a pure function of the page index, so any page
+        can be drawn independently of the others.
+        """
         total_samples = project_data['total_amostras']
-        total_plates = self.calculate_plates_needed(total_samples)
-        total_pages = math.ceil(total_plates / 2)
+        first_plate = page * self.PLATES_PER_PAGE
+        current_sample = first_plate * self.SAMPLES_PER_PLATE + 1
+        
+        # Page border and logo
+        c.doForm(self.PAGE_FORM)
         
-        # Verificar se output é um caminho de arquivo ou um objeto file-like
-        if isinstance(output, str):
-            c = canvas.Canvas(output, pagesize=A4)
+        scale = self.page.scale
+        for slot, (x, y) in enumerate(self.page.slots):
+            if current_sample > total_samples:
+                break
+            # Each plate is drawn in its own coordinates and placed on the slot
+            c.saveState()
+            c.translate(self.mm(x), self.mm(y))
+            if scale != 1:
+                c.scale(scale, scale)
+            project_data['placa'] = first_plate + slot + 1
+            self.draw_plate_info(c, project_data)
+            current_sample = self.draw_plate_grid(c, current_sample, total_samples)
+            c.restoreState()
+    
+    def create_canvas(self, output, cod_envio):
+        """Create the canvas with the document-level forms already defined."""
+        # output pode ser um caminho de arquivo ou um objeto file-like.
+        # invariant=1 fixa o ID do documento e as datas, de modo que entradas
+        # iguais produzem exatamente os mesmos bytes
+        if self.compact:
+            # Flate-only streams for this document alone: with page compression
+            # off, pages and forms fall back to the document's default filters
+            # (compressed pages would pick ASCII85 from the process-global
+            # rl_config.useA85 at save time)
+            c = canvas.Canvas(output, pagesize=self.page.pagesize, invariant=1, pageCompression=0)
+            c._doc.defaultStreamFilters = [PDFZCompress]
         else:
-            c = canvas.Canvas(output, pagesize=A4)
-        
-        current_sample = 1
-        for page in range(total_pages):
-            # Draw page border
-            c.rect(self.mm(1), self.mm(1), self.mm(208), self.mm(295))
-            
-            # Adicionar o logo ao topo da página
-            self.draw_logo(c)
-            
-            # First plate on page
-            if current_sample <= total_samples:
-                coords1 = self.get_well_coordinates(1)
-                project_data['placa'] = (page * 2) + 1
-                self.draw_plate_info(c, coords1, project_data, cod_envio)
-                current_sample = self.draw_plate_grid(c, coords1, current_sample, total_samples)
-            
-            # Second plate on page
-            if current_sample <= total_samples:
-                coords2 = self.get_well_coordinates(2)
-                project_data['placa'] = (page * 2) + 2
-                self.draw_plate_info(c, coords2, project_data, cod_envio)
-                current_sample = self.draw_plate_grid(c, coords2, current_sample, total_samples)
-            
+            c = canvas.Canvas(output, pagesize=self.page.pagesize, invariant=1)
+        self.define_forms(c, cod_envio)
+        return c
+    
+    def save(self, c):
+        """Serialize the document (stream filters were chosen in create_canvas)."""
+        c.save()
+    
+    def render_page_streams(self, project_data, cod_envio, first_page, last_page):
+        """
+        Draw pages [first_page, last_page) on a scratch canvas and return the
+        content stream operators of each page.
+        
+        Every canvas defines the same forms in the same order, so fonts and
+        XObjects get the same internal names and the operators can be replayed
+        on the canvas that writes the final document.
+        """
+        c = self.create_canvas(BytesIO(), cod_envio)
+        project_data = dict(project_data)
+        streams = []
+        for page in range(first_page, last_page):
+            self.draw_page(c, page, project_data, cod_envio)
+            streams.append((list(c._code), list(c._formsinuse)))
             c.showPage()
+        return streams
+    
+    def generate_pdf(self, output, project_data, cod_envio, processes=1):
+        """
+        Generate PDF with plate templates based on project data.
+        
+        With processes > 1, large documents have their pages drawn in page
+        ranges across worker processes and assembled in order; the result is
+        byte-identical to the sequential rendering.
+        """
+        total_samples = project_data['total_amostras']
+        total_plates = self.calculate_plates_needed(total_samples)
+        total_pages = self.page.pages_needed(total_plates)
+        
+        c = self.create_canvas(output, cod_envio)
+        
+        # More processes than CPUs only adds start-up and pickling overhead
+        processes = min(processes or 1, os.cpu_count() or 1)
+        if processes > 1 and total_pages >= self.PARALLEL_MIN_PAGES:
+            # Page ranges small enough to balance the load between the workers
+            chunk = max(1, math.ceil(total_pages / (processes * 4)))
+            ranges = [(start, min(start + chunk, total_pages)) for start in range(0, total_pages, chunk)]
+            # fork: the workers inherit the configured Django settings, the loaded
+            # fonts and logo; the copied page operators rely on ReportLab
+            # internals (Canvas._code, _formsinuse), see requirements.txt
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = [
+                    pool.submit(self.render_page_streams, project_data, cod_envio, first, last)
+                    for first, last in ranges
+                ]
+                for future in futures:
+                    for code, forms in future.result():
+                        c._code.extend(code)
+                        c._formsinuse.extend(forms)
+                        c.showPage()
+        else:
+            for page in range(total_pages):
+                self.draw_page(c, page, project_data, cod_envio)
+                c.showPage()
         
-        c.save()
\ No newline at end of file
+        self.save(c)
@@ -0,0 +1,207 @@
+from array import array
+from functools import lru_cache
+import math
+import re
+import string
+
+from reportlab.lib.pagesizes import A3, A4
+
+MM = 1 / 0.352777778  # pontos por milímetro
+
+DEFAULT_CONTROL_WELLS = ('A1', 'B1', 'C1', 'D1', 'E1', 'F1')
+
+# Formatos de placa (contorno SBS de 127,76 x 85,48 mm). a1_x/a1_y: centro do
+# poço A1 em mm a partir do canto inferior esquerdo do contorno
+DEFAULT_PLATE_FORMAT = '96'
+PLATE_FORMATS = {
+    '96': {
+        'label': "96 poços (8 x 12)",
+        'rows': 8, 'columns': 12, 'pitch': 9.0, 'diameter': 8.0, 'a1_x': 14.38, 'a1_y': 73.76,
+    },
+    '384': {
+        'label': "384 poços (16 x 24)",
+        'rows': 16, 'columns': 24, 'pitch': 4.5, 'diameter': 3.6, 'a1_x': 12.13, 'a1_y': 76.49,
+    },
+}
+
+WELL_RE = re.compile(r'^([A-Z])(\d{1,2})$')
+
+
+def parse_control_wells(value):
+    """
+    'A1, B1;c1' -> ('A1', 'B1', 'C1'); vazio -> poços de controle padrão
+
+    Raises:
+        ValueError: se algum item não tiver o formato linha+coluna
+    """
+    if not value:
+        return DEFAULT_CONTROL_WELLS
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = re.split(r'[\s,;]+', value.strip())
+    wells = []
+    for item in items:
+        if not item:
+            continue
+        match = WELL_RE.match(item.strip().upper())
+        if not match:
+            raise ValueError(f"Poço inválido: {item}")
+        well = f"{match.group(1)}{int(match.group(2))}"
+        if well not in wells:
+            wells.append(well)
+    return tuple(wells) or DEFAULT_CONTROL_WELLS
+
+
+def mm(value):
+    """Converte milímetros em pontos"""
+    return value * MM
+
+
+class PlateLayout:
+    """Geometria precomputada de um formato de placa.
+
+    Construída uma única vez por combinação de parâmetros (ver ``get``) e
+    compartilhada pelo renderizador e pelas exportações. Os poços são
+    indexados em ordem de leitura (A1, A2, ..., H12); as coordenadas ficam em
+    arrays de pontos relativos à origem da placa (centro do poço A1) e os
+    poços de controle em uma máscara, evitando testes de pertinência com
+    strings no laço interno.
+    """
+
+    def __init__(self, rows=8, columns=12, control_wells=DEFAULT_CONTROL_WELLS, pitch=9.0, diameter=8.0,
+                 a1_x=14.38, a1_y=73.76):
+        self.rows = rows
+        self.columns = columns
+        self.well_count = rows * columns
+        self.pitch = pitch  # mm entre centros de poços
+        self.radius = diameter / 2  # mm
+        self.a1_x = a1_x  # mm, a partir do canto inferior esquerdo do contorno
+        self.a1_y = a1_y
+        self.row_labels = string.ascii_uppercase[:rows]
+
+        self.well_ids = tuple(
+            f"{self.row_labels[row]}{col + 1}" for row in range(rows) for col in range(columns)
+        )
+        self.index_by_id = {well_id: index for index, well_id in enumerate(self.well_ids)}
+
+        unknown = set(control_wells) - set(self.index_by_id)
+        if unknown:
+            raise ValueError(f"Poços de controle inexistentes na placa: {', '.join(sorted(unknown))}")
+        self.control_wells = tuple(well for well in self.well_ids if well in set(control_wells))
+
+        # Deslocamento de cada poço em relação ao poço A1, em pontos
+        self.dx = array('d', (mm(pitch * (index % columns)) for index in range(self.well_count)))
+        self.dy = array('d', (-mm(pitch * (index // columns)) for index in range(self.well_count)))
+
+        # 1 = poço de controle
+        self.control_mask = bytearray(self.well_count)
+        for well_id in self.control_wells:
+            self.control_mask[self.index_by_id[well_id]] = 1
+
+        # Posição da amostra dentro da placa -> índice do poço, e o inverso (-1 = controle)
+        self.sample_wells = array('H', (i for i in range(self.well_count) if not self.control_mask[i]))
+        self.well_positions = array('h', [-1] * self.well_count)
+        for position, index in enumerate(self.sample_wells):
+            self.well_positions[index] = position
+
+        self.samples_per_plate = len(self.sample_wells)
+        if not self.samples_per_plate:
+            raise ValueError("A placa precisa ter ao menos um poço para amostras")
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get(plate_format=DEFAULT_PLATE_FORMAT, control_wells=DEFAULT_CONTROL_WELLS):
+        """Layout compartilhado para o formato e os poços de controle (construído uma única vez)"""
+        geometry = dict(PLATE_FORMATS[plate_format])
+        del geometry['label']
+        return PlateLayout(control_wells=tuple(control_wells), **geometry)
+
+    @staticmethod
+    def for_project(project_data):
+        """Layout de um projeto a partir de PlateService.get_project_data"""
+        return PlateLayout.get(
+            project_data.get('formato_placa') or DEFAULT_PLATE_FORMAT,
+            parse_control_wells(project_data.get('pocos_controle')),
+        )
+
+    def plates_needed(self, total_samples):
+        return math.ceil(total_samples / self.samples_per_plate)
+
+    def locate(self, sample):
+        """Amostra (a partir de 1) -> (placa a partir de 1, índice do poço)"""
+        plate, position = divmod(sample - 1, self.samples_per_plate)
+        return plate + 1, self.sample_wells[position]
+
+    def sample_at(self, plate, well_index):
+        """(placa a partir de 1, índice do poço) -> número da amostra, ou None para controles"""
+        position = self.well_positions[well_index]
+        if position < 0:
+            return None
+        return (plate - 1) * self.samples_per_plate + position + 1
+
+    def plate_samples(self, plate, total_samples):
+        """Primeira amostra e quantidade de amostras da placa"""
+        first = (plate - 1) * self.samples_per_plate + 1
+        return first, max(0, min(self.samples_per_plate, total_samples - first + 1))
+
+
+class PageLayout:
+    """Disposição das placas nas páginas do PDF.
+
+    Cada posição (``slots``) é o canto inferior esquerdo do contorno de uma
+    placa, em mm, na ordem de leitura da página; ``scale`` reduz placa e
+    rótulos quando várias placas dividem a página. Sem ``slots`` explícitos,
+    as placas são distribuídas em uma grade de ``columns`` x ``rows`` abaixo
+    da faixa do logo.
+    """
+
+    # Bloco de uma placa com seus rótulos, em mm a partir do canto inferior
+    # esquerdo do contorno (os rótulos ficam até 22 mm abaixo da placa)
+    BLOCK_WIDTH = 127.76
+    BLOCK_TOP = 85.48
+    BLOCK_BOTTOM = -22.0
+    PAGE_SIZES = {'A4': A4, 'A3': A3}
+
+    def __init__(self, label, page_size='A4', orientation='portrait', columns=1, rows=2, slots=None,
+                 margin=10.0, header=30.0):
+        self.label = label
+        width, height = (value / MM for value in self.PAGE_SIZES[page_size])
+        if orientation == 'landscape':
+            width, height = max(width, height), min(width, height)
+        self.width, self.height = width, height  # mm
+        self.pagesize = (width * MM, height * MM)  # pontos
+
+        if slots is not None:
+            self.slots = tuple(slots)
+            self.scale = 1.0
+        else:
+            block_height = self.BLOCK_TOP - self.BLOCK_BOTTOM
+            cell_width = (width - 2 * margin) / columns
+            cell_height = (height - header - margin) / rows
+            self.scale = min(1.0, cell_width / self.BLOCK_WIDTH, cell_height / block_height)
+            slots = []
+            for row in range(rows):
+                cell_top = height - header - row * cell_height
+                for column in range(columns):
+                    x = margin + column * cell_width + (cell_width - self.BLOCK_WIDTH * self.scale) / 2
+                    top = cell_top - (cell_height - block_height * self.scale) / 2
+                    slots.append((x, top - self.BLOCK_TOP * self.scale))
+            self.slots = tuple(slots)
+        self.plates_per_page = len(self.slots)
+
+    @staticmethod
+    def get(name=None):
+        return PAGE_LAYOUTS[name or DEFAULT_PAGE_LAYOUT]
+
+    def pages_needed(self, plates):
+        return math.ceil(plates / self.plates_per_page)
+
+
+DEFAULT_PAGE_LAYOUT = 'a4-2'
+PAGE_LAYOUTS = {
+    # Posições originais: duas placas em tamanho real em A4 retrato
+    'a4-2': PageLayout("A4 retrato, 2 placas por página", slots=((20, 192), (20, 50))),
+    'a4-4': PageLayout("A4 paisagem, 4 placas por página (reduzidas)", orientation='landscape', columns=2, rows=2),
+    'a3-6': PageLayout("A3 retrato, 6 placas por página", page_size='A3', columns=2, rows=3),
+}
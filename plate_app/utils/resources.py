@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+
+logger = logging.getLogger(__name__)
+
+# Fontes base-14 usadas pelo gerador (não exigem arquivos externos)
+FONTS = ('Helvetica', 'Helvetica-Bold', 'Courier')
+
+# Maior lado do logo em pixels: ~300 dpi para a caixa de 50x25 mm do cabeçalho
+LOGO_MAX_PX = 600
+
+_UNSET = object()
+_logo = _UNSET
+_lock = threading.Lock()
+
+# Situação do aquecimento neste processo (herdada pelos workers após o fork)
+_warm_up_state = {'ready': False, 'duration_ms': None, 'pid': None, 'error': None}
+_warm_up_thread = None
+
+
+def logo_candidates():
+    """Caminhos onde o logo é procurado, em ordem de preferência"""
+    relative = os.path.join('plate_app', 'images', 'agromarkers_logo.png')
+    candidates = []
+    if getattr(settings, 'PLATE_LOGO_PATH', None):
+        candidates.append(settings.PLATE_LOGO_PATH)
+    candidates += [
+        os.path.join(settings.STATIC_ROOT, relative),
+        os.path.join(settings.BASE_DIR, 'static', relative),
+        '/var/www/plate_generator/static/plate_app/images/agromarkers_logo.png',
+        '/var/www/plate_generator/staticfiles/plate_app/images/agromarkers_logo.png',
+    ]
+    return candidates
+
+
+def _load_logo():
+    for path in logo_candidates():
+        if not os.path.exists(path):
+            continue
+        try:
+            from PIL import Image
+
+            with Image.open(path) as image:
+                image.load()
+                # O original tem resolução muito acima da impressa; reduzir uma
+                # única vez evita recomprimir megabytes de pixels em cada PDF
+                image.thumbnail((LOGO_MAX_PX, LOGO_MAX_PX), Image.LANCZOS)
+                reader = ImageReader(image.copy())
+            # Força a decodificação agora para que todos os documentos reutilizem os pixels
+            reader.getRGBData()
+            logger.info("Logo carregado de %s", path)
+            return reader
+        except Exception as e:
+            logger.warning("Erro ao carregar o logo %s: %s", path, e)
+    logger.warning("Logo não encontrado. Caminhos verificados: %s", ", ".join(logo_candidates()))
+    return None
+
+
+def get_logo():
+    """
+    Retorna o ImageReader do logo, resolvido e decodificado uma única vez por processo
+
+    Returns:
+        ImageReader ou None se nenhum arquivo de logo estiver disponível
+    """
+    global _logo
+    if _logo is _UNSET:
+        with _lock:
+            if _logo is _UNSET:
+                _logo = _load_logo()
+    return _logo
+
+
+def reset():
+    """Descarta os recursos carregados (usado quando o logo é trocado em tempo de execução)"""
+    global _logo
+    with _lock:
+        _logo = _UNSET
+
+
+def warm_up(render=True):
+    """
+    Carrega fontes e logo antecipadamente (ex.: antes do fork dos workers)
+
+    Com ``render``, também monta os layouts de placa e renderiza um PDF
+    descartável de uma placa, de modo que módulos, caches e objetos do
+    ReportLab já estejam prontos na primeira requisição.
+    """
+    start = time.perf_counter()
+    for font in FONTS:
+        pdfmetrics.getFont(font)
+    logo = get_logo()
+    if render:
+        # Importados aqui: o gerador importa este módulo
+        from .generator import PlateTemplateGenerator
+        from .layout import PLATE_FORMATS, PlateLayout
+
+        for plate_format in PLATE_FORMATS:
+            PlateLayout.get(plate_format)
+        generator = PlateTemplateGenerator(compact=getattr(settings, 'PLATE_PDF_COMPACT', False))
+        generator.generate_pdf(BytesIO(), {'empresa': '000', 'projeto': 'WARMUP', 'total_amostras': 1}, '0000000')
+    _warm_up_state.update(
+        ready=True, duration_ms=round((time.perf_counter() - start) * 1000, 1), pid=os.getpid(), error=None
+    )
+    logger.info("Aquecimento concluído em %s ms", _warm_up_state['duration_ms'])
+    return logo
+
+
+def warm_up_in_background():
+    """
+    Inicia o aquecimento em uma thread, se ainda não foi feito
+
+    Para processos que não passaram pelo pré-carregamento do gunicorn
+    (runserver, uvicorn); a verificação de prontidão responde 503 até o fim.
+    """
+    global _warm_up_thread
+    with _lock:
+        if _warm_up_state['ready'] or (_warm_up_thread is not None and _warm_up_thread.is_alive()):
+            return
+
+        def run():
+            try:
+                warm_up()
+            except Exception as e:
+                logger.exception("Erro no aquecimento: %s", e)
+                _warm_up_state['error'] = str(e)
+
+        _warm_up_thread = threading.Thread(target=run, name='plate-warm-up', daemon=True)
+        _warm_up_thread.start()
+
+
+def warm_up_status():
+    """Situação do aquecimento: pronto, duração, processo onde foi feito e erro"""
+    return dict(_warm_up_state)
+
+
+def init_process():
+    """
+    Inicializador de processos de renderização iniciados com 'spawn'
+
+    Fica neste módulo, que não importa modelos, para poder ser carregado
+    antes de django.setup() no processo novo.
+    """
+    import django
+    django.setup()
+    warm_up()
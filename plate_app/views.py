@@ -1,60 +1,136 @@
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.views.generic import FormView
-from django.urls import reverse_lazy
-from django.http import HttpResponseRedirect, FileResponse
-from django.conf import settings
+from django.urls import reverse, reverse_lazy
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from .forms import PlateProjectForm
-from .models import PlateProject
+from .access import api_token_required, has_api_token, metrics_token_required
+from .admission import RenderAdmission, RenderBusy, busy_retry_after
+from .forms import PlateProjectForm, PlateProjectBulkForm
+from .models import PlateProject, PlateJob
+from .jobs import PlateJobQueue
+from .downloads import serve_pdf, streaming_content
+from .bulk import PlateBulkImporter, BulkImportError
+from .manifest import FORMATS as MANIFEST_FORMATS
 from .services import PlateService
+from .utils import resources
+from .utils.layout import PlateLayout
+from . import metrics, preview
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Tarefas criadas pela sessão do navegador, cuja situação ela pode consultar
+SESSION_JOBS_KEY = 'plate_jobs'
+SESSION_JOBS_MAX = 50
+
+def remember_job(session, job):
+    """Libera para a sessão a consulta da situação da tarefa (as SESSION_JOBS_MAX mais recentes)"""
+    jobs = [job_id for job_id in session.get(SESSION_JOBS_KEY, []) if job_id != job.id]
+    session[SESSION_JOBS_KEY] = (jobs + [job.id])[-SESSION_JOBS_MAX:]
+
+def success_data_for(project, job):
+    """Dados exibidos na página de sucesso"""
+    layout = PlateLayout.for_project(PlateService.get_project_data(project))
+    return {
+        'empresa': project.empresa,
+        'projeto': project.projeto,
+        'total_amostras': project.total_amostras,
+        'email': project.email,
+        'cod_envio': project.get_cod_envio(),
+        'job_id': job.id,
+        'total_placas': layout.plates_needed(project.total_amostras),
+    }
+
+def busy_message(error):
+    return (
+        "O servidor está ocupado gerando outros projetos grandes. "
+        f"Tente novamente em {error.retry_after} segundos."
+    )
+
+def busy_response(error):
+    """Resposta imediata de "ocupado" (503 com Retry-After) quando o orçamento de renderização está esgotado"""
+    response = HttpResponse(busy_message(error), status=503, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+def busy_json_response(error):
+    """busy_response com corpo JSON, para as APIs"""
+    response = JsonResponse({'erro': busy_message(error), 'tentar_novamente_em': error.retry_after}, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+def pdf_pending_response(request, job):
+    """
+    202 enquanto a tarefa da fila ainda gera o PDF, com a URL de situação da
+    tarefa (a renderização não é repetida na requisição)
+    """
+    status_url = request.build_absolute_uri(reverse('job_status', args=[job.id]))
+    response = HttpResponse(
+        f"O PDF ainda está sendo gerado. Situação da tarefa: {status_url}\n",
+        status=202, content_type='text/plain; charset=utf-8',
+    )
+    response['Location'] = status_url
+    response['Retry-After'] = str(busy_retry_after())
+    return response
+
+def job_status_data(job):
+    """Situação de uma tarefa (página de sucesso e API); a tarefa deve vir com o projeto"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'finished': job.is_finished,
+        'pdf_ready': job.status == PlateJob.STATUS_DONE,
+        'cod_envio': job.project.get_cod_envio(),
+    }
+
 class PlateFormView(FormView):
     template_name = 'plate_app/form.html'
     form_class = PlateProjectForm
     success_url = reverse_lazy('plate_success')
     
+    def post(self, request, *args, **kwargs):
+        form = self.get_form()
+        with metrics.span('form_validation') as span:
+            valid = form.is_valid()
+            span['valido'] = valid
+        if valid:
+            try:
+                # Projetos grandes com a fila cheia recebem "ocupado" em vez de esperar
+                RenderAdmission.check_queue(form.cleaned_data)
+            except RenderBusy as e:
+                return self.form_busy(form, e)
+            return self.form_valid(form)
+        return self.form_invalid(form)
+    
+    def form_busy(self, form, error):
+        messages.warning(self.request, busy_message(error))
+        response = self.render_to_response(self.get_context_data(form=form), status=503)
+        response['Retry-After'] = str(error.retry_after)
+        return response
+    
     def form_valid(self, form):
-        # Salvar o projeto no banco de dados
-        project = form.save()
+        # Salvar o projeto no banco de dados e registrar a tarefa de geração e
+        # envio; o worker processa fora da requisição
+        with metrics.span('db_save', form.cleaned_data.get('total_amostras')):
+            project = form.save()
+            job = PlateJobQueue.enqueue(project)
         
-        try:
-            # Gerar o PDF para o projeto
-            pdf_path, filename, cod_envio = PlateService.generate_pdf_for_project(project)
-            
-            # Enviar o PDF por email
-            email_sent = PlateService.send_pdf_by_email(project, pdf_path, filename, cod_envio)
-            
-            if email_sent:
-                # Armazenar os dados na sessão para exibir na página de sucesso
-                self.request.session['success_data'] = {
-                    'empresa': project.empresa,
-                    'projeto': project.projeto,
-                    'total_amostras': project.total_amostras,
-                    'email': project.email,
-                    'cod_envio': cod_envio
-                }
-                
-                return super().form_valid(form)
-            else:
-                messages.error(
-                    self.request, 
-                    "O PDF foi gerado, mas houve um problema ao enviar o email. Por favor, tente novamente."
-                )
-                # Excluir o projeto se o email não pôde ser enviado
-                project.delete()
-                return self.form_invalid(form)
-                
-        except Exception as e:
-            # Se houver erro na geração do PDF, exibir mensagem e não salvar o projeto
-            messages.error(
-                self.request, 
-                f"Ocorreu um erro ao gerar o PDF: {str(e)}"
-            )
-            # Excluir o projeto se houve erro na geração do PDF
-            project.delete()
-            return self.form_invalid(form)
+        # Armazenar os dados na sessão para exibir na página de sucesso
+        self.request.session['success_data'] = success_data_for(project, job)
+        remember_job(self.request.session, job)
+        
+        return super().form_valid(form)
     
     def form_invalid(self, form):
         messages.error(
@@ -77,61 +153,224 @@ def success_view(request):
     
     return render(request, 'plate_app/success.html', success_data)
 
+def job_status_view(request, job_id):
+    """
+    Situação de uma tarefa de geração, consultada periodicamente pela página de sucesso
+
+    Os ids são sequenciais: só a sessão que criou a tarefa, a equipe (admin)
+    e clientes com o token da API a consultam; para os demais, a tarefa não
+    existe (404).
+    """
+    allowed = (
+        job_id in request.session.get(SESSION_JOBS_KEY, [])
+        or request.user.is_staff
+        or has_api_token(request)
+    )
+    if not allowed:
+        raise Http404(f"Tarefa não encontrada: {job_id}")
+    job = get_object_or_404(PlateJob.objects.select_related('project'), id=job_id)
+    
+    return JsonResponse(job_status_data(job))
+
+def bulk_upload_view(request):
+    """
+    Página para cadastro de vários projetos a partir de um arquivo CSV
+    
+    Os projetos são cadastrados e as tarefas registradas; os PDFs são gerados
+    e enviados pelo worker da fila.
+    """
+    results = busy = None
+    if request.method == 'POST':
+        form = PlateProjectBulkForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                results = PlateBulkImporter.run(form.cleaned_data['arquivo'].read())
+            except BulkImportError as e:
+                messages.error(request, str(e))
+            except RenderBusy as e:
+                # Projetos grandes com a fila cheia: nenhum projeto do arquivo é cadastrado
+                busy = e
+                messages.warning(request, busy_message(e))
+            except IntegrityError:
+                messages.error(
+                    request, "Conflito com projetos gravados ao mesmo tempo; nenhum projeto foi cadastrado. Envie novamente."
+                )
+            else:
+                created = sum(1 for result in results if result['status'] == 'ok')
+                messages.info(request, f"{created} de {len(results)} projeto(s) cadastrado(s).")
+        else:
+            messages.error(request, "Por favor, selecione um arquivo CSV.")
+    else:
+        form = PlateProjectBulkForm()
+    
+    response = render(request, 'plate_app/bulk.html', {'form': form, 'results': results}, status=503 if busy else 200)
+    if busy:
+        response['Retry-After'] = str(busy.retry_after)
+    return response
+
+@csrf_exempt
+@api_token_required
+@require_POST
+def bulk_upload_api(request):
+    """
+    API para cadastro em lote: recebe o CSV no campo "arquivo" (multipart)
+    ou diretamente no corpo da requisição (text/csv)
+    
+    Responde 202 quando algum projeto foi cadastrado: as tarefas de geração
+    e envio ficam na fila (job_id de cada linha).
+    """
+    upload = request.FILES.get('arquivo')
+    data = upload.read() if upload else request.body
+    try:
+        results = PlateBulkImporter.run(data)
+    except BulkImportError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    except RenderBusy as e:
+        return busy_json_response(e)
+    except IntegrityError:
+        return JsonResponse(
+            {'erro': "Conflito com projetos gravados ao mesmo tempo; nenhum projeto foi criado."}, status=409
+        )
+    
+    created = sum(1 for result in results if result['status'] == 'ok')
+    return JsonResponse({
+        'criados': created,
+        'com_erro': len(results) - created,
+        'resultados': results,
+    }, status=202 if created else 200)
+
 def download_pdf_view(request, cod_envio):
     """
     View para download direto do arquivo PDF gerado
+
+    Enquanto a tarefa do projeto está na fila ou em execução, responde 202
+    com a situação da tarefa; só um PDF removido do cache depois de gerado é
+    renderizado novamente na requisição.
     """
     try:
-        # Buscar todos os projetos (limitado a um número razoável)
-        all_projects = PlateProject.objects.all().order_by('-created_at')[:50]
+        # Busca indexada pelo código de envio
+        project = PlateProject.objects.filter(cod_envio=cod_envio).first()
         
-        # Tentar encontrar o projeto pelo código de envio
-        project = None
-        for p in all_projects:
-            if p.get_cod_envio() == cod_envio:
-                project = p
-                break
-                
-        # Se não encontrou, tenta extrair o ID do projeto a partir do código
-        if not project and len(cod_envio) >= 2:
-            try:
-                # Tente usar os últimos dígitos como ID do projeto
-                project_id = int(cod_envio[-2:])
-                project = PlateProject.objects.filter(id=project_id).first()
-            except (ValueError, IndexError):
-                pass
-        
-        # Se ainda não encontrou, tente outras abordagens
         if not project:
-            # Logging para diagnóstico
-            print(f"Não foi possível encontrar o projeto com código: {cod_envio}")
-            print(f"Projetos disponíveis: {[p.id for p in all_projects]}")
-            
             messages.error(request, f"Não foi possível encontrar o projeto com código: {cod_envio}")
             return redirect('plate_form')
         
-        # Se encontrou o projeto, verifica se o PDF existe
-        if not project.pdf_file:
-            messages.error(request, "Arquivo PDF não encontrado para este projeto.")
-            return redirect('plate_form')
-        
-        # Verifica se o arquivo físico existe
-        if not os.path.exists(project.pdf_file.path):
-            messages.error(request, "O arquivo PDF não foi encontrado no servidor.")
-            return redirect('plate_form')
+        if not project.pdf_file or not os.path.exists(project.pdf_file.path):
+            # PDF ainda não gerado: a tarefa da fila vai gerá-lo
+            job = PlateJobQueue.active_job(project)
+            if job is not None:
+                return pdf_pending_response(request, job)
+            # Removido do cache (PLATE_PDF_CACHE_MAX_BYTES): o projeto guarda todos
+            # os parâmetros, então ele é renderizado novamente
+            PlateService.generate_pdf_for_project(project)
         
-        # Retorna o arquivo para download
-        response = FileResponse(open(project.pdf_file.path, 'rb'))
-        response['Content-Disposition'] = f'attachment; filename="{project.empresa}-{project.projeto}-{cod_envio}.pdf"'
+        # Retorna o arquivo para download (com suporte a GET condicional e Range)
+        with metrics.span('download', project.total_amostras, cod_envio=cod_envio) as span:
+            response = serve_pdf(request, project, f"{project.empresa}-{project.projeto}-{cod_envio}.pdf")
+            span['http_status'] = response.status_code
         return response
         
+    except RenderBusy as e:
+        return busy_response(e)
     except Exception as e:
-        import traceback
-        print(f"Erro ao fazer download do PDF: {e}")
-        print(traceback.format_exc())
+        logger.exception("Erro ao fazer download do PDF %s: %s", cod_envio, e)
         
         messages.error(request, f"Ocorreu um erro ao fazer o download do PDF: {str(e)}")
         return redirect('plate_form')
 
+def manifest_view(request, cod_envio):
+    """
+    Download do mapa amostra -> placa/poço (CSV ou JSON) para importação no LIMS
+    
+    O conteúdo é gerado linha a linha, com memória constante para qualquer
+    tamanho de projeto.
+    """
+    project = PlateProject.objects.filter(cod_envio=cod_envio).first()
+    if not project:
+        raise Http404(f"Não foi possível encontrar o projeto com código: {cod_envio}")
+    
+    formato = request.GET.get('formato', 'csv')
+    if formato not in MANIFEST_FORMATS:
+        return JsonResponse({'erro': f"Formato inválido: {formato}"}, status=400)
+    
+    return manifest_response(project, formato)
 
+def manifest_response(project, formato):
+    """Resposta em streaming com o manifesto do projeto no formato informado (ver manifest.FORMATS)"""
+    iter_rows, content_type = MANIFEST_FORMATS[formato]
+    response = StreamingHttpResponse(
+        streaming_content(iter_rows(PlateService.get_project_data(project))), content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{project.empresa}-{project.projeto}-{project.get_cod_envio()}-manifesto.{formato}"'
+    )
+    return response
 
+def plate_preview_view(request, cod_envio, placa):
+    """
+    Prévia em SVG de uma placa do projeto
+    
+    Gerada da geometria da placa, sem depender do PDF (disponível assim que o
+    projeto é criado), guardada em cache por (projeto, placa) e servida com
+    ETag e Cache-Control para que o navegador não precise pedi-la de novo.
+    """
+    project = PlateProject.objects.filter(cod_envio=cod_envio).first()
+    if not project:
+        raise Http404(f"Não foi possível encontrar o projeto com código: {cod_envio}")
+    
+    project_data = PlateService.get_project_data(project)
+    if not 1 <= placa <= PlateLayout.for_project(project_data).plates_needed(project.total_amostras):
+        raise Http404(f"O projeto não tem a placa {placa}")
+    
+    etag = preview.preview_etag(project_data, cod_envio, placa)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        with metrics.span('preview', project.total_amostras, cod_envio=cod_envio, placa=placa):
+            svg = preview.get_plate_svg(project_data, cod_envio, placa, etag)
+        response = HttpResponse(svg, content_type='image/svg+xml; charset=utf-8')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'PLATE_PREVIEW_MAX_AGE', 24 * 3600))
+    return response
+
+@metrics_token_required
+def metrics_view(request):
+    """
+    Métricas no formato do Prometheus, somadas entre todos os processos
+    que gravam em PLATE_METRICS_DIR
+    
+    Exige um token de PLATE_METRICS_TOKENS; o nginx não repassa /metrics,
+    que é consultado direto no gunicorn.
+    """
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def ready_view(request):
+    """
+    Verificação de prontidão do worker (balanceador, systemd, deploy)
+    
+    Responde 200 quando a pilha de renderização já foi aquecida neste
+    processo (ver gunicorn_config.py) e o banco responde; caso contrário 503.
+    Em processos sem pré-carregamento, a primeira consulta inicia o aquecimento.
+    """
+    resources.warm_up_in_background()
+    status = resources.warm_up_status()
+    
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        database = True
+    except DatabaseError as e:
+        logger.warning("Banco indisponível na verificação de prontidão: %s", e)
+        database = False
+    
+    ready = status['ready'] and database
+    response = JsonResponse({
+        'pronto': ready,
+        'aquecimento': status['ready'],
+        'aquecimento_ms': status['duration_ms'],
+        'aquecido_no_pid': status['pid'],
+        'pid': os.getpid(),
+        'banco': database,
+        'erro': status['error'],
+    }, status=200 if ready else 503)
+    response['Cache-Control'] = 'no-store'
+    return response
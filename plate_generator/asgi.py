@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'plate_generator.settings')
 
+# Ativa as views assíncronas (PLATE_ASYNC_VIEWS) antes de carregar as configurações
+os.environ.setdefault('PLATE_ASGI', '1')
+
 application = get_asgi_application()
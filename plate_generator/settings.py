@@ -23,6 +23,9 @@ CSRF_TRUSTED_ORIGINS = [
 
 # Security settings for HTTPS
 SECURE_SSL_REDIRECT = True  # Redirect HTTP to HTTPS
+# Verificações internas feitas direto no gunicorn, sem passar pelo nginx
+# (/metrics exige PLATE_METRICS_TOKENS e não é repassado pelo nginx)
+SECURE_REDIRECT_EXEMPT = [r'^ready$', r'^metrics$']
 SESSION_COOKIE_SECURE = True  # Only send cookies over HTTPS
 CSRF_COOKIE_SECURE = True  # Only send CSRF cookie over HTTPS
 SECURE_HSTS_SECONDS = 31536000  # 1 year
@@ -57,6 +60,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Servidor ASGI (plate_generator.asgi define PLATE_ASGI=1): formulário, sucesso e
+# download usam as views assíncronas de plate_app.async_views. O WhiteNoise é
+# síncrono e obrigaria o Django a usar uma thread por requisição; nesse modo os
+# arquivos estáticos são servidos pelo nginx (location /static/ em deploy.sh).
+PLATE_ASYNC_VIEWS = os.environ.get('PLATE_ASGI') == '1'
+PLATE_ASYNC_RENDER_WORKERS = 2  # Processos que renderizam PDFs para as views assíncronas
+
+if PLATE_ASYNC_VIEWS:
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'plate_generator.urls'
 
 TEMPLATES = [
@@ -83,9 +96,24 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Conexões reaproveitadas entre requisições pelo mesmo worker (segundos)
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Segundos aguardando o lock de escrita (mesmo valor do busy_timeout)
+            'timeout': 5,
+        },
     }
 }
 
+# PRAGMAs aplicados a cada conexão SQLite nova (ver plate_app/db.py):
+# WAL, synchronous=NORMAL e busy_timeout para vários workers no mesmo arquivo
+PLATE_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -117,6 +145,23 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Prefixo "internal" do nginx que aponta para MEDIA_ROOT (ver deploy.sh).
+# Quando definido, os downloads de PDF são enviados pelo nginx via X-Accel-Redirect
+# em vez de passarem pelo worker do gunicorn. Ex.: '/protected-media/'
+PLATE_PDF_X_ACCEL_REDIRECT = None
+
+# Limite de espaço dos PDFs em MEDIA_ROOT/renders (None = manter todos).
+# Acima do limite os PDFs usados há mais tempo são removidos e renderizados de
+# novo quando pedidos; ver também "python manage.py pdf_cache".
+PLATE_PDF_CACHE_MAX_BYTES = None
+PLATE_PDF_CACHE_MIN_AGE = 300  # Segundos em que um PDF recém-usado não é removido
+
+# Prévias em SVG das placas (página de sucesso): alias em CACHES usado para
+# guardá-las, por quanto tempo, e o max-age enviado ao navegador
+PLATE_PREVIEW_CACHE = 'default'
+PLATE_PREVIEW_CACHE_TIMEOUT = 24 * 3600
+PLATE_PREVIEW_MAX_AGE = 24 * 3600
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -135,7 +180,78 @@ SERVER_EMAIL = 'noreply@jsoj.site'
 
 DEFAULT_FROM_EMAIL = 'Agromarkers Template <noreply@jsoj.site>'
 
+# Envio dos PDFs (plate_app.mail): conexões SMTP reaproveitadas e envio em lotes
+PLATE_EMAIL_CONNECTIONS = 1  # Conexões (threads de envio) por processo
+PLATE_EMAIL_BATCH_SIZE = 20  # Mensagens enviadas em sequência pela mesma conexão
+PLATE_EMAIL_MAX_ATTEMPTS = 3  # Tentativas por mensagem em falhas temporárias (4xx, rede)
+PLATE_EMAIL_RETRY_DELAY = 1.0  # Segundos até a primeira nova tentativa (dobra a cada falha)
+PLATE_EMAIL_MAX_IDLE = 30.0  # Segundos sem uso até a conexão ser fechada
+
 # Configurações específicas para segurança
 SECURE_CONTENT_TYPE_NOSNIFF = True
 SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
+
+# Fila de geração de PDFs (processada por "python manage.py run_plate_worker")
+PLATE_WORKER_CONCURRENCY = 2  # Threads por processo de worker (deploy.sh inicia um processo por núcleo)
+PLATE_JOB_MAX_ATTEMPTS = 3  # Tentativas antes de marcar a tarefa como falha
+PLATE_JOB_RETRY_DELAY = 30  # Segundos até a primeira nova tentativa (dobra a cada falha)
+PLATE_JOB_STALE_TIMEOUT = 600  # Tarefas 'running' há mais tempo que isso voltam para a fila
+
+# Envio em lote (CSV)
+PLATE_BULK_MAX_ROWS = 500  # Máximo de projetos por arquivo (e por lote na API JSON)
+
+# Tokens aceitos pelas APIs (api/bulk/, api/projetos/, api/tarefas/) no cabeçalho
+# "Authorization: Token <token>", separados por vírgula na variável de ambiente
+# PLATE_API_TOKENS (sem tokens, as APIs recusam tudo)
+PLATE_API_TOKENS = [token.strip() for token in os.environ.get('PLATE_API_TOKENS', '').split(',') if token.strip()]
+
+# Processos que desenham faixas de páginas de um mesmo PDF grande (1 = sequencial)
+PLATE_PAGE_RENDER_PROCESSES = 1
+
+# API JSON (plate_app/api.py): tamanho das páginas da listagem de projetos
+PLATE_API_PAGE_SIZE = 20
+PLATE_API_MAX_PAGE_SIZE = 100
+
+# Controle de admissão: orçamento de placas renderizadas ao mesmo tempo por todos
+# os processos da máquina (None desativa). Quem não cabe recebe "ocupado" (503 com
+# Retry-After) na hora; tarefas da fila voltam para a fila sem contar tentativa.
+PLATE_RENDER_BUDGET = 1000
+PLATE_RENDER_SMALL_PLATES = 12  # Projetos com até tantas placas são pequenos (~1000 amostras)
+PLATE_RENDER_SMALL_RESERVE = 50  # Placas do orçamento reservadas aos projetos pequenos
+PLATE_QUEUE_BUDGET = 5000  # Placas na fila acima das quais envios grandes são recusados
+PLATE_BUSY_RETRY_AFTER = 15  # Segundos informados no Retry-After
+PLATE_RENDER_ADMISSION_FILE = os.path.join(BASE_DIR, 'render_admission.json')
+
+# Progresso padrão do "manage.py generate_plates" (--checkpoint); fora do
+# MEDIA_ROOT, que o nginx serve publicamente
+PLATE_GENERATE_CHECKPOINT = os.path.join(BASE_DIR, 'generate_plates.checkpoint.json')
+
+# PDF compacto: fluxos binários só com Flate (sem ASCII85), logo vetorial com
+# fontes base-14 em vez da imagem e números das amostras em um único objeto de
+# texto por placa. Cerca de metade do tamanho para projetos grandes.
+PLATE_PDF_COMPACT = False
+
+# Métricas (endpoint /metrics no formato do Prometheus)
+# Cada processo grava suas métricas neste diretório; o endpoint soma todos os arquivos
+# (os de processos encerrados são somados em totals.json e removidos)
+PLATE_METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+PLATE_METRICS_FLUSH_INTERVAL = 1.0  # Segundos entre gravações de cada processo
+# Tokens aceitos por /metrics no cabeçalho "Authorization: Bearer <token>", separados
+# por vírgula na variável de ambiente PLATE_METRICS_TOKENS (sem tokens, /metrics recusa tudo)
+PLATE_METRICS_TOKENS = [token.strip() for token in os.environ.get('PLATE_METRICS_TOKENS', '').split(',') if token.strip()]
+
+# Logs: spans de tempo em JSON (logger plate_app.metrics) e avisos do plate_app
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'plate_app': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}